@@ -0,0 +1,121 @@
+import pickle
+from math import erfc, sqrt
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+# the columns saved in a baseline. Timing columns are only present with --bench-timing
+BASELINE_COLUMNS = ('dataset', 'challenger', 'env_id', 'cvrmse', 'duration_ms',
+                    'fit_median_ms', 'fit_samples_ms', 'predict_median_ms', 'predict_samples_ms')
+
+
+def save_baseline(results_df, name, baseline_dir):
+    """ Saves the results table `results_df` (indexed by test id) as the baseline named `name` """
+    baseline_dir = Path(baseline_dir)
+    baseline_dir.mkdir(parents=True, exist_ok=True)
+    baseline_df = results_df[[c for c in BASELINE_COLUMNS if c in results_df.columns]]
+    with (baseline_dir / ('%s.pkl' % name)).open('wb') as f:
+        pickle.dump(baseline_df, f)
+
+
+def load_baseline(name, baseline_dir):
+    """ Loads the baseline named `name`. Raises a ValueError if it does not exist """
+    baseline_file = Path(baseline_dir) / ('%s.pkl' % name)
+    if not baseline_file.exists():
+        raise ValueError("Baseline '%s' does not exist in %s" % (name, baseline_dir))
+    with baseline_file.open('rb') as f:
+        return pickle.load(f)
+
+
+def compare_to_baseline(results_df, baseline_df, max_slowdown=1.2, max_cvrmse_increase=0.01, alpha=0.01,
+                        min_rounds=10):
+    """
+    Compares the results table `results_df` to `baseline_df`, pair by pair (pairs are matched by test id).
+    Returns a report table with one row per pair and metric:
+
+     - 'cvrmse': the accuracy regresses if its absolute value (the cv-rmse is negative when the mean of the target is)
+       increases by more than `max_cvrmse_increase` (relative), or if it is missing (e.g. the pair failed, or exceeded
+       its budget) while the baseline has one.
+     - 'missing': a pair of the baseline that is not in `results_df` is a regression.
+     - 'fit' and 'predict' latencies (only if both runs used --bench-timing): a phase regresses if its median duration
+       is more than `max_slowdown` times the baseline one, and if the timing samples of the new run are significantly
+       larger than the baseline ones (one-sided Mann-Whitney U test at level `alpha`). The test is only applied when
+       both runs have at least `min_rounds` samples: otherwise the phase regresses as soon as its median duration is
+       more than `max_slowdown` times the baseline one, and the `note` says that the samples were insufficient. Note
+       that the samples are the rounds of a single run: they do not capture the variations between runs (e.g. of the
+       cpu frequency), so the p-values are optimistic.
+    """
+    rows = []
+    for test_id in baseline_df.index.difference(results_df.index):
+        old = baseline_df.loc[test_id]
+        rows.append(dict(test_id=test_id, dataset=old['dataset'], challenger=old['challenger'], metric='missing',
+                         baseline=_to_float(old['cvrmse']), new=np.nan, ratio=np.nan, p_value=np.nan, regression=True,
+                         note=''))
+
+    for test_id in results_df.index.intersection(baseline_df.index):
+        new, old = results_df.loc[test_id], baseline_df.loc[test_id]
+        pair = dict(test_id=test_id, dataset=new['dataset'], challenger=new['challenger'])
+
+        # (missing values are NA in the nullable columns of the results table)
+        new_cvrmse, old_cvrmse = _to_float(new['cvrmse']), _to_float(old['cvrmse'])
+        threshold = abs(old_cvrmse) * (1 + max_cvrmse_increase) + np.finfo(float).eps
+        failed = np.isnan(new_cvrmse) and not np.isnan(old_cvrmse)
+        rows.append(dict(pair, metric='cvrmse', baseline=old_cvrmse, new=new_cvrmse,
+                         ratio=abs(new_cvrmse / old_cvrmse) if old_cvrmse else np.nan, p_value=np.nan,
+                         regression=bool(failed or abs(new_cvrmse) > threshold), note=''))
+
+        for phase in ('fit', 'predict'):
+            samples_col = '%s_samples_ms' % phase
+            if samples_col not in new or samples_col not in old \
+                    or not isinstance(new[samples_col], list) or not isinstance(old[samples_col], list):
+                continue
+            median_col = '%s_median_ms' % phase
+            new_median, old_median = _to_float(new[median_col]), _to_float(old[median_col])
+            ratio = new_median / old_median
+            n_rounds = min(len(new[samples_col]), len(old[samples_col]))
+            if n_rounds < min_rounds:
+                # too few rounds for the test: a slowdown can not be dismissed as noise
+                p_value, regression = np.nan, ratio > max_slowdown
+                note = "insufficient samples (%i rounds < %i)" % (n_rounds, min_rounds)
+            else:
+                p_value = mann_whitney_greater_p(new[samples_col], old[samples_col])
+                regression, note = ratio > max_slowdown and p_value < alpha, ''
+            rows.append(dict(pair, metric='%s_ms' % phase, baseline=old_median, new=new_median,
+                             ratio=ratio, p_value=p_value, regression=bool(regression), note=note))
+
+    return pd.DataFrame(rows, columns=['test_id', 'dataset', 'challenger', 'metric', 'baseline', 'new', 'ratio',
+                                       'p_value', 'regression', 'note'])
+
+
+def _to_float(value):
+    """ Converts a value of the results table to a float, NaN if it is missing """
+    return np.nan if pd.isna(value) else float(value)
+
+
+def mann_whitney_greater_p(a, b):
+    """
+    One-sided p-value of the Mann-Whitney U test, for the alternative "values in `a` tend to be greater than values
+    in `b`". Uses the normal approximation (with ties handled by average ranks), fine for the sample sizes of the
+    timing harness.
+    """
+    a, b = np.asarray(a, dtype=float), np.asarray(b, dtype=float)
+    n1, n2 = len(a), len(b)
+    ranks = average_ranks(np.concatenate([a, b]))
+
+    u = ranks[:n1].sum() - n1 * (n1 + 1) / 2.
+    sigma = sqrt(n1 * n2 * (n1 + n2 + 1) / 12.)
+    if sigma == 0:
+        return 1.
+    z = (u - n1 * n2 / 2.) / sigma
+    return 0.5 * erfc(z / sqrt(2))
+
+
+def average_ranks(values):
+    """ The ranks (from 1) of `values`, ties getting their average rank """
+    values = np.asarray(values, dtype=float)
+    ranks = np.empty(len(values))
+    ranks[np.argsort(values, kind='mergesort')] = np.arange(1, len(values) + 1)
+    _, inverse, counts = np.unique(values, return_inverse=True, return_counts=True)
+    return (np.bincount(inverse, weights=ranks) / counts)[inverse]
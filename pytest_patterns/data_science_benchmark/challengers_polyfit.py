@@ -1,7 +1,19 @@
+import os
+import warnings
+from collections import OrderedDict
+from copy import copy
+
 import numpy as np
 
+try:
+    from numpy.exceptions import RankWarning
+except ImportError:  # numpy < 1.25
+    RankWarning = np.RankWarning
+
 from pytest_cases import parametrize
 
+from .cross_validation import fold_ids
+
 
 class BenchmarkChallenger(object):
     """ Represents the API that a challenger should implement to enter the benchmark """
@@ -14,26 +26,415 @@ class BenchmarkChallenger(object):
         """ Implementors should return a numpy array of predictions. """
         raise NotImplementedError()
 
+    def partial_fit(self, x, y):
+        """
+        Implementors supporting streaming datasets should update the model with the chunk (x, y). A new challenger is
+        trained incrementally by successive calls to `partial_fit`, one per chunk, and should then be able to `predict`.
+        """
+        raise NotImplementedError("%s does not support streaming datasets" % self)
+
+    def fit_folds(self, x, y, test_indices):
+        """
+        Trains one model per cross-validation fold: the model of fold k is trained on all points of (x, y) except the
+        ones in `test_indices[k]`. Returns the list of fitted challengers. Implementors may override this to share
+        computations between the folds. The default implementation fits one copy of this challenger per fold.
+        """
+        models = []
+        for test in test_indices:
+            train = np.ones(len(x), dtype=bool)
+            train[test] = False
+            model = copy(self)
+            model.fit(x[train], y[train])
+            models.append(model)
+        return models
+
+    def fit_batch(self, xs, ys):
+        """
+        Trains one model per dataset (xs[i], ys[i]). Implementors may override this to train them all at once.
+        The default implementation fits one copy of this challenger per dataset.
+        """
+        self.batch = []
+        for x, y in zip(xs, ys):
+            model = copy(self)
+            model.fit(x, y)
+            self.batch.append(model)
+
+    def predict_batch(self, xs):
+        """ Returns a list of predictions, one per dataset, using the models trained in `fit_batch` """
+        return [model.predict(x) for model, x in zip(self.batch, xs)]
+
+    def batch_models(self):
+        """ Returns the list of models trained in `fit_batch`, as fitted challengers """
+        return self.batch
+
+    def get_fitted_state(self):
+        """
+        Implementors supporting the fitted models cache (see `model_cache.FittedModelCache`) should return the compact
+        state of the fitted model: a dict of numpy arrays and scalars, with only what is needed to predict. The default
+        implementation returns None: the fitted models of this challenger are not cached.
+        """
+        return None
+
+    def set_fitted_state(self, state):
+        """ Implementors should restore the fitted model from a `state` returned by `get_fitted_state` """
+        raise NotImplementedError()
+
+    def uncached(self):
+        """
+        Returns a fitted challenger making the same predictions as this one, but without reusing anything across
+        `predict` calls (e.g. cached features of x). It is the one timed by the evaluation protocol, so that the timed
+        rounds, repeated on the same x, measure complete predictions. The default implementation returns this
+        challenger.
+        """
+        return self
+
 
 class PolyFitChallenger(BenchmarkChallenger):
-    """ A benchmark challenger implementation relying on np.polyfit """
-    def __init__(self, degree):
+    """ A benchmark challenger implementation relying on np.polyfit.
+
+    `fit` solves the least-squares problem with the `solver` backend (see `SOLVERS`), `np.polyfit` by default. The
+    backend actually used, after a possible fallback on a more stable one, is stored in `solver_used`. The batch and
+    cross-validation APIs do not depend on the solver.
+
+    `coefs` are the coefficients (decreasing powers) of the polynomial in t = (x - shift) / scale. If `y` has several
+    columns (a multi-output dataset), `coefs` has one column per target, all solved at once. Except with
+    `np.polyfit` (when it does not fall back) and the batch API, x is standardized this way before fitting, so that
+    large-magnitude x (e.g. timestamps) do not lead to ill-conditioned problems and predictions.
+
+    Predictions are computed with the Horner scheme, unless a `PowerBasisCache` is provided: in that case the powers of
+    `x` are computed once and reused across calls (and across challengers sharing the same cache). Timed predictions do
+    not use the cache (see `uncached`).
+    """
+    def __init__(self, degree, power_cache=None, solver='polyfit'):
+        if solver not in SOLVERS:
+            raise ValueError("Unknown solver %r, available solvers are %s" % (solver, list(SOLVERS)))
         self.coefs = None
+        self.shift = 0.
+        self.scale = 1.
         self.degree = degree
+        self.power_cache = power_cache
+        self.solver = solver
+        self.solver_used = None
+        self._normal_equations = None
 
     def __str__(self):
-        return "NumpyPolyfit(degree=%i)" % self.degree
+        if self.solver == 'polyfit':
+            return "NumpyPolyfit(degree=%i)" % self.degree
+        return "PolyFit(degree=%i, solver=%s)" % (self.degree, self.solver)
 
     def fit(self, x, y):
-        self.coefs = np.polyfit(x, y, deg=self.degree)
+        self.coefs, self.shift, self.scale, self.solver_used = SOLVERS[self.solver](x, y, self.degree)
+        self._normal_equations = None
 
-    def predict(self, x):
-        all_x_powers = np.c_[[x ** d for d in range(self.degree, -1, -1)]]
-        predictions = self.coefs.dot(all_x_powers)
-        return predictions
+    def get_fitted_state(self):
+        return dict(coefs=self.coefs, shift=self.shift, scale=self.scale, solver_used=self.solver_used)
+
+    def set_fitted_state(self, state):
+        self.coefs = state['coefs']
+        self.shift, self.scale = state['shift'], state['scale']
+        self.solver_used = state.get('solver_used')
+        self._normal_equations = None
+
+    def partial_fit(self, x, y):
+        """
+        Accumulates the normal equations (Gram matrix and moments) of the chunk and solves them. In order to keep them
+        well conditioned, they are expressed in the powers of t = (x - shift) / scale, where shift and scale are the
+        mean and standard deviation of the first chunk.
+        """
+        if self._normal_equations is None:
+            self._normal_equations = (x.mean(), x.std() or 1., np.zeros((self.degree + 1, self.degree + 1)),
+                                      np.zeros(self.degree + 1))
+        shift, scale, gram, moments = self._normal_equations
+
+        vander = np.vander((x - shift) / scale, self.degree + 1)
+        gram += vander.T.dot(vander)
+        moments += vander.T.dot(y)
+
+        self.coefs = np.linalg.lstsq(gram, moments, rcond=None)[0]
+        self.shift, self.scale = shift, scale
+
+    def fit_folds(self, x, y, test_indices):
+        """
+        Solves the normal equations of all folds with a single pass on the data. The power sums of each fold (sums of
+        t**p and of t**p * y, with t = (x - mean) / std) are computed once; the Gram matrix and moments of the training
+        set of fold k are then the totals minus the sums of fold k (downdating), so K folds cost close to one fit.
+        Multi-output `y` fall back to one fit per fold.
+        """
+        if y.ndim > 1:
+            return super(PolyFitChallenger, self).fit_folds(x, y, test_indices)
+        n_folds = len(test_indices)
+        ids = fold_ids(test_indices, len(x))
+        t, shift, scale = standardize(x)
+
+        # sums[k, p] is the sum of t**p on fold k for p in 0..2*degree, moments[k, p] the sum of t**p * y
+        sums = np.empty((n_folds, 2 * self.degree + 1))
+        moments = np.empty((n_folds, self.degree + 1))
+        t_pow = np.ones(len(x))
+        for p in range(2 * self.degree + 1):
+            sums[:, p] = np.bincount(ids, weights=t_pow, minlength=n_folds)
+            if p <= self.degree:
+                moments[:, p] = np.bincount(ids, weights=t_pow * y, minlength=n_folds)
+            t_pow *= t
+
+        # downdate the totals, and build the (Hankel) Gram matrices in decreasing powers order as np.vander
+        train_sums = sums.sum(axis=0) - sums
+        train_moments = moments.sum(axis=0) - moments
+        powers = np.arange(self.degree, -1, -1)
+        grams = train_sums[:, powers[:, np.newaxis] + powers[np.newaxis, :]]
+
+        models = []
+        for gram, moments_k in zip(grams, train_moments[:, powers]):
+            # the test sets are temporary arrays: caching their powers would be useless
+            model = PolyFitChallenger(degree=self.degree)
+            model.coefs = np.linalg.lstsq(gram, moments_k, rcond=None)[0]
+            model.shift, model.scale = shift, scale
+            models.append(model)
+        return models
+
+    def predict(self, x, out=None):
+        """ Returns the predictions for `x`, optionally writing them in the provided `out` array """
+        if out is None:
+            out = np.empty((len(x),) + self.coefs.shape[1:])
+        if self.shift != 0. or self.scale != 1. or self.coefs.ndim > 1:
+            # the cached powers are the ones of x, not of the standardized x, and are only used for a single target
+            return polyval_horner(self.coefs, x, out=out, shift=self.shift, scale=self.scale)
+        powers = self.power_cache.powers(x, self.degree) if self.power_cache is not None else None
+        if powers is not None:
+            # coefs are in decreasing powers order, powers are in increasing order
+            return np.dot(self.coefs[::-1], powers, out=out)
+        return polyval_horner(self.coefs, x, out=out)
+
+    def uncached(self):
+        if self.power_cache is None:
+            return self
+        model = copy(self)
+        model.power_cache = None
+        return model
+
+    def fit_batch(self, xs, ys):
+        """
+        Solves all least-squares problems at once with a QR decomposition of the stack of Vandermonde matrices.
+        Datasets with different lengths are padded with zero rows, that do not change the solutions.
+        Rank-deficient problems are solved again with the SVD of their (scaled) Vandermonde matrix.
+        """
+        x, y, mask = stack_padded(xs), stack_padded(ys), stack_padded([np.ones(len(x)) for x in xs])
+
+        # (B, n, degree+1) stack of Vandermonde matrices, with zero rows in the padding.
+        # Columns are scaled as in polyfit
+        vander = x[:, :, np.newaxis] ** np.arange(self.degree, -1, -1) * mask[:, :, np.newaxis]
+        scale = np.sqrt((vander * vander).sum(axis=1))
+        scale[scale == 0] = 1
+        vander /= scale[:, np.newaxis, :]
+
+        q, r = np.linalg.qr(vander)
+        r_diag = np.abs(np.diagonal(r, axis1=1, axis2=2))
+        full_rank = r_diag.min(axis=1) > r_diag.max(axis=1) * x.shape[1] * np.finfo(float).eps
+        coefs = np.zeros((len(xs), self.degree + 1))
+        if full_rank.any():
+            qty = np.matmul(q[full_rank].transpose(0, 2, 1), y[full_rank][:, :, np.newaxis])
+            coefs[full_rank] = np.linalg.solve(r[full_rank], qty)[:, :, 0] / scale[full_rank]
+        for i in np.flatnonzero(~full_rank):
+            coefs[i] = np.linalg.lstsq(vander[i], y[i], rcond=x.shape[1] * np.finfo(float).eps)[0] / scale[i]
+        self.batch_coefs = coefs
+
+    def predict_batch(self, xs):
+        # Horner scheme on the padded stack
+        x = stack_padded(xs)
+        predictions = np.repeat(self.batch_coefs[:, :1], x.shape[1], axis=1)
+        for k in range(1, self.degree + 1):
+            predictions *= x
+            predictions += self.batch_coefs[:, k:k + 1]
+        return [p[:len(x_i)] for p, x_i in zip(predictions, xs)]
+
+    def batch_models(self):
+        models = []
+        for coefs in self.batch_coefs:
+            model = PolyFitChallenger(degree=self.degree, power_cache=self.power_cache, solver=self.solver)
+            model.coefs = coefs
+            models.append(model)
+        return models
+
+
+def fit_polyfit(x, y, degree):
+    """ Least-squares fit with `np.polyfit` (SVD of the Vandermonde matrix of x, with scaled columns). Falls back to
+    `fit_qr` on the standardized x when `np.polyfit` warns that the problem is poorly conditioned (`RankWarning`) """
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', RankWarning)
+        try:
+            return np.polyfit(x, y, deg=degree), 0., 1., 'polyfit'
+        except RankWarning:
+            pass
+    return fit_qr(x, y, degree)
+
+
+def fit_svd(x, y, degree):
+    """ Least-squares fit with the SVD of the Vandermonde matrix of the standardized x. Supports rank deficiency """
+    t, shift, scale = standardize(x)
+    t_coefs = np.linalg.lstsq(np.vander(t, degree + 1), y, rcond=len(x) * np.finfo(float).eps)[0]
+    return t_coefs, shift, scale, 'svd'
+
+
+def fit_qr(x, y, degree):
+    """ Least-squares fit with the QR decomposition of the Vandermonde matrix of the standardized x. Falls back to
+    `fit_svd` when the matrix is rank deficient """
+    t, shift, scale = standardize(x)
+    q, r = np.linalg.qr(np.vander(t, degree + 1))
+    r_diag = np.abs(np.diag(r))
+    if r_diag.min() <= r_diag.max() * len(x) * np.finfo(float).eps:
+        return fit_svd(x, y, degree)
+    return np.linalg.solve(r, q.T.dot(y)), shift, scale, 'qr'
+
+
+def fit_cholesky(x, y, degree):
+    """ Least-squares fit with the Cholesky decomposition of the normal equations of the standardized x. This is the
+    fastest solver but it squares the condition number: it falls back to `fit_qr` when the estimated condition number
+    of the normal equations is larger than 1/sqrt(eps) """
+    t, shift, scale = standardize(x)
+    vander = np.vander(t, degree + 1)
+    try:
+        chol = np.linalg.cholesky(vander.T.dot(vander))
+    except np.linalg.LinAlgError:
+        return fit_qr(x, y, degree)
+    chol_diag = np.diag(chol)
+    if (chol_diag.max() / chol_diag.min()) ** 2 > 1 / np.sqrt(np.finfo(float).eps):
+        return fit_qr(x, y, degree)
+    t_coefs = np.linalg.solve(chol.T, np.linalg.solve(chol, vander.T.dot(y)))
+    return t_coefs, shift, scale, 'cholesky'
+
+
+def fit_chebyshev(x, y, degree):
+    """ Least-squares fit in the Chebyshev basis, after mapping x to [-1, 1] where this basis is well conditioned.
+    The coefficients are then converted to the powers of the mapped x """
+    shift, scale = (x.max() + x.min()) / 2, (x.max() - x.min()) / 2 or 1.
+    cheb_coefs = np.polynomial.chebyshev.chebfit((x - shift) / scale, y, degree)
+    # the change of basis is linear: column j holds the (increasing powers) coefficients of the j-th Chebyshev basis
+    conversion = np.zeros((degree + 1, degree + 1))
+    for j in range(degree + 1):
+        powers_coefs = np.polynomial.chebyshev.cheb2poly(np.eye(degree + 1)[j])
+        conversion[:len(powers_coefs), j] = powers_coefs
+    return conversion.dot(cheb_coefs)[::-1], shift, scale, 'chebyshev'
+
+
+# the least-squares solver backends. Each one returns the coefficients (decreasing powers of t), the shift and scale
+# defining t = (x - shift) / scale, and the name of the solver actually used, that may be a more stable one in case
+# of poor conditioning
+SOLVERS = OrderedDict([('polyfit', fit_polyfit), ('svd', fit_svd), ('qr', fit_qr), ('cholesky', fit_cholesky),
+                       ('chebyshev', fit_chebyshev)])
+
+
+def standardize(x):
+    """ Returns t = (x - shift) / scale, with shift and scale the mean and standard deviation of x """
+    shift, scale = x.mean(), x.std() or 1.
+    return (x - shift) / scale, shift, scale
+
+
+def polyval_horner(coefs, x, out, shift=0., scale=1., chunk_size=2 ** 14):
+    """
+    Evaluates the polynomial with coefficients `coefs` (decreasing powers, as in `np.polyfit`) on `x` in place in `out`.
+    If `shift` and `scale` are provided, the polynomial is evaluated on (x - shift) / scale instead. If `coefs` has
+    several columns (one polynomial per target), `out` has one column per polynomial.
+
+    The Horner scheme does not allocate any temporary array (except one chunk of the standardized x). Evaluation is done
+    by chunks so that the chunk of `out` being updated for all coefficients stays in the cpu cache.
+    """
+    for start in range(0, len(x), chunk_size):
+        x_chunk = x[start:start + chunk_size]
+        if shift != 0. or scale != 1.:
+            x_chunk = (x_chunk - shift) / scale
+        if out.ndim > 1:
+            x_chunk = x_chunk[:, np.newaxis]
+        out_chunk = out[start:start + chunk_size]
+        out_chunk[...] = coefs[0]
+        for c in coefs[1:]:
+            out_chunk *= x_chunk
+            out_chunk += c
+    return out
+
+
+class PowerBasisCache(object):
+    """
+    A cache of the powers of the `x` arrays (1, x, x**2...) used for predictions, so that predicting repeatedly on the
+    same `x` does not recompute them. Powers are shared across degrees: a degree 2 challenger reuses the powers computed
+    for a degree 1 challenger and only computes x**2.
+
+    Arrays are identified by their memory buffer (address, shape, strides and dtype), and a reference to them is kept in
+    the cache so that this buffer is not reused by another array. Hashing their content instead would cost as much as
+    computing the powers, so the content is assumed to be constant: after modifying an array in place, `clear` the
+    cache, otherwise the powers of its former values are returned. The least recently used entries are evicted when the
+    cache size exceeds `max_bytes`. The cache is not shared across processes: it is empty when unpickled.
+    """
+    def __init__(self, max_bytes=256 * 1024 ** 2):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._nbytes = 0
+
+    @property
+    def nbytes(self):
+        """ The total size of the cached powers """
+        return self._nbytes
+
+    def clear(self):
+        """ Removes all entries """
+        self._entries.clear()
+        self._nbytes = 0
+
+    def powers(self, x, degree):
+        """ Returns the (degree+1, len(x)) array of increasing powers of x, or None if it does not fit in the cache """
+        if (degree + 1) * len(x) * 8 > self.max_bytes:
+            return None
+
+        key = (x.__array_interface__['data'][0], x.shape, x.strides, x.dtype.str)
+        try:
+            x_ref, powers = self._entries.pop(key)
+            self._nbytes -= powers.nbytes
+        except KeyError:
+            powers = np.ones((1, len(x)))
+        if len(powers) <= degree:
+            extended = np.empty((degree + 1, len(x)))
+            extended[:len(powers)] = powers
+            for d in range(len(powers), degree + 1):
+                np.multiply(extended[d - 1], x, out=extended[d])
+            powers = extended
+        self._entries[key] = (x, powers)
+        self._nbytes += powers.nbytes
+
+        # evict the least recently used entries
+        while self._nbytes > self.max_bytes:
+            self._nbytes -= self._entries.popitem(last=False)[1][1].nbytes
+        return powers[:degree + 1] if key in self._entries else None
+
+    def __getstate__(self):
+        return dict(max_bytes=self.max_bytes)
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+
+# the cache shared by all challengers in this process
+shared_power_cache = PowerBasisCache()
+
+
+def stack_padded(arrays):
+    """ Stacks 1-D arrays with possibly different lengths into a 2-D array, padding with zeros """
+    stacked = np.zeros((len(arrays), max(len(a) for a in arrays)))
+    for i, a in enumerate(arrays):
+        stacked[i, :len(a)] = a
+    return stacked
 
 
 @parametrize(degree=[1, 2])
 def algo_polyfit(degree):
     """ The two challengers based on polyfit, to be injected in the benchmark. """
-    return PolyFitChallenger(degree=degree)
+    return PolyFitChallenger(degree=degree, power_cache=shared_power_cache)
+
+
+# the other solver backends to compare to np.polyfit, e.g. BENCH_POLYFIT_SOLVERS=qr,cholesky (or "all"). None by default
+polyfit_solvers = os.environ.get("BENCH_POLYFIT_SOLVERS", "")
+polyfit_solvers = [s for s in SOLVERS if s != 'polyfit'] if polyfit_solvers == "all" \
+    else [s.strip() for s in polyfit_solvers.split(",") if s.strip()]
+
+if polyfit_solvers:
+    @parametrize(degree=[1, 2], solver=polyfit_solvers)
+    def algo_polyfit_solver(degree, solver):
+        """ The polyfit challengers with the other solver backends """
+        return PolyFitChallenger(degree=degree, power_cache=shared_power_cache, solver=solver)
@@ -0,0 +1,176 @@
+from pathlib import Path
+from time import perf_counter
+
+import pytest
+
+from .datasets_polyfit import datasets_cache
+from .overhead import OverheadRecorder
+from .sharding import load_durations, parse_shard, partition
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "bench_profile: profile the memory usage (and cpu, with 'cprofile' as "
+                                       "argument) of the fit, predict and evaluate phases of the marked challenger or "
+                                       "dataset case.")
+    # the durations of the phases of the session (--bench-overhead-report)
+    config.bench_overhead = OverheadRecorder() if config.getoption("bench_overhead_report") else None
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_collection(session):
+    """ Measures the duration of the collection with `--bench-overhead-report` """
+    start = perf_counter()
+    yield
+    if session.config.bench_overhead is not None:
+        session.config.bench_overhead.add('collection', perf_counter() - start)
+
+
+def pytest_sessionfinish(session):
+    """ Saves the new hashes of the dataset cache index, and the durations of the phases of the session with
+    `--bench-overhead-report` """
+    datasets_cache.flush_index()
+    if session.config.bench_overhead is not None:
+        session.config.bench_overhead.save(session.config.getoption("bench_overhead_report"))
+
+
+def pytest_collection_modifyitems(config, items):
+    """ Only keeps the benchmark nodes (the ones using `results_row`) of this shard with `--bench-shard`, and none of
+    them with `--bench-merge-shards` """
+    shard = config.getoption("bench_shard")
+    merge = config.getoption("bench_merge_shards")
+    if shard is None and merge is None:
+        return
+
+    bench_items = [item for item in items if 'results_row' in getattr(item, 'fixturenames', ())]
+    # all the benchmark nodes in collection order, saved with the shard so that the merge follows this order
+    config.bench_collected_ids = [item.name for item in bench_items]
+    if merge is not None:
+        deselected = bench_items
+    else:
+        index, n_shards = parse_shard(shard)
+        durations = load_durations(config.getoption("bench_durations"))
+        selected = set(partition([item.name for item in bench_items], durations, n_shards)[index])
+        deselected = [item for item in bench_items if item.name not in selected]
+
+    if deselected:
+        deselected_ids = set(id(item) for item in deselected)
+        items[:] = [item for item in items if id(item) not in deselected_ids]
+        config.hook.pytest_deselected(items=deselected)
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_makereport(item, call):
+    """ Stores the report of each phase on the test node (`item.rep_setup`, `item.rep_call`...), and records the status
+    and duration (ms) of the test nodes in their row of the results table, if any (and in the rows of the other targets
+    of a multi-output dataset). Values already set by the evaluation (e.g. the duration of a pair evaluated in a worker)
+    are kept. With `--bench-overhead-report`, the duration of the phase is also recorded """
+    report = (yield).get_result()
+    setattr(item, "rep_%s" % report.when, report)
+    row = getattr(item, 'bench_results_row', None)
+    overhead = item.config.bench_overhead
+    if overhead is not None:
+        if 'results_row' in getattr(item, 'fixturenames', ()):
+            overhead.add(report.when, report.duration, node_id=item.nodeid)
+        elif 'bench_results_df' in getattr(item, 'fixturenames', ()):
+            overhead.add('synthesis', report.duration)
+    if row is None:
+        return
+    for r in [row] + row.siblings:
+        if report.failed:
+            r.update(status='failed')
+        elif report.when == 'call':
+            r.update_missing(status=report.outcome, duration_ms=report.duration * 1000)
+
+
+def pytest_addoption(parser):
+    """ Options of the benchmark """
+    group = parser.getgroup("benchmark", "data science benchmark")
+    group.addoption("--bench-workers", type=int, default=1, metavar="N",
+                    help="Number of worker processes evaluating the (challenger, dataset) pairs. "
+                         "Default 1 evaluates each pair in its test node; 0 uses one worker per cpu.")
+    group.addoption("--bench-batch", action="store_true", default=False,
+                    help="Group the datasets with the same length and evaluate each challenger on them at once, "
+                         "using its batch API (fit_batch/predict_batch).")
+    group.addoption("--bench-timing", action="store_true", default=False,
+                    help="Time the fit and predict phases separately, with warmup and repeated rounds.")
+    group.addoption("--bench-timing-max-time", type=float, default=1., metavar="SECONDS",
+                    help="Maximum time spent repeating the rounds of each timed phase (default 1s).")
+    group.addoption("--bench-cv", type=int, default=0, metavar="K",
+                    help="Compute the cv-rmse with a K-fold cross-validation instead of on the training data "
+                         "(default 0: no cross-validation).")
+    group.addoption("--bench-cv-repeats", type=int, default=1, metavar="N",
+                    help="Number of repeats of the K-fold cross-validation, with different shuffles (default 1).")
+    group.addoption("--bench-metrics", default="cvrmse", metavar="NAMES",
+                    help="Comma-separated metrics to compute for each pair, in a single pass over the predictions, "
+                         "among rmse, cvrmse, mae, r2, max_error, q50_abs_error, q90_abs_error and q99_abs_error "
+                         "(see metrics.METRICS), or 'all'. The cv-rmse is always computed.")
+    group.addoption("--bench-incremental", action="store_true", default=False,
+                    help="Only evaluate the pairs whose challenger code, parameters or dataset changed since the "
+                         "previous run, and reload the results of the others.")
+    group.addoption("--bench-model-cache", action="store_true", default=False,
+                    help="Cache the fitted models (their compact state) in memory and in the .bench_model_cache/ "
+                         "folder, and reuse them instead of training them again, e.g. to compute other metrics. "
+                         "Timed and cross-validated fits do not use the cache.")
+    group.addoption("--bench-profile", choices=("memory", "cprofile"), default=None,
+                    help="Measure the peak memory of the fit, predict and evaluate phases ('memory'), and also dump "
+                         "a cProfile of each phase next to the log files ('cprofile').")
+    group.addoption("--bench-save-baseline", default=None, metavar="NAME",
+                    help="Save the results of this run as the baseline named NAME.")
+    group.addoption("--bench-compare-baseline", default=None, metavar="NAME",
+                    help="Compare the results of this run to the baseline named NAME, and fail the synthesis if "
+                         "there are regressions.")
+    group.addoption("--bench-max-slowdown", type=float, default=1.2, metavar="RATIO",
+                    help="Maximum accepted ratio between the median fit or predict duration and the baseline one "
+                         "(default 1.2). Requires --bench-timing in both runs.")
+    group.addoption("--bench-max-cvrmse-increase", type=float, default=0.01, metavar="RATIO",
+                    help="Maximum accepted relative increase of the cv-rmse with respect to the baseline "
+                         "(default 0.01).")
+    group.addoption("--bench-baseline-min-rounds", type=int, default=10, metavar="N",
+                    help="Minimum number of timing rounds in both runs for the significance test of the latency "
+                         "gate (default 10). Runs saving or comparing a baseline time at least N rounds per phase.")
+    group.addoption("--bench-save-models", action="store_true", default=False,
+                    help="Pickle the fitted models in the .bench_models/ folder. By default only their string "
+                         "representation is kept in the results table.")
+    group.addoption("--bench-blas-threads", type=int, default=None, metavar="N",
+                    help="Limit the BLAS and OpenMP libraries to N threads during the run (full effect requires "
+                         "threadpoolctl).")
+    group.addoption("--bench-buffered-logs", action="store_true", default=False,
+                    help="Buffer the log records of each test node in memory and write them all in a single JSON "
+                         "lines file (logs/bench.jsonl) in the background, instead of one log file per node. Only "
+                         "failed nodes get their own log file.")
+    group.addoption("--bench-shard", default=None, metavar="K/N",
+                    help="Only run the K-th shard (1 <= K <= N) of the benchmark split in N shards with balanced "
+                         "durations, and save its partial results in polyfit_bench_shard-KofN.pkl.")
+    group.addoption("--bench-merge-shards", default=None, metavar="GLOB",
+                    help="Do not run the benchmark, create the synthesis from the partial results files matching "
+                         "GLOB (e.g. 'polyfit_bench_shard-*.pkl') instead.")
+    group.addoption("--bench-durations", default=str(Path(__file__).parent / ".bench_durations.json"),
+                    metavar="PATH",
+                    help="File with the durations of the previous runs, used to balance the shards. It is updated "
+                         "by the runs without --bench-shard: all shards should use the same file.")
+    group.addoption("--bench-timeout", type=float, default=None, metavar="SECONDS",
+                    help="Evaluate each pair in a supervised child process, killed after SECONDS. Pairs exceeding "
+                         "it get the status 'timeout'.")
+    group.addoption("--bench-max-memory", type=float, default=None, metavar="MB",
+                    help="Evaluate each pair in a supervised child process, whose resident memory can not grow by "
+                         "more than MB (linux; other unix systems limit the address space instead). Pairs exceeding "
+                         "it get the status 'oom'.")
+    group.addoption("--bench-no-early-abort", action="store_true", default=False,
+                    help="With --bench-timeout or --bench-max-memory, still evaluate a challenger on the larger "
+                         "datasets after it exceeded its budget on a smaller one (by default they are skipped, with "
+                         "the status 'aborted').")
+    group.addoption("--bench-race", action="store_true", default=False,
+                    help="Race the challengers over the datasets: after each dataset (round), the challengers whose "
+                         "cv-rmse is significantly worse than the leader's are pruned, and their remaining pairs get "
+                         "the status 'pruned'. The timing budget of the pruned challengers goes to the survivors.")
+    group.addoption("--bench-race-alpha", type=float, default=0.05, metavar="P",
+                    help="With --bench-race, significance level of the sign test pruning a challenger (default 0.05).")
+    group.addoption("--bench-race-min-rounds", type=int, default=5, metavar="N",
+                    help="With --bench-race, number of datasets on which all the challengers still in the race must "
+                         "have been evaluated before any pruning (default 5).")
+    group.addoption("--bench-overhead-report", default=None, metavar="PATH",
+                    help="Save the durations of the collection, of the setup, call and teardown of the benchmark "
+                         "nodes and of the synthesis in the JSON file PATH (used by overhead.py, the benchmark of the "
+                         "harness itself).")
+    group.addoption("--bench-show-plots", action="store_true", default=False,
+                    help="Show the synthesis plots interactively (blocking) instead of saving them to files.")
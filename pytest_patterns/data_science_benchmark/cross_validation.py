@@ -0,0 +1,63 @@
+from collections import namedtuple
+
+import numpy as np
+
+
+class CVFolds(namedtuple('CVFolds', ('name', 'n_splits', 'test_indices'))):
+    """
+    The folds of a (repeated) K-fold cross-validation on a dataset of `n` points. `test_indices` is a (n_repeats, n)
+    array: each row is a permutation of `range(n)`, whose `n_splits` consecutive segments are the test sets of the
+    folds (sorted, for memory locality).
+    """
+    __slots__ = ()
+
+    @property
+    def n_repeats(self):
+        return len(self.test_indices)
+
+    def splits(self, repeat):
+        """ Returns the list of the test indices of each fold of `repeat` (views on `test_indices`) """
+        return np.array_split(self.test_indices[repeat], self.n_splits)
+
+
+class CrossValidation(object):
+    """
+    K-fold cross-validation with `n_splits` folds, repeated `n_repeats` times with different shuffles.
+
+    Folds only depend on the number of points and on `seed`: they are computed once per dataset length and shared by
+    all challengers (and by all datasets with the same length).
+    """
+    def __init__(self, n_splits=5, n_repeats=1, seed=0):
+        if n_splits < 2:
+            raise ValueError("Cross-validation requires at least 2 folds, found %r" % n_splits)
+        self.n_splits = n_splits
+        self.n_repeats = n_repeats
+        self.seed = seed
+        self._folds = dict()
+
+    def __repr__(self):
+        return "CrossValidation(n_splits=%i, n_repeats=%i, seed=%i)" % (self.n_splits, self.n_repeats, self.seed)
+
+    def folds(self, n_points):
+        """ Returns the `CVFolds` for a dataset of `n_points` points """
+        try:
+            return self._folds[n_points]
+        except KeyError:
+            pass
+
+        test_indices = np.empty((self.n_repeats, n_points), dtype=np.intp)
+        for repeat in range(self.n_repeats):
+            test_indices[repeat] = np.random.default_rng((self.seed, repeat)).permutation(n_points)
+            for test in np.array_split(test_indices[repeat], self.n_splits):
+                test.sort()
+        name = "%r-n=%i" % (self, n_points)
+        folds = self._folds[n_points] = CVFolds(name=name, n_splits=self.n_splits, test_indices=test_indices)
+        return folds
+
+
+def fold_ids(test_indices, n_points):
+    """ Returns the array of the fold number of each point, from the list of the test indices of each fold """
+    ids = np.empty(n_points, dtype=np.intp)
+    for k, test in enumerate(test_indices):
+        ids[test] = k
+    return ids
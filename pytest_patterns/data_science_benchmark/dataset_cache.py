@@ -0,0 +1,208 @@
+import hashlib
+import json
+import os
+import shutil
+from collections import OrderedDict
+from itertools import islice
+from pathlib import Path
+from uuid import uuid4
+
+import numpy as np
+
+
+class ColumnarCache(object):
+    """
+    An on-disk cache converting csv files into a binary columnar format (one `.npy` file per column).
+
+    Entries are keyed by the sha1 of the file contents, so that renamed or copied files share the same entry. In order
+    not to re-hash all files in every session, an index remembers the (size, mtime) of each csv file that was already
+    hashed: the hash is only recomputed when one of them changes. The index is read once per session, and the new
+    hashes are saved by batches of `index_batch` (and by `flush_index`, at the end of the session).
+
+    Columns are served as read-only `np.memmap`, so that several sessions or xdist workers reading the same dataset
+    share the same pages through the OS file cache instead of each holding a private copy.
+
+    The total size of the cache is bounded by `max_bytes`: least recently used entries are evicted first.
+
+    Files are parsed by chunks of `chunk_rows` rows, so that files larger than the available memory can be converted.
+    """
+    INDEX_FILE = 'index.json'
+    META_FILE = 'meta.json'
+
+    def __init__(self, cache_dir, max_bytes=2 * 1024 ** 3, chunk_rows=2 ** 20, index_batch=256):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.chunk_rows = chunk_rows
+        self.index_batch = index_batch
+        self._index = None
+        self._index_updates = dict()
+        self._index_removed = set()
+
+    def load(self, csv_file_path):
+        """ Returns an ordered dictionary {column name: read-only memmap} for the given csv file, converting it if
+        needed. Column names are the ones of `column_names` """
+        return OrderedDict((c, np.load(str(f), mmap_mode='r')) for c, f in self.column_files(csv_file_path).items())
+
+    def column_files(self, csv_file_path):
+        """ Returns an ordered dictionary {column name: .npy file path} for the given csv file, converting it if
+        needed """
+        csv_file_path = Path(csv_file_path)
+        entry_dir = self.cache_dir / self.content_hash(csv_file_path)
+        meta_file = entry_dir / self.META_FILE
+        if meta_file.exists():
+            # touch the entry so that it is considered recently used
+            os.utime(str(meta_file))
+        else:
+            self._convert(csv_file_path, entry_dir)
+            self.evict(keep=entry_dir)
+
+        with meta_file.open() as f:
+            columns = json.load(f)['columns']
+        return OrderedDict((c, entry_dir / ('%s.npy' % c)) for c in columns)
+
+    def content_hash(self, csv_file_path):
+        """ Returns the sha1 of the file contents, only reading the file if its size or mtime changed """
+        st = csv_file_path.stat()
+        index = self._get_index()
+        key = str(csv_file_path.resolve())
+        known = index.get(key)
+        if known is not None and known['size'] == st.st_size and known['mtime_ns'] == st.st_mtime_ns:
+            return known['sha1']
+
+        sha1 = hashlib.sha1()
+        with csv_file_path.open('rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                sha1.update(block)
+        index[key] = self._index_updates[key] = dict(size=st.st_size, mtime_ns=st.st_mtime_ns, sha1=sha1.hexdigest())
+        if len(self._index_updates) >= self.index_batch:
+            self.flush_index()
+        return index[key]['sha1']
+
+    def flush_index(self):
+        """ Saves the new hashes in the index, and removes the csv files that no longer exist from it. The index file
+        is read again first, so that the hashes saved meanwhile by other processes (e.g. xdist workers) are kept """
+        if not self._index_updates and not self._index_removed:
+            return
+        index = self._read_index()
+        index.update(self._index_updates)
+        for key in self._index_removed:
+            index.pop(key, None)
+        self._write_json(self.cache_dir / self.INDEX_FILE, index)
+        self._index_updates = dict()
+        self._index_removed = set()
+
+    def evict(self, keep=None):
+        """ Removes the least recently used entries until the cache size is below `max_bytes` """
+        entries = []
+        total = 0
+        for entry_dir in self.cache_dir.iterdir():
+            meta_file = entry_dir / self.META_FILE
+            if not meta_file.exists():
+                continue
+            size = sum(f.stat().st_size for f in entry_dir.iterdir())
+            entries.append((meta_file.stat().st_mtime, size, entry_dir))
+            total += size
+
+        for _, size, entry_dir in sorted(entries, key=lambda e: e[0]):
+            if total <= self.max_bytes:
+                break
+            if entry_dir != keep:
+                shutil.rmtree(str(entry_dir), ignore_errors=True)
+                total -= size
+
+    def _convert(self, csv_file_path, entry_dir):
+        """ Parses the csv file once, by chunks, and writes one .npy file per column, atomically """
+        tmp_dir = self.cache_dir / ('.tmp-%s' % uuid4().hex)
+        tmp_dir.mkdir(parents=True)
+        n_rows = max(count_lines(csv_file_path) - 1, 0)
+        with csv_file_path.open() as f:
+            names = column_names(f.readline())
+            columns = [np.lib.format.open_memmap(str(tmp_dir / ('%s.npy' % c)), mode='w+', shape=(n_rows,))
+                       for c in names]
+            n_read = 0
+            for lines in iter(lambda: list(islice(f, self.chunk_rows)), []):
+                chunk = np.genfromtxt(lines, delimiter=',').reshape(-1, len(names))
+                for i, column in enumerate(columns):
+                    column[n_read:n_read + len(chunk)] = chunk[:, i]
+                n_read += len(chunk)
+
+        for column in columns:
+            column.flush()
+        if n_read < n_rows:
+            # some lines were skipped by the parser (e.g. empty lines): rewrite the columns with the right length
+            columns = [np.array(column[:n_read]) for column in columns]
+            for c, column in zip(names, columns):
+                np.save(str(tmp_dir / ('%s.npy' % c)), column)
+        del columns
+        self._write_json(tmp_dir / self.META_FILE, dict(columns=list(names), source=str(csv_file_path)))
+        try:
+            os.rename(str(tmp_dir), str(entry_dir))
+        except OSError:
+            # another process (e.g. an xdist worker) converted the same file concurrently: use its entry
+            shutil.rmtree(str(tmp_dir), ignore_errors=True)
+
+    def _get_index(self):
+        """ The index, read once per session. The csv files that no longer exist are removed from it """
+        if self._index is None:
+            self._index = self._read_index()
+            self._index_removed = set(key for key in self._index if not os.path.exists(key))
+            for key in self._index_removed:
+                del self._index[key]
+        return self._index
+
+    def _read_index(self):
+        try:
+            with (self.cache_dir / self.INDEX_FILE).open() as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return dict()
+
+    @staticmethod
+    def _write_json(path, contents):
+        """ Writes to a temporary file then renames it, so that concurrent readers never see a partial file """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name('%s.%s' % (path.name, uuid4().hex))
+        with tmp_path.open('w') as f:
+            json.dump(contents, f)
+        os.replace(str(tmp_path), str(path))
+
+
+def column_names(header_line):
+    """ The column names of the csv header line `header_line`, sanitized as `np.genfromtxt(names=True)` does (e.g.
+    'temp-1' becomes 'temp1' and 'temp 2' becomes 'temp_2') """
+    return list(np.genfromtxt([header_line], delimiter=',', names=True).dtype.names)
+
+
+def count_lines(file_path):
+    """ Counts the lines in a text file, reading it by binary blocks (much faster than parsing it) """
+    n = 0
+    last = b'\n'
+    with open(str(file_path), 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            n += block.count(b'\n')
+            last = block[-1:]
+    # last line without end of line
+    return n if last == b'\n' else n + 1
+
+
+class MemmapChunks(object):
+    """
+    A re-iterable source of (x, y) chunks of `chunk_size` rows, read from two `.npy` column files. It only holds the
+    file paths so it is cheap to pickle, and at most one chunk is loaded in memory at a time.
+    """
+    def __init__(self, x_file, y_file, chunk_size=2 ** 20):
+        self.x_file = str(x_file)
+        self.y_file = str(y_file)
+        self.chunk_size = chunk_size
+
+    def __repr__(self):
+        return "MemmapChunks(%r, %r, chunk_size=%i)" % (self.x_file, self.y_file, self.chunk_size)
+
+    def __len__(self):
+        return len(np.load(self.x_file, mmap_mode='r'))
+
+    def __iter__(self):
+        x = np.load(self.x_file, mmap_mode='r')
+        y = np.load(self.y_file, mmap_mode='r')
+        for start in range(0, len(x), self.chunk_size):
+            yield np.array(x[start:start + self.chunk_size]), np.array(y[start:start + self.chunk_size])
@@ -0,0 +1,84 @@
+import json
+import os
+from collections import namedtuple
+from fnmatch import fnmatch
+from pathlib import Path
+from uuid import uuid4
+
+from .dataset_cache import column_names, count_lines
+
+
+ManifestEntry = namedtuple("ManifestEntry", ('path', 'size', 'mtime_ns', 'n_rows', 'columns'))
+"""The metadata of a dataset file in the manifest"""
+
+
+class DatasetManifest(object):
+    """
+    A persistent list of the csv files of `datasets_dir`, with their metadata (size, mtime, number of rows and column
+    names), so that cases can be collected and filtered without reading the files.
+
+    The manifest is saved in `manifest_file`. When refreshed, the directory is listed again but only the files that are
+    new or whose size or mtime changed are read.
+    """
+    def __init__(self, datasets_dir, manifest_file, pattern='*.csv'):
+        self.datasets_dir = Path(datasets_dir)
+        self.manifest_file = Path(manifest_file)
+        self.pattern = pattern
+        self._entries = None
+
+    def entries(self):
+        """ Returns the list of `ManifestEntry`, sorted by path. The manifest is refreshed once per session """
+        if self._entries is None:
+            self._entries = self.refresh()
+        return self._entries
+
+    def select(self, min_rows=None, max_rows=None, name_pattern=None):
+        """ Returns the entries with a number of rows in [min_rows, max_rows], and a file stem matching `name_pattern`
+        (a glob pattern) """
+        return [e for e in self.entries()
+                if (min_rows is None or e.n_rows >= min_rows) and (max_rows is None or e.n_rows <= max_rows)
+                and (name_pattern is None or fnmatch(Path(e.path).stem, name_pattern))]
+
+    def refresh(self):
+        """ Lists the directory, reads the new or modified files, and saves the manifest if it changed """
+        known = {e.path: e for e in self._read()}
+        entries = []
+        changed = False
+        with os.scandir(str(self.datasets_dir)) as it:
+            for dir_entry in it:
+                if not dir_entry.is_file() or not fnmatch(dir_entry.name, self.pattern):
+                    continue
+                st = dir_entry.stat()
+                entry = known.pop(dir_entry.path, None)
+                if entry is None or entry.size != st.st_size or entry.mtime_ns != st.st_mtime_ns:
+                    entry = read_entry(dir_entry.path, st)
+                    changed = True
+                entries.append(entry)
+        # the remaining known entries are the deleted files
+        if changed or known:
+            self._write(entries)
+        return sorted(entries, key=lambda e: e.path)
+
+    def _read(self):
+        try:
+            with self.manifest_file.open() as f:
+                return [ManifestEntry(**e) for e in json.load(f)]
+        except (IOError, ValueError, TypeError):
+            return []
+
+    def _write(self, entries):
+        """ Writes to a temporary file then renames it, so that concurrent readers never see a partial file """
+        self.manifest_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.manifest_file.with_name('%s.%s' % (self.manifest_file.name, uuid4().hex))
+        with tmp_path.open('w') as f:
+            json.dump([e._asdict() for e in entries], f)
+        os.replace(str(tmp_path), str(self.manifest_file))
+
+
+def read_entry(file_path, st):
+    """ Returns the `ManifestEntry` of the csv file `file_path` with stat result `st`: only the header is parsed. Column
+    names are the ones of the `ColumnarCache` """
+    with open(file_path) as f:
+        columns = column_names(f.readline())
+    return ManifestEntry(path=file_path, size=st.st_size, mtime_ns=st.st_mtime_ns,
+                         n_rows=max(count_lines(file_path) - 1, 0), columns=columns)
@@ -1,13 +1,27 @@
+import os
+import zlib
+from warnings import warn
 from collections import namedtuple
 from pathlib import Path
 
 import numpy as np
 from pytest_cases import parametrize
 
+from .dataset_cache import ColumnarCache, MemmapChunks
+from .dataset_manifest import DatasetManifest
+
 
 Dataset = namedtuple("Dataset", ('name', 'x', 'y'))
 """A minimal structure representing a dataset"""
 
+ChunkedDataset = namedtuple("ChunkedDataset", ('name', 'n_points', 'chunks'))
+"""A dataset too large to fit in memory. `chunks` is a re-iterable source of (x, y) blocks, with n_points rows in
+total. It is evaluated with the streaming evaluation protocol."""
+
+MultiOutputDataset = namedtuple("MultiOutputDataset", ('name', 'x', 'y', 'targets'))
+"""A dataset with several targets sharing the same `x`: `y` is a (n_points, n_targets) array, and `targets` are the
+names of its columns. Challengers fit all targets at once, and each target gets its own row in the results table."""
+
 
 # ------------- example data created by scripts --------------
 @parametrize(id=range(1, 5))
@@ -34,13 +48,107 @@ def data_anscombes_quartet(id):
     return Dataset(name="Anscombes-%s" % id, x=x, y=y)
 
 
+# ------------- synthetic data for scaling curves --------------
+# sizes of the synthetic datasets. Only the sizes up to the BENCH_SYNTHETIC_MAX_SIZE environment variable are generated
+# (none by default), e.g. BENCH_SYNTHETIC_MAX_SIZE=1e6
+synthetic_sizes = [10 ** k for k in range(2, 9)]
+synthetic_max_size = int(float(os.environ.get("BENCH_SYNTHETIC_MAX_SIZE", 0)))
+
+# synthetic datasets larger than this are generated by chunks and evaluated with the streaming protocol
+synthetic_chunk_size = 2 ** 20
+
+
+class SyntheticChunks(object):
+    """
+    A re-iterable source of (x, y) chunks of a noisy polynomial dataset, generated deterministically from `seed`: the
+    same chunks are generated at each iteration, and nothing is stored. It is cheap to pickle.
+    """
+    def __init__(self, seed, n_points, true_degree, noise, chunk_size=synthetic_chunk_size):
+        self.seed = seed
+        self.n_points = n_points
+        self.noise = noise
+        self.chunk_size = chunk_size
+        # y stays far from 0 on [0, 10], so that the cv-rmse is meaningful
+        self.coefs = np.random.default_rng(seed).uniform(-1, 1, size=true_degree + 1)
+        self.coefs[-1] += 10 ** true_degree
+
+    def __repr__(self):
+        return "SyntheticChunks(seed=%i, n_points=%i, coefs=%r, noise=%r, chunk_size=%i)" \
+               % (self.seed, self.n_points, self.coefs.tolist(), self.noise, self.chunk_size)
+
+    def __len__(self):
+        return self.n_points
+
+    def __iter__(self):
+        for i, start in enumerate(range(0, self.n_points, self.chunk_size)):
+            rng = np.random.default_rng((self.seed, i))
+            x = rng.uniform(0, 10, size=min(self.chunk_size, self.n_points - start))
+            y = np.polyval(self.coefs, x)
+            y += rng.normal(scale=self.noise * y.std() if len(x) > 1 else 0, size=len(x))
+            yield x, y
+
+
+def synthetic_chunks(n, noise, true_degree):
+    """ The `SyntheticChunks` of the synthetic dataset with `n` points. Its seed only depends on `noise` and
+    `true_degree`, so that all the sizes share the same true polynomial (and the smaller datasets are the first points
+    of the larger ones): the scaling curves then only measure the effect of the size. """
+    seed = zlib.crc32(("Synthetic-noise=%s-degree=%i" % (noise, true_degree)).encode('utf-8'))
+    return SyntheticChunks(seed=seed, n_points=n, true_degree=true_degree, noise=noise)
+
+
+if any(n <= synthetic_max_size for n in synthetic_sizes):
+    @parametrize(n=[n for n in synthetic_sizes if n <= synthetic_max_size], noise=[0.1, 1.], true_degree=[1, 2, 3])
+    def data_synthetic(n, noise, true_degree):
+        """ Noisy polynomial datasets of increasing sizes, to draw the scaling curves of the challengers """
+        name = "Synthetic-n=%i-noise=%s-degree=%i" % (n, noise, true_degree)
+        chunks = synthetic_chunks(n, noise, true_degree)
+        if n > synthetic_chunk_size:
+            return ChunkedDataset(name=name, n_points=n, chunks=chunks)
+
+        x, y = next(iter(chunks))
+        return Dataset(name=name, x=x, y=y)
+
+
 # -------------- example data created from files --------------
 datasets_dir = Path(__file__).parent / 'datasets'
-all_csv_files = [datasets_dir / file_name for file_name in datasets_dir.glob('*.csv')]
 
+# csv files are parsed once, then served from a columnar memory-mapped cache
+datasets_cache = ColumnarCache(Path(__file__).parent / '.datasets_cache', max_bytes=2 * 1024 ** 3)
+
+# the files and their metadata are listed in a manifest, so that collection does not read them. Files can be selected
+# with the BENCH_DATASETS_MIN_ROWS, BENCH_DATASETS_MAX_ROWS and BENCH_DATASETS_PATTERN (glob on the file name without
+# extension) environment variables, e.g. BENCH_DATASETS_MAX_ROWS=1e5
+datasets_manifest = DatasetManifest(datasets_dir, datasets_cache.cache_dir / 'manifest.json')
+selected_csv_files = datasets_manifest.select(
+    min_rows=int(float(os.environ["BENCH_DATASETS_MIN_ROWS"])) if "BENCH_DATASETS_MIN_ROWS" in os.environ else None,
+    max_rows=int(float(os.environ["BENCH_DATASETS_MAX_ROWS"])) if "BENCH_DATASETS_MAX_ROWS" in os.environ else None,
+    name_pattern=os.environ.get("BENCH_DATASETS_PATTERN"))
+
+# csv files larger than this are streamed by chunks instead of being fitted at once
+large_file_bytes = 1024 ** 3
+
+
+if selected_csv_files:
+    @parametrize(csv_file=selected_csv_files, idgen=lambda csv_file: Path(csv_file.path).stem)
+    def data_csvfile(csv_file):
+        """ Generates one case per selected file in the datasets/ folder (a `ManifestEntry`). Files with other columns
+        than 'x' and 'y' are multi-output datasets, where all the columns except 'x' are targets. Files larger than
+        `large_file_bytes` are streamed on their first target only """
+        csv_file_path = Path(csv_file.path)
+        name = "CsvFile-%s" % csv_file_path.stem
+        if csv_file.size > large_file_bytes:
+            column_files = datasets_cache.column_files(csv_file_path)
+            targets = [c for c in column_files if c != 'x']
+            if len(targets) > 1:
+                warn("%s is streamed by chunks, which only supports one target: only its column %r is evaluated, "
+                     "its other targets %s are ignored" % (csv_file_path.name, targets[0], targets[1:]))
+            chunks = MemmapChunks(column_files['x'], column_files[targets[0]])
+            return ChunkedDataset(name=name, n_points=len(chunks), chunks=chunks)
 
-@parametrize(csv_file_path=all_csv_files, idgen=lambda csv_file_path: csv_file_path.stem)
-def data_csvfile(csv_file_path):
-    """ Generates one case per file in the datasets/ folder """
-    my_data = np.genfromtxt(csv_file_path, delimiter=',', names=True)
-    return Dataset(name="CsvFile-%s" % csv_file_path.stem, x=my_data['x'], y=my_data['y'])
+        # the column names of the cache, sanitized by the csv parser (the ones of the manifest may be outdated)
+        columns = datasets_cache.load(csv_file_path)
+        targets = [c for c in columns if c != 'x']
+        if targets != ['y']:
+            return MultiOutputDataset(name=name, x=columns['x'], y=np.column_stack([columns[t] for t in targets]),
+                                      targets=tuple(targets))
+        return Dataset(name=name, x=columns['x'], y=columns['y'])
@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+import platform
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    from threadpoolctl import threadpool_info, threadpool_limits
+except ImportError:
+    threadpool_info = threadpool_limits = None
+
+
+# environment variables controlling the number of threads of the BLAS and OpenMP libraries
+THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'BLIS_NUM_THREADS',
+                   'VECLIB_MAXIMUM_THREADS', 'NUMEXPR_NUM_THREADS')
+
+# the fingerprint entries that do not identify the environment: they are not used in `fingerprint_id`
+VOLATILE_ENTRIES = ('hostname', 'load_average')
+
+
+def environment_fingerprint():
+    """
+    Returns a dictionary describing the machine and software environment of the benchmark: cpu model and number of
+    cores, cpu frequency governor, BLAS/LAPACK libraries and their thread settings, python and numpy versions, and the
+    load average of the machine when the fingerprint was taken.
+    """
+    return dict(hostname=platform.node(),
+                cpu_model=cpu_model(),
+                n_cores=os.cpu_count(),
+                cpu_governor=_read_first_line('/sys/devices/system/cpu/cpu0/cpufreq/scaling_governor'),
+                os=platform.platform(),
+                python_version=platform.python_version(),
+                numpy_version=np.__version__,
+                blas=blas_libraries(),
+                blas_threads=blas_threads(),
+                thread_env_vars={v: os.environ[v] for v in THREAD_ENV_VARS if v in os.environ},
+                load_average=list(os.getloadavg()) if hasattr(os, 'getloadavg') else None)
+
+
+def fingerprint_id(fingerprint):
+    """ A short id of the environment described by `fingerprint`. Machines with the same hardware and software
+    configuration share the same id """
+    stable = {k: v for k, v in fingerprint.items() if k not in VOLATILE_ENTRIES}
+    return hashlib.sha1(json.dumps(stable, sort_keys=True).encode('utf-8')).hexdigest()[:10]
+
+
+def cpu_model():
+    """ The cpu model name, read from /proc/cpuinfo on linux """
+    try:
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    return line.split(':', 1)[1].strip()
+    except (IOError, OSError):
+        pass
+    return platform.processor() or None
+
+
+def blas_libraries():
+    """ The name and version of the BLAS and LAPACK libraries numpy was built with, as reported by `np.show_config` """
+    try:
+        dependencies = np.show_config(mode='dicts')['Build Dependencies']
+    except TypeError:
+        # numpy < 1.25: no 'mode' argument
+        info = getattr(np.__config__, 'blas_opt_info', dict())
+        return dict(blas=dict(name=','.join(info.get('libraries', [])) or None, version=None))
+    return {lib: dict(name=dependencies[lib].get('name'), version=dependencies[lib].get('version'))
+            for lib in ('blas', 'lapack') if lib in dependencies}
+
+
+def blas_threads():
+    """ The thread pools of the loaded BLAS/OpenMP libraries and their number of threads, if threadpoolctl is
+    installed """
+    if threadpool_info is None:
+        return None
+    return [dict(api=p.get('internal_api'), version=p.get('version'), num_threads=p.get('num_threads'))
+            for p in threadpool_info()]
+
+
+@contextmanager
+def pinned_blas_threads(n_threads):
+    """
+    A context manager limiting the BLAS and OpenMP libraries to `n_threads` threads (does nothing if None): in this
+    process and in the workers forked from it if threadpoolctl is installed, and in the processes started afterwards
+    through the environment variables. Everything is restored on exit.
+    """
+    if n_threads is None:
+        yield
+        return
+    previous_env = {var: os.environ.get(var) for var in THREAD_ENV_VARS}
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(n_threads)
+    limiter = threadpool_limits(limits=n_threads) if threadpool_limits is not None else None
+    try:
+        yield
+    finally:
+        if limiter is not None:
+            limiter.restore_original_limits()
+        for var, value in previous_env.items():
+            if value is None:
+                os.environ.pop(var, None)
+            else:
+                os.environ[var] = value
+
+
+def _read_first_line(file_path):
+    try:
+        with open(file_path) as f:
+            return f.readline().strip()
+    except (IOError, OSError):
+        return None
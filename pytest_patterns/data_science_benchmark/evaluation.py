@@ -0,0 +1,275 @@
+import logging
+
+import numpy as np
+
+from .datasets_polyfit import ChunkedDataset, MultiOutputDataset
+from .metrics import DEFAULT_METRICS, METRICS, ErrorStats, compute_metrics
+from .profiling import no_phase
+
+
+# logger used by the evaluation protocol
+exec_log = logging.getLogger('algo')
+
+
+def evaluate(challenger, dataset, timer=None, profiler=None, folds=None, repeats=None, metrics=DEFAULT_METRICS,
+             model_cache=None):
+    """ Evaluation protocol.
+    Applies the `challenger` on the provided `dataset`, and returns a dictionary of results (the fitted model and its
+    accuracy (cv-rmse, and the other `metrics` of `metrics.METRICS` if requested)) to be stored in the results table.
+
+    If a `timing.TimingHarness` is provided as `timer`, the `fit` and `predict` phases are timed separately and their
+    min/median/IQR durations (ms) are added to the results. Predictions are timed with `challenger.uncached()`, so that
+    the rounds do not reuse what previous rounds cached.
+
+    If a `profiling.PhaseProfiler` is provided as `profiler`, the memory usage of the `fit`, `predict` and `evaluate`
+    phases is added to the results (and their cProfile is dumped, if enabled).
+
+    If `cross_validation.CVFolds` are provided as `folds`, the cv-rmse is computed on held-out data with
+    `evaluate_cv` instead of the training data.
+
+    If a `model_cache.FittedModelCache` is provided as `model_cache`, the fitted model is restored from it when
+    available instead of being trained again (`fit_cached` in the results). The cache is not used when the fit is timed
+    or cross-validated.
+
+    `ChunkedDataset`s are evaluated with `evaluate_streaming` (not timed, no cross-validation).
+
+    On a `MultiOutputDataset`, the challenger fits all targets at once, and their metrics are computed at once. The
+    results then contain one entry per target in `outputs` (see `output_results`), and timings are divided by the
+    number of targets.
+    """
+    if isinstance(dataset, ChunkedDataset):
+        if folds is not None:
+            exec_log.warning("cross-validation is not supported on streaming datasets: the cv-rmse is computed on "
+                             "the training data")
+        return evaluate_streaming(challenger, dataset, profiler=profiler, metrics=metrics, model_cache=model_cache)
+
+    if folds is not None:
+        return evaluate_cv(challenger, dataset, folds, timer=timer, profiler=profiler, repeats=repeats,
+                           metrics=metrics)
+
+    results = dict(n_points=len(dataset.x))
+    phase = profiler.phase if profiler is not None else no_phase
+    n_outputs = len(dataset.targets) if isinstance(dataset, MultiOutputDataset) else 1
+
+    # Fit the model
+    exec_log.info("fitting model")
+    with phase("fit", results):
+        if timer is None and model_cache is not None:
+            challenger, results['fit_cached'] = model_cache.fitted(challenger, dataset)
+        elif timer is None:
+            challenger.fit(dataset.x, dataset.y)
+        else:
+            fit_stats, _ = timer.measure(lambda: challenger.fit(dataset.x, dataset.y))
+            results.update(timing_results("fit", fit_stats, n_calls=n_outputs))
+    results['model'] = challenger
+
+    # Use the model to perform predictions
+    exec_log.info("predicting")
+    with phase("predict", results):
+        if timer is None:
+            predictions = challenger.predict(dataset.x)
+        else:
+            timed_challenger = challenger.uncached()
+            predict_stats, predictions = timer.measure(lambda: timed_challenger.predict(dataset.x))
+            results.update(timing_results("predict", predict_stats, n_calls=n_outputs))
+
+    # Evaluate the prediction error
+    exec_log.info("evaluating error")
+    with phase("evaluate", results):
+        if isinstance(dataset, MultiOutputDataset):
+            # one row of predictions per target
+            all_metrics = score(predictions.T, dataset.y.T, metrics)
+            results['outputs'] = [dict(target=target, **{name: float(v[j]) for name, v in all_metrics.items()})
+                                  for j, target in enumerate(dataset.targets)]
+        else:
+            results.update(score(predictions, dataset.y, metrics))
+
+    return results
+
+
+def evaluate_cv(challenger, dataset, folds, timer=None, profiler=None, repeats=None, metrics=DEFAULT_METRICS):
+    """ Cross-validation protocol.
+    For each repeat of the `folds` (or only the ones in `repeats`), trains one model per fold on the other folds with
+    `fit_folds`, and gathers the predictions of each model on its held-out fold. The `metrics` of these out-of-fold
+    predictions are computed for all repeats at once (e.g. `cvrmse_repeats`), and averaged (e.g. `cvrmse`).
+
+    Timings are the ones of a single fold (all folds and repeats are timed together). The `model` in the results is
+    the unfitted challenger. Multi-output datasets get one entry per target in `outputs`, as in `evaluate`.
+    """
+    repeats = range(folds.n_repeats) if repeats is None else repeats
+    all_splits = [folds.splits(repeat) for repeat in repeats]
+    n_fits = sum(len(splits) for splits in all_splits)
+    targets = dataset.targets if isinstance(dataset, MultiOutputDataset) else None
+    results = dict(n_points=len(dataset.x), n_folds=folds.n_splits, model=challenger)
+    phase = profiler.phase if profiler is not None else no_phase
+
+    # Fit one model per fold
+    exec_log.info("fitting %i models" % n_fits)
+    with phase("fit", results):
+        def fit_all():
+            return [challenger.fit_folds(dataset.x, dataset.y, splits) for splits in all_splits]
+        if timer is None:
+            all_models = fit_all()
+        else:
+            fit_stats, all_models = timer.measure(fit_all)
+            results.update(timing_results("fit", fit_stats, n_calls=n_fits * len(targets or [None])))
+
+    # Predict each held-out fold
+    exec_log.info("predicting held-out folds")
+    with phase("predict", results):
+        predict_models = all_models if timer is None else [[m.uncached() for m in models] for models in all_models]
+
+        def predict_all():
+            # one row of out-of-fold predictions per repeat
+            all_predictions = np.empty((len(all_splits),) + dataset.y.shape)
+            for predictions, models, splits in zip(all_predictions, predict_models, all_splits):
+                for model, test in zip(models, splits):
+                    predictions[test] = model.predict(dataset.x[test])
+            return all_predictions
+        if timer is None:
+            all_predictions = predict_all()
+        else:
+            predict_stats, all_predictions = timer.measure(predict_all)
+            results.update(timing_results("predict", predict_stats, n_calls=n_fits * len(targets or [None])))
+
+    # Evaluate the prediction error
+    exec_log.info("evaluating error")
+    with phase("evaluate", results):
+        if targets is None:
+            results.update(repeats_results(score(all_predictions, dataset.y, metrics)))
+        else:
+            # (n_repeats, n_targets) arrays of metrics, each repeat scoring all targets at once
+            all_metrics = [score(predictions.T, dataset.y.T, metrics) for predictions in all_predictions]
+            all_metrics = {name: np.array([m[name] for m in all_metrics]) for name in metrics}
+            results['outputs'] = [dict(target=target, **repeats_results({name: values[:, j]
+                                                                         for name, values in all_metrics.items()}))
+                                  for j, target in enumerate(targets)]
+
+    return results
+
+
+def repeats_results(all_metrics):
+    """ Returns the results entries of the metrics of the repeats of a cross-validation: the list of values of each
+    metric (e.g. `cvrmse_repeats`), and their mean (e.g. `cvrmse`) """
+    results = dict()
+    for name, values in all_metrics.items():
+        results['%s_repeats' % name] = values.tolist()
+        results[name] = np.mean(values)
+    return results
+
+
+def merge_cv_results(all_results):
+    """ Merges the results of `evaluate_cv` on distinct repeats of the same folds (not timed) """
+    merged = _merge_repeats(all_results)
+    if 'outputs' in merged:
+        merged['outputs'] = [_merge_repeats([results['outputs'][j] for results in all_results])
+                             for j in range(len(merged['outputs']))]
+    if 'duration_ms' in merged:
+        merged['duration_ms'] = sum(results['duration_ms'] for results in all_results)
+    return merged
+
+
+def _merge_repeats(all_results):
+    """ Concatenates the values of the metrics of the repeats (e.g. `cvrmse_repeats`) of `all_results`, and averages
+    them again """
+    merged = dict(all_results[0])
+    for key in list(merged):
+        if key.endswith('_repeats'):
+            merged[key] = [c for results in all_results for c in results[key]]
+            merged[key[:-len('_repeats')]] = np.mean(merged[key])
+    return merged
+
+
+def evaluate_streaming(challenger, dataset, profiler=None, metrics=DEFAULT_METRICS, model_cache=None):
+    """ Streaming evaluation protocol, for datasets that do not fit in memory.
+    The challenger is trained with `partial_fit` on each chunk. Then predictions are done chunk by chunk, and only the
+    sufficient statistics of the `metrics` (sum of squared errors, sum of y, count...) are accumulated, see
+    `metrics.ErrorStats`. Note that quantile metrics keep all the absolute errors in memory.
+    The fitted model is restored from the `model_cache` if possible, as in `evaluate`.
+    """
+    results = dict(n_points=dataset.n_points)
+    phase = profiler.phase if profiler is not None else no_phase
+
+    # Fit the model
+    exec_log.info("fitting model by chunks")
+    def fit_by_chunks(model):
+        for x, y in dataset.chunks:
+            model.partial_fit(x, y)
+
+    with phase("fit", results):
+        if model_cache is None:
+            fit_by_chunks(challenger)
+        else:
+            challenger, results['fit_cached'] = model_cache.fitted(challenger, dataset, fit=fit_by_chunks)
+    results['model'] = challenger
+
+    # Use the model to perform predictions, and evaluate the prediction error
+    exec_log.info("predicting and evaluating error by chunks")
+    stats = ErrorStats(keep_abs_errors=any(METRICS[name].needs_abs_errors for name in metrics),
+                       n_points=dataset.n_points)
+    with phase("predict", results):
+        for x, y in dataset.chunks:
+            stats.update(challenger.predict(x), y)
+    results.update(report_metrics({name: float(value[0]) for name, value in stats.metrics(metrics).items()}))
+
+    return results
+
+
+def evaluate_batch(challenger, datasets, timer=None, metrics=DEFAULT_METRICS):
+    """ Same as `evaluate` for several datasets at once, relying on the batch API of the challenger.
+    Returns a list of results dictionaries, one per dataset. Timings are the ones of the whole batch divided by the
+    number of datasets. Datasets have the same length, so the `metrics` of all the predictions are computed at once.
+    """
+    xs = [dataset.x for dataset in datasets]
+    ys = [dataset.y for dataset in datasets]
+    all_results = [dict(n_points=len(dataset.x), batch_size=len(datasets)) for dataset in datasets]
+
+    # Fit the models
+    exec_log.info("fitting %i models" % len(datasets))
+    if timer is None:
+        challenger.fit_batch(xs, ys)
+    else:
+        fit_stats, _ = timer.measure(lambda: challenger.fit_batch(xs, ys))
+        for results in all_results:
+            results.update(timing_results("fit", fit_stats, n_calls=len(datasets)))
+    for results, model in zip(all_results, challenger.batch_models()):
+        results['model'] = model
+
+    # Use the models to perform predictions
+    exec_log.info("predicting")
+    if timer is None:
+        all_predictions = challenger.predict_batch(xs)
+    else:
+        predict_stats, all_predictions = timer.measure(lambda: challenger.predict_batch(xs))
+        for results in all_results:
+            results.update(timing_results("predict", predict_stats, n_calls=len(datasets)))
+
+    # Evaluate the prediction errors
+    exec_log.info("evaluating errors")
+    all_metrics = score(np.stack(all_predictions), np.stack(ys), metrics)
+    for i, results in enumerate(all_results):
+        results.update({name: float(values[i]) for name, values in all_metrics.items()})
+
+    return all_results
+
+
+def score(predictions, y, metrics=DEFAULT_METRICS):
+    """ Computes the `metrics` of `predictions` (1-D, or stacked rows) with `metrics.compute_metrics`, and prints the
+    cv-rmse """
+    return report_metrics(compute_metrics(predictions, y, metrics))
+
+
+def report_metrics(metrics):
+    """ Prints the cv-rmse in `metrics` (a dict of values or of arrays of values), if any, and returns `metrics` """
+    for value in np.atleast_1d(metrics.get('cvrmse', [])):
+        print("Relative error (cv-rmse) is: %.2f%%" % (value * 100))
+    return metrics
+
+
+def timing_results(phase, stats, n_calls=1):
+    """ Returns the results entries corresponding to the `TimingStats` of `phase`, divided by `n_calls` """
+    return {"%s_min_ms" % phase: stats.min_ms / n_calls,
+            "%s_median_ms" % phase: stats.median_ms / n_calls,
+            "%s_iqr_ms" % phase: stats.iqr_ms / n_calls,
+            "%s_rounds" % phase: stats.rounds,
+            "%s_samples_ms" % phase: (stats.samples_ms / n_calls).tolist()}
@@ -0,0 +1,99 @@
+import json
+import logging
+import os
+import queue
+import threading
+from collections import deque
+from pathlib import Path
+
+
+class RingBufferHandler(logging.Handler):
+    """ A logging handler keeping the last `capacity` records in memory, without formatting them """
+    def __init__(self, capacity=1000):
+        super(RingBufferHandler, self).__init__()
+        self.records = deque(maxlen=capacity)
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class JsonLinesLogWriter(object):
+    """
+    Writes the log records of all test nodes in a single JSON lines file, one line per record with the node id.
+
+    Records are handed over by node with `write`, and are formatted and written by batches in a background thread, so
+    that test nodes do not wait for the disk. An index {node id: [byte offset, number of lines]} is written in
+    `<log_file>.index.json` when the writer is closed, see `read_node_records`.
+
+    A readable log file can also be requested for a node (e.g. for failed nodes only): it is written by the same thread.
+    """
+    FORMATTER = logging.Formatter("%(asctime)s %(levelname)-8s %(name)s: %(message)s")
+
+    def __init__(self, log_file):
+        self.log_file = Path(log_file)
+        self.log_file.parent.mkdir(parents=True, exist_ok=True)
+        self._index = dict()
+        self._queue = queue.Queue()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="bench-log-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, node_id, records, readable_file=None):
+        """ Appends the `records` of node `node_id` to the log file, and also to `readable_file` if provided """
+        self._queue.put((node_id, list(records), readable_file))
+
+    def close(self):
+        """ Waits for all records to be written, writes the index, and raises the error of the thread if any """
+        self._queue.put(None)
+        self._thread.join()
+        with open(str(self.log_file) + '.index.json', 'w') as f:
+            json.dump(self._index, f)
+        if self._error is not None:
+            raise self._error
+
+    def _run(self):
+        with self.log_file.open('wb') as f:
+            done = False
+            while not done:
+                # write all the nodes available at once
+                batch = [self._queue.get()]
+                while True:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                for item in batch:
+                    if item is None:
+                        done = True
+                        continue
+                    try:
+                        self._write_node(f, *item)
+                    except Exception as e:
+                        self._error = self._error or e
+                f.flush()
+
+    def _write_node(self, f, node_id, records, readable_file):
+        offset = f.tell()
+        lines = [json.dumps(dict(node=node_id, time=r.created, level=r.levelname, logger=r.name,
+                                 message=r.getMessage())) for r in records]
+        if lines:
+            f.write(('\n'.join(lines) + '\n').encode('utf-8'))
+        self._index.setdefault(node_id, []).append([offset, len(lines)])
+
+        if readable_file is not None:
+            Path(readable_file).parent.mkdir(parents=True, exist_ok=True)
+            with open(str(readable_file), 'w') as rf:
+                for r in records:
+                    rf.write(self.FORMATTER.format(r) + '\n')
+
+
+def read_node_records(log_file, node_id):
+    """ Returns the list of records (dicts) logged by `node_id` in the JSON lines `log_file`, using its index """
+    with open(str(log_file) + '.index.json') as f:
+        segments = json.load(f).get(node_id, [])
+    records = []
+    with open(str(log_file), 'rb') as f:
+        for offset, n_lines in segments:
+            f.seek(offset, os.SEEK_SET)
+            records += [json.loads(f.readline().decode('utf-8')) for _ in range(n_lines)]
+    return records
@@ -0,0 +1,175 @@
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+
+# the metrics computed by default
+DEFAULT_METRICS = ('cvrmse',)
+
+# number of points per row processed at once: the temporary buffers have this size
+DEFAULT_CHUNK_SIZE = 2 ** 14
+
+
+Metric = namedtuple("Metric", ('name', 'func', 'needs_abs_errors'))
+"""A metric computed by `func(stats)` from the `ErrorStats` of the predictions. Metrics with `needs_abs_errors` also
+need all the absolute errors to be kept (e.g. quantiles), the other ones only need sums accumulated in a single pass"""
+
+# the registry of the available metrics, by name
+METRICS = OrderedDict()
+
+
+def register_metric(name, func, needs_abs_errors=False):
+    """ Registers the metric `name`, computed by `func(stats)` from an `ErrorStats` """
+    METRICS[name] = Metric(name, func, needs_abs_errors)
+
+
+def check_metrics(names):
+    """ Raises a ValueError if some of the metric `names` are not registered """
+    unknown = [name for name in names if name not in METRICS]
+    if unknown:
+        raise ValueError("Unknown metric(s) %s. Available metrics: %s" % (", ".join(unknown), ", ".join(METRICS)))
+
+
+class ErrorStats(object):
+    """
+    The sufficient statistics of the prediction errors of one or several rows of predictions, accumulated in a single
+    pass over the data, chunk by chunk (see `update`), so that no temporary array larger than a chunk is allocated:
+
+     - `n`: the number of points,
+     - `sse`, `sae`, `max_abs_error`: the sum of squared errors, the sum of absolute errors and the max absolute error,
+     - `mean_y`, `var_y`: the mean and variance of the target, from sums shifted by its first value for accuracy,
+     - `abs_errors`: all the absolute errors, only kept if `keep_abs_errors` (`n_points` is then required).
+
+    Predictions are either a 1-D array or a stacked (n_rows, n_points) matrix, e.g. the predictions of several
+    challengers, to be scored against the same `y` (1-D) or against one row of `y` each. Statistics are arrays with one
+    value per row.
+    """
+    def __init__(self, keep_abs_errors=False, n_points=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        if keep_abs_errors and n_points is None:
+            raise ValueError("`n_points` is required to keep the absolute errors")
+        self.keep_abs_errors = keep_abs_errors
+        self.n_points = n_points
+        self.chunk_size = chunk_size
+        self.n = 0
+        self.sse = self.sae = self.max_abs_error = self.abs_errors = None
+        self._y_shift = self._sum_y = self._sum_y2 = None
+        self._buffer = None
+
+    def update(self, predictions, y):
+        """ Accumulates the errors of `predictions` with respect to `y` (the next points of the rows) """
+        predictions, y = _as_rows(predictions), _as_rows(y)
+        if self.sse is None:
+            self._init(predictions.shape[0], y)
+        n_rows, n = predictions.shape
+        for start in range(0, n, self.chunk_size):
+            stop = min(start + self.chunk_size, n)
+            if self.abs_errors is not None:
+                errors = self.abs_errors[:, self.n + start:self.n + stop]
+            else:
+                errors = self._buffer[:n_rows, :stop - start]
+            np.subtract(predictions[:, start:stop], y[:, start:stop], out=errors)
+            self.sse += np.einsum('ij,ij->i', errors, errors)
+            np.abs(errors, out=errors)
+            self.sae += errors.sum(axis=1)
+            np.maximum(self.max_abs_error, errors.max(axis=1), out=self.max_abs_error)
+
+            # the statistics of the target, shifted
+            shifted = self._buffer[n_rows:n_rows + y.shape[0], :stop - start]
+            np.subtract(y[:, start:stop], self._y_shift, out=shifted)
+            self._sum_y += shifted.sum(axis=1)
+            self._sum_y2 += np.einsum('ij,ij->i', shifted, shifted)
+        self.n += n
+
+    def _init(self, n_rows, y):
+        self.sse, self.sae = np.zeros(n_rows), np.zeros(n_rows)
+        self.max_abs_error = np.zeros(n_rows)
+        if self.keep_abs_errors:
+            self.abs_errors = np.empty((n_rows, self.n_points))
+        self._y_shift = y[:, :1].copy()
+        self._sum_y, self._sum_y2 = np.zeros(y.shape[0]), np.zeros(y.shape[0])
+        # the errors (if not kept) and the shifted target of a chunk
+        self._buffer = np.empty((n_rows + y.shape[0], self.chunk_size))
+
+    @property
+    def mean_y(self):
+        return self._y_shift[:, 0] + self._sum_y / self.n
+
+    @property
+    def var_y(self):
+        return self._sum_y2 / self.n - (self._sum_y / self.n) ** 2
+
+    def quantile_abs_error(self, q):
+        """ The quantile `q` (in [0, 1]) of the absolute errors of each row. Requires `keep_abs_errors` """
+        if self.abs_errors is None:
+            raise ValueError("The absolute errors were not kept")
+        return np.quantile(self.abs_errors[:, :self.n], q, axis=1)
+
+    def metrics(self, names):
+        """ Returns a dict with the value of each of the metrics `names` (an array with one value per row) """
+        return OrderedDict((name, METRICS[name].func(self)) for name in names)
+
+
+def compute_metrics(predictions, y, names=DEFAULT_METRICS, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Computes all the metrics `names` of `predictions` with respect to `y` in a single pass, see `ErrorStats`. Returns a
+    dict {name: value}, where values are floats if `predictions` is 1-D, and arrays with one value per row if it is a
+    stacked (n_rows, n_points) matrix.
+    """
+    check_metrics(names)
+    n_points = np.shape(predictions)[-1]
+    stats = ErrorStats(keep_abs_errors=any(METRICS[name].needs_abs_errors for name in names), n_points=n_points,
+                       chunk_size=chunk_size)
+    stats.update(predictions, y)
+    metrics = stats.metrics(names)
+    if np.ndim(predictions) == 1:
+        metrics = OrderedDict((name, float(value[0])) for name, value in metrics.items())
+    return metrics
+
+
+def _as_rows(a):
+    """ Returns `a` as a 2-D array of rows (a 1-D array becomes a single row) """
+    a = np.asarray(a, dtype=float)
+    return a.reshape(1, -1) if a.ndim == 1 else a
+
+
+# ------------- The available metrics ------------
+def rmse(stats):
+    """ Root mean squared error """
+    return np.sqrt(stats.sse / stats.n)
+
+
+def cvrmse(stats):
+    """ Coefficient of variation of the root mean squared error """
+    return rmse(stats) / stats.mean_y
+
+
+def mae(stats):
+    """ Mean absolute error """
+    return stats.sae / stats.n
+
+
+def r2(stats):
+    """ Coefficient of determination (undefined when the target is constant) """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 1 - stats.sse / (stats.n * stats.var_y)
+
+
+def max_error(stats):
+    """ Maximum absolute error """
+    return stats.max_abs_error.copy()
+
+
+def quantile_abs_error(q):
+    """ Returns the metric computing the quantile `q` (in [0, 1]) of the absolute error """
+    def metric(stats):
+        return stats.quantile_abs_error(q)
+    return metric
+
+
+register_metric('rmse', rmse)
+register_metric('cvrmse', cvrmse)
+register_metric('mae', mae)
+register_metric('r2', r2)
+register_metric('max_error', max_error)
+for _q in (50, 90, 99):
+    register_metric('q%i_abs_error' % _q, quantile_abs_error(_q / 100.), needs_abs_errors=True)
@@ -0,0 +1,113 @@
+import hashlib
+import os
+from collections import OrderedDict
+from copy import copy
+from pathlib import Path
+from uuid import uuid4
+
+import numpy as np
+
+from .results_store import ContentHasher, challenger_identity
+
+
+class FittedModelCache(object):
+    """
+    A content-addressed cache of fitted models, so that scoring a challenger again (e.g. with other metrics, or on new
+    test data) does not train it again.
+
+    Models are keyed by the challenger identity (its class and constructor parameters), the source code of the module
+    defining its class (e.g. its solvers), the numpy version, and the contents of the training dataset. Only their
+    compact state is cached (see `BenchmarkChallenger.get_fitted_state`, e.g. the polynomial coefficients), in two
+    tiers:
+
+     - a memory tier keeping the `capacity` most recently used states,
+     - an optional disk tier in `cache_dir`, with one `.npz` file per model.
+
+    The memory tier is not sent to worker processes: they share the disk tier only. Challengers whose
+    `get_fitted_state` returns None are never cached.
+    """
+    def __init__(self, cache_dir=None, capacity=256):
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else None
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._hasher = ContentHasher()
+
+    def __getstate__(self):
+        return dict(cache_dir=self.cache_dir, capacity=self.capacity)
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def key(self, challenger, dataset):
+        """ Returns the key of `challenger` fitted on `dataset`. Must be called before fitting """
+        h = hashlib.sha1()
+        for part in (challenger_identity(challenger), self._hasher.source_hash(type(challenger)), np.__version__,
+                     self._hasher.dataset_hash(dataset)):
+            h.update(part.encode('utf-8'))
+            h.update(b'\0')
+        return h.hexdigest()
+
+    def get(self, key):
+        """ Returns the fitted state cached for `key` (from memory, else from disk), or None """
+        state = self._memory.pop(key, None)
+        if state is None:
+            state = self._load(key)
+        if state is None:
+            self.misses += 1
+            return None
+        self._remember(key, state)
+        self.hits += 1
+        return state
+
+    def put(self, key, state):
+        """ Caches the fitted `state` for `key`, in memory and on disk """
+        state = {name: np.array(value) if isinstance(value, np.ndarray) else value for name, value in state.items()}
+        self._remember(key, state)
+        if self.cache_dir is not None:
+            self._save(key, state)
+
+    def fitted(self, challenger, dataset, fit=None):
+        """
+        Returns `(model, cached)`: `model` is a copy of the unfitted `challenger`, trained on `dataset` or restored from
+        the cache. A model that is not in the cache is trained with `fit(model)` (by default `model.fit(dataset.x,
+        dataset.y)`), then cached.
+        """
+        key = self.key(challenger, dataset)
+        model = copy(challenger)
+        state = self.get(key)
+        if state is not None:
+            model.set_fitted_state(state)
+            return model, True
+
+        if fit is None:
+            model.fit(dataset.x, dataset.y)
+        else:
+            fit(model)
+        state = model.get_fitted_state()
+        if state is not None:
+            self.put(key, state)
+        return model, False
+
+    def _remember(self, key, state):
+        self._memory[key] = state
+        while len(self._memory) > self.capacity:
+            self._memory.popitem(last=False)
+
+    def _load(self, key):
+        if self.cache_dir is None:
+            return None
+        try:
+            with np.load(str(self.cache_dir / ('%s.npz' % key)), allow_pickle=False) as f:
+                return {name: f[name].item() if f[name].ndim == 0 else f[name] for name in f.files}
+        except (IOError, ValueError):
+            return None
+
+    def _save(self, key, state):
+        """ Saves the state (without its None values) to a temporary file, then renames it """
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.cache_dir / ('.%s.%s' % (key, uuid4().hex))
+        with tmp_path.open('wb') as f:
+            np.savez(f, **{name: value for name, value in state.items() if value is not None})
+        os.replace(str(tmp_path), str(self.cache_dir / ('%s.npz' % key)))
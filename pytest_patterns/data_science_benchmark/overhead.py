@@ -0,0 +1,208 @@
+"""
+Benchmark of the benchmark: measures the overhead of the harness itself (pytest and pytest-cases collection, fixtures,
+logging, results table, synthesis...) by running the protocol with a no-op challenger on growing numbers of tiny
+datasets. Run it with
+
+    python -m pytest_patterns.data_science_benchmark.overhead --cases 10,100,1000
+
+The per-node durations of each phase are appended to a history file, and compared to the previous run in the same
+environment so that overhead regressions of the harness are caught.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+from pytest_cases import parametrize
+
+from .challengers_polyfit import BenchmarkChallenger
+from .datasets_polyfit import Dataset
+from .environment import environment_fingerprint, fingerprint_id
+
+
+# number of no-op cases (datasets) replacing the real challengers and datasets in the benchmark, e.g.
+# BENCH_OVERHEAD_CASES=1000. 0 (the default) runs the real benchmark. Set by `run_overhead_suite`
+overhead_cases = int(float(os.environ.get("BENCH_OVERHEAD_CASES", 0)))
+
+# the phases of the session whose durations are reported by the `OverheadRecorder`
+PHASES = ('collection', 'setup', 'call', 'teardown', 'synthesis')
+
+# the default numbers of cases of the suite
+DEFAULT_CASES = (10, 100, 1000, 10000, 100000)
+
+# the results of the previous runs of the suite, one JSON line per run
+overhead_history_file = Path(__file__).parent / ".bench_overhead_history.jsonl"
+
+# the benchmark module run by the suite
+test_module = Path(__file__).parent / "test_polyfit.py"
+
+
+# ------------- the no-op cases --------------
+class NoopChallenger(BenchmarkChallenger):
+    """ A challenger that does nothing, so that only the overhead of the harness is measured """
+    # the synthesis groups the challengers by degree
+    degree = 0
+
+    def fit(self, x, y):
+        pass
+
+    def predict(self, x):
+        return np.zeros(len(x))
+
+    def __repr__(self):
+        return "NoopChallenger()"
+
+
+def algo_noop():
+    """ The only challenger of the overhead suite """
+    return NoopChallenger()
+
+
+if overhead_cases:
+    @parametrize(id=range(overhead_cases))
+    def data_noop(id):
+        """ `overhead_cases` tiny datasets """
+        return Dataset(name="Noop-%i" % id, x=np.array([0., 1.]), y=np.array([1., 2.]))
+
+
+# ------------- measures in the benchmark session --------------
+class OverheadRecorder(object):
+    """
+    Accumulates the durations (s) of the phases of a benchmark session (`--bench-overhead-report`): the collection,
+    the setup, call and teardown of the benchmark nodes, and all phases of the synthesis node. `n_nodes` is the number
+    of benchmark nodes, and `session_s` the duration of the whole session.
+    """
+    def __init__(self):
+        self.durations = dict.fromkeys(PHASES, 0.)
+        self.bench_nodes = set()
+        self._start = perf_counter()
+
+    def add(self, phase, duration_s, node_id=None):
+        """ Adds `duration_s` to `phase`. `node_id` is the id of the benchmark node, if any """
+        self.durations[phase] += duration_s
+        if node_id is not None:
+            self.bench_nodes.add(node_id)
+
+    def report(self):
+        """ Returns the measures as a dict """
+        report = dict(n_nodes=len(self.bench_nodes), session_s=perf_counter() - self._start)
+        report.update(('%s_s' % phase, duration) for phase, duration in self.durations.items())
+        return report
+
+    def save(self, path):
+        with open(str(path), 'w') as f:
+            json.dump(self.report(), f)
+
+
+# ------------- the suite --------------
+def run_overhead_suite(all_n_cases=DEFAULT_CASES, pytest_args=()):
+    """
+    Runs the benchmark in a new pytest process with `n` no-op cases for each `n` of `all_n_cases`, and returns a table
+    with one row per `n`: the number of nodes and the mean overhead per node (ms) of each phase of `PHASES`, of the
+    pytest startup (before the session), of the rest of the session (`other_ms`, e.g. the hooks and the reporting
+    between the phases), and of the whole session (`overhead_ms`).
+
+    Each run takes place in a temporary directory where its synthesis files are written. `pytest_args` are added to
+    the command line of each run, e.g. `--bench-buffered-logs`.
+    """
+    rows = []
+    for n in all_n_cases:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            report_file = Path(tmp_dir) / "overhead.json"
+            cmd = [sys.executable, "-m", "pytest", str(test_module), "-q", "-p", "no:cacheprovider",
+                   "--bench-overhead-report", str(report_file),
+                   "--bench-durations", str(Path(tmp_dir) / "durations.json")] + list(pytest_args)
+            start = perf_counter()
+            process = subprocess.run(cmd, cwd=tmp_dir, env=dict(os.environ, BENCH_OVERHEAD_CASES=str(n)),
+                                     stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            wall_s = perf_counter() - start
+            if process.returncode != 0 or not report_file.exists():
+                raise RuntimeError("The overhead run with %i cases failed:\n%s"
+                                   % (n, process.stdout.decode('utf-8', 'replace')[-5000:]))
+            with report_file.open() as f:
+                report = json.load(f)
+
+        n_nodes = max(report['n_nodes'], 1)
+        row = dict(n_cases=n, n_nodes=report['n_nodes'], startup_ms=(wall_s - report['session_s']) * 1000 / n_nodes)
+        row.update(('%s_ms' % phase, report['%s_s' % phase] * 1000 / n_nodes) for phase in PHASES)
+        row['other_ms'] = report['session_s'] * 1000 / n_nodes - sum(row['%s_ms' % phase] for phase in PHASES)
+        row['overhead_ms'] = report['session_s'] * 1000 / n_nodes
+        rows.append(row)
+    return pd.DataFrame(rows).set_index('n_cases')
+
+
+def load_history(history_file=overhead_history_file):
+    """ Returns the list of the previous runs saved in `history_file` by `append_history` """
+    try:
+        with open(str(history_file)) as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except IOError:
+        return []
+
+
+def append_history(results_df, env_id, history_file=overhead_history_file):
+    """ Appends the `results_df` of `run_overhead_suite` in the environment `env_id` to `history_file` """
+    entry = dict(timestamp=datetime.now().replace(microsecond=0).isoformat(), env_id=env_id,
+                 results=results_df.reset_index().to_dict(orient='records'))
+    with open(str(history_file), 'a') as f:
+        f.write(json.dumps(entry) + "\n")
+
+
+def compare_to_history(results_df, history, env_id, max_slowdown=1.2):
+    """
+    Compares the overhead per node of `results_df` to the one of the last run of `history` in the same environment
+    `env_id` with the same number of cases. Returns a table with the old and new `overhead_ms`, their ratio, and
+    whether it is a `regression` (ratio above `max_slowdown`), one row per number of cases run before.
+    """
+    previous = dict()
+    for entry in history:
+        if entry['env_id'] == env_id:
+            previous.update((row['n_cases'], row['overhead_ms']) for row in entry['results'])
+    common = [n for n in results_df.index if n in previous]
+    report = pd.DataFrame(dict(old_overhead_ms=[previous[n] for n in common],
+                               new_overhead_ms=results_df.loc[common, 'overhead_ms']), index=common)
+    report.index.name = 'n_cases'
+    report['ratio'] = report['new_overhead_ms'] / report['old_overhead_ms']
+    report['regression'] = report['ratio'] > max_slowdown
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measures the overhead per node of the benchmark harness, with a "
+                                                 "no-op challenger on growing numbers of cases.")
+    parser.add_argument("--cases", default=",".join(str(n) for n in DEFAULT_CASES),
+                        help="Comma-separated numbers of cases (default %(default)s).")
+    parser.add_argument("--max-slowdown", type=float, default=1.2,
+                        help="Maximum accepted ratio between the overhead per node and the one of the previous run "
+                             "in the same environment (default %(default)s).")
+    parser.add_argument("--history", default=str(overhead_history_file),
+                        help="File where the results of the runs are appended (default %(default)s).")
+    parser.add_argument("pytest_args", nargs=argparse.REMAINDER,
+                        help="Options added to the pytest command line of each run, after '--'.")
+    args = parser.parse_args(argv)
+    pytest_args = args.pytest_args[1:] if args.pytest_args[:1] == ['--'] else args.pytest_args
+
+    env_id = fingerprint_id(environment_fingerprint())
+    results_df = run_overhead_suite([int(float(n)) for n in args.cases.split(',')], pytest_args)
+    report = compare_to_history(results_df, load_history(args.history), env_id, max_slowdown=args.max_slowdown)
+    append_history(results_df, env_id, args.history)
+
+    print(results_df.to_string(float_format="%.3f"))
+    if len(report):
+        print("\n" + report.to_string(float_format="%.3f"))
+
+    if report['regression'].any():
+        print("\n%i overhead regression(s) with respect to the previous run" % report['regression'].sum())
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,391 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from time import perf_counter
+
+import numpy as np
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # python < 3.8: arrays are pickled with each task instead
+    shared_memory = None
+
+from .datasets_polyfit import ChunkedDataset, MultiOutputDataset
+from .evaluation import evaluate, evaluate_batch, merge_cv_results
+from .metrics import DEFAULT_METRICS
+from .supervision import BudgetExceeded, run_supervised, supervision_context
+
+
+# the statuses of the pairs whose evaluation was not completed because of the `limits` of the engine
+BUDGET_STATUSES = ('timeout', 'oom', 'aborted')
+
+# the statuses of the pairs that were not completed because of their budget or of the `race` of the engine
+SKIPPED_STATUSES = BUDGET_STATUSES + ('pruned',)
+
+
+class BenchmarkEngine(object):
+    """
+    Executes the evaluation protocol on (challenger, dataset) pairs.
+
+    With `workers=1` (the default) each pair is evaluated immediately, in the test node. Otherwise pairs are
+    distributed on a pool of `workers` processes (`0` means one per cpu): `submit` returns immediately, and the
+    results row of each pair is filled when `join` is called, so `join` should be called before the results are
+    collected.
+
+    Datasets are copied only once in shared memory, the worker processes receive a light reference to them. The worker
+    processes are started with `supervision.supervision_context` ('forkserver' where available), since forking this
+    process could copy the locks held by its other threads (log writer, BLAS pools).
+
+    With `batch=True`, evaluation is also deferred to `join`: pairs are then grouped by challenger (same type and
+    string representation) and dataset length, and each group is evaluated at once with the batch API of the
+    challenger (`fit_batch`/`predict_batch`). Streaming datasets (`ChunkedDataset`) are never batched.
+
+    An optional `timing.TimingHarness` can be provided as `timer` to time the `fit` and `predict` phases. A
+    `profiling.PhaseProfiler` can also be provided for each pair in `submit`: profiled pairs are never batched.
+
+    If a `results_store.ResultsStore` is provided as `store`, pairs already evaluated in a previous run are not
+    evaluated again: their results are reloaded from the store (with `cached=True`). Results of the other pairs are
+    saved in the store.
+
+    If a `cross_validation.CrossValidation` is provided as `cv`, the pairs are cross-validated (and never batched). The
+    folds of each dataset length are computed and shared only once. In parallel, the repeats of a pair are evaluated
+    on distinct workers (except when timed or profiled).
+
+    The entries of the optional `run_info` dict (e.g. the id of the environment fingerprint) are added to the results of
+    each evaluated pair. They are saved in the store with the results, so reloaded results keep the ones of the run
+    that computed them.
+
+    If `supervision.ResourceLimits` are provided as `limits`, each pair is evaluated in its own supervised child
+    process, killed when it exceeds its time budget. A pair exceeding its time or memory budget gets the status
+    'timeout' or 'oom' in its results row instead of results, and with early abort the larger datasets of its challenger
+    are skipped (status 'aborted'). In parallel, up to `workers` child processes run at the same time. Supervised
+    pairs are never batched. Their results are saved in the store, except the ones with a status of `BUDGET_STATUSES`,
+    that are evaluated again in the next runs.
+
+    The names of the `metrics` computed for each pair are the ones of `metrics.METRICS` (the cv-rmse by default).
+
+    The results of a pair with a `MultiOutputDataset` are stored in one row per target (see `ResultsRow.split`), with
+    their test id suffixed with `::<target>` except for the first one. The duration of the pair is evenly split between
+    its targets. These pairs are never batched.
+
+    If a `model_cache.FittedModelCache` is provided as `model_cache`, the fitted models are reused from it instead of
+    being trained again, when possible (see `evaluation.evaluate`). Batched pairs do not use it.
+
+    If a `racing.ChallengerRace` is provided as `race`, the cv-rmse of each completed pair is recorded in it, and the
+    pairs of the challengers it pruned get the status 'pruned' instead of being evaluated (they are not saved in the
+    store). The time budget of the `timer` is then multiplied by the race `budget_factor`, so that the survivors get
+    the budget of the pruned challengers. In parallel, only the pairs completed when a pair is submitted are known to
+    the race; batched pairs are all evaluated in `join`, so they are never pruned.
+    """
+    def __init__(self, workers=1, batch=False, timer=None, store=None, cv=None, run_info=None, limits=None,
+                 metrics=DEFAULT_METRICS, model_cache=None, race=None):
+        self.workers = workers if workers > 0 else os.cpu_count()
+        self.batch = batch
+        self.timer = timer
+        self.store = store
+        self.cv = cv
+        self.run_info = run_info
+        self.limits = limits
+        self.metrics = tuple(metrics)
+        self.model_cache = model_cache
+        self.race = race
+        self._store_keys = dict()
+        self._race_keys = dict()
+        self._pool = None
+        self._queued = []
+        self._pending = []
+        self._shared_datasets = dict()
+        self._shared_blocks = []
+
+    @property
+    def is_parallel(self):
+        return self.workers > 1
+
+    def submit(self, challenger, dataset, results_row, profiler=None):
+        """ Evaluates `challenger` on `dataset` and stores the results in `results_row` (possibly later, see `join`)
+        """
+        if self.race is not None:
+            self._race_keys[id(results_row)] = (str(challenger), dataset.name)
+            # the results completed so far may prune this challenger
+            self._collect(done_only=True)
+
+        if self.store is not None:
+            key = self.store.key(challenger, dataset)
+            cached_results = self.store.get(key)
+            if cached_results is not None:
+                _update_rows(results_row, cached_results, cached=True)
+                self._record_race(results_row)
+                return
+            self._store_keys[id(results_row)] = key
+
+        if self.race is not None:
+            pruned = self.race.is_pruned(str(challenger))
+            if pruned is not None:
+                self._store_keys.pop(id(results_row), None)
+                self._race_keys.pop(id(results_row))
+                results_row.update(n_points=dataset_size(dataset), challenger=str(challenger), status='pruned',
+                                   duration_ms=0., error=pruned)
+                return
+        timer = self.race.scaled_timer(self.timer) if self.race is not None else self.timer
+
+        folds = None
+        if self.cv is not None and not isinstance(dataset, ChunkedDataset):
+            folds = self.cv.folds(len(dataset.x))
+
+        if self.limits is not None:
+            if self.is_parallel:
+                # the threads of the pool wait for the supervised child processes
+                future = self._get_pool().submit(self._evaluate_supervised, challenger, dataset, profiler, folds,
+                                                 timer)
+                self._pending.append(([future], [results_row]))
+            else:
+                self._fill(results_row, self._evaluate_supervised(challenger, dataset, profiler, folds, timer)[0])
+        elif self.batch and profiler is None and folds is None \
+                and not isinstance(dataset, (ChunkedDataset, MultiOutputDataset)):
+            self._queued.append((challenger, dataset, results_row))
+        elif self.is_parallel:
+            shared_dataset = self._share(dataset)
+            if folds is None:
+                futures = [self._get_pool().submit(_evaluate_in_worker, challenger, shared_dataset, timer,
+                                                   profiler, metrics=self.metrics, model_cache=self.model_cache)]
+            elif timer is None and profiler is None:
+                # one task per repeat, merged in `join`
+                shared_folds = self._share(folds)
+                futures = [self._get_pool().submit(_evaluate_in_worker, challenger, shared_dataset, None, None,
+                                                   shared_folds, [repeat], self.metrics)
+                           for repeat in range(folds.n_repeats)]
+            else:
+                futures = [self._get_pool().submit(_evaluate_in_worker, challenger, shared_dataset, timer,
+                                                   profiler, self._share(folds), metrics=self.metrics)]
+            self._pending.append((futures, [results_row]))
+        else:
+            start = perf_counter()
+            try:
+                results = evaluate(challenger, dataset, timer=timer, profiler=profiler, folds=folds,
+                                   metrics=self.metrics, model_cache=self.model_cache)
+            except Exception:
+                # the test node fails, and the challenger gets the worst cv-rmse on this dataset in the race
+                self._record_race(results_row)
+                raise
+            self._fill(results_row, results, duration_ms=(perf_counter() - start) * 1000)
+
+    def join(self):
+        """ Waits for all submitted pairs to be evaluated and fills their results rows """
+        # evaluate the queued pairs by batches
+        groups = dict()
+        for challenger, dataset, results_row in self._queued:
+            key = (type(challenger), str(challenger), len(dataset.x))
+            groups.setdefault(key, (challenger, [], []))
+            groups[key][1].append(dataset)
+            groups[key][2].append(results_row)
+        self._queued = []
+
+        for challenger, datasets, results_rows in groups.values():
+            if self.is_parallel:
+                future = self._get_pool().submit(_evaluate_batch_in_worker, challenger,
+                                                 [self._share(d) for d in datasets], self.timer, self.metrics)
+                self._pending.append(([future], results_rows))
+            else:
+                all_results = _evaluate_batch(challenger, datasets, self.timer, self.metrics)
+                for results_row, results in zip(results_rows, all_results):
+                    self._fill(results_row, results)
+
+        # collect the results of the worker processes
+        self._collect()
+
+    def _collect(self, done_only=False):
+        """ Fills the results rows of the pairs evaluated by the pool (only the completed ones if `done_only`) """
+        pending = []
+        for futures, results_rows in self._pending:
+            if done_only and not all(future.done() for future in futures):
+                pending.append((futures, results_rows))
+                continue
+            try:
+                all_results = [future.result() for future in futures]
+                if len(all_results) > 1:
+                    # the repeats of a cross-validation were evaluated separately
+                    all_results = [[merge_cv_results([results for (results,) in all_results])]]
+                for results_row, results in zip(results_rows, all_results[0]):
+                    self._fill(results_row, results)
+            except Exception as e:
+                for results_row in results_rows:
+                    self._store_keys.pop(id(results_row), None)
+                    results_row.update(status='failed', error="%s: %s" % (type(e).__name__, e))
+                    self._record_race(results_row)
+        self._pending = pending
+
+    def _evaluate_supervised(self, challenger, dataset, profiler, folds, timer):
+        """ Evaluates the pair in a supervised child process, unless its challenger already exceeded its budget on a
+        dataset that is not larger. Returns a list containing its results, or the status of the exceeded budget """
+        challenger_key = (type(challenger), str(challenger))
+        size = dataset_size(dataset)
+        exceeded = self.limits.should_abort(challenger_key, size)
+        if exceeded is not None:
+            return [dict(n_points=size, challenger=str(challenger), status='aborted', duration_ms=0.,
+                         error="Not evaluated: exceeded its budget (%s) on a dataset of %i points" % exceeded)]
+        start = perf_counter()
+        try:
+            return run_supervised(_evaluate_in_worker, (challenger, dataset, timer, profiler, folds, None,
+                                                        self.metrics, self.model_cache), self.limits)
+        except BudgetExceeded as e:
+            self.limits.record_exceeded(challenger_key, size, e.status)
+            return [dict(n_points=size, challenger=str(challenger), status=e.status, error=str(e),
+                         duration_ms=(perf_counter() - start) * 1000)]
+
+    def _fill(self, results_row, results, duration_ms=None):
+        """ Fills `results_row` with `results` and saves them in the store if needed.
+        `duration_ms` is the duration of the evaluation when `results` do not contain it already: it is only saved in
+        the store, since the test node duration is correct in that case (except for multi-output results, that are
+        split between several rows).
+        """
+        if self.run_info:
+            results = dict(results, **self.run_info)
+        if 'outputs' in results and 'duration_ms' not in results and duration_ms is not None:
+            results = dict(results, duration_ms=duration_ms)
+        key = self._store_keys.pop(id(results_row), None)
+        _update_rows(results_row, results, **(dict(cached=False) if key is not None else dict()))
+        self._record_race(results_row)
+        if key is None:
+            return
+        if results.get('status') in BUDGET_STATUSES:
+            # evaluated again in the next runs, possibly with other limits
+            return
+        if duration_ms is not None:
+            results = dict(results, duration_ms=duration_ms)
+        self.store.put(key, results)
+
+    def _record_race(self, results_row):
+        """ Records the cv-rmse of the pair of `results_row` (and of its other targets, if any) in the race, if any.
+        Pairs without cv-rmse (failed, or stopped because of their budget) count as the worst ones """
+        race_key = self._race_keys.pop(id(results_row), None)
+        if race_key is None:
+            return
+        challenger_key, dataset_name = race_key
+        for row in [results_row] + results_row.siblings:
+            target = row.get('target')
+            self.race.record(challenger_key, dataset_name if target is None else "%s::%s" % (dataset_name, target),
+                             row.get('cvrmse'))
+
+    def _get_pool(self):
+        if self._pool is None:
+            if self.limits is not None:
+                # each supervised pair runs in its own child process
+                self._pool = ThreadPoolExecutor(max_workers=self.workers)
+            else:
+                # as the supervised child processes, the workers are not forked from this process and its threads
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=supervision_context(__name__))
+        return self._pool
+
+    def close(self):
+        """ Joins, then shuts the pool down and releases the shared memory """
+        self.join()
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        for shm in self._shared_blocks:
+            shm.close()
+            shm.unlink()
+        self._shared_blocks = []
+        self._shared_datasets = dict()
+
+    def _share(self, dataset):
+        """ Returns a copy of `dataset` (or of `CVFolds`) where all arrays are replaced with references to shared
+        memory blocks """
+        try:
+            return self._shared_datasets[dataset.name]
+        except KeyError:
+            pass
+
+        if shared_memory is None:
+            shared = dataset
+        else:
+            shared = dataset._replace(**{field: self._share_array(value) for field, value in dataset._asdict().items()
+                                         if isinstance(value, np.ndarray)})
+        self._shared_datasets[dataset.name] = shared
+        return shared
+
+    def _share_array(self, arr):
+        shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+        self._shared_blocks.append(shm)
+        np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+        return SharedArray(shm.name, arr.shape, arr.dtype.str)
+
+
+def _update_rows(results_row, results, **values):
+    """ Sets the `results` and `values` in `results_row`, or for multi-output results (with `outputs`), in one row per
+    target """
+    outputs = results.get('outputs')
+    if outputs is None:
+        results_row.update(results, **values)
+        return
+    common = {k: v for k, v in results.items() if k != 'outputs'}
+    if 'duration_ms' in common:
+        common['duration_ms'] /= len(outputs)
+    test_id = results_row.get('test_id')
+    for i, (row, output) in enumerate(zip(results_row.split(len(outputs)), outputs)):
+        row.update(common, **dict(output, **values))
+        if i > 0 and test_id is not None:
+            row.update(test_id="%s::%s" % (test_id, output['target']))
+
+
+def dataset_size(dataset):
+    """ The number of points of `dataset`, streaming or not """
+    return dataset.n_points if isinstance(dataset, ChunkedDataset) else len(dataset.x)
+
+
+class SharedArray(object):
+    """ A picklable reference to a numpy array stored in a shared memory block """
+    __slots__ = ('shm_name', 'shape', 'dtype')
+
+    def __init__(self, shm_name, shape, dtype):
+        self.shm_name = shm_name
+        self.shape = shape
+        self.dtype = dtype
+
+
+# shared memory blocks attached in the current worker process, by name
+_attached_blocks = dict()
+
+
+def _attach(ref):
+    """ Returns a read-only view on the array referenced by `ref`, attaching its shared memory block only once """
+    try:
+        shm = _attached_blocks[ref.shm_name]
+    except KeyError:
+        shm = _attached_blocks[ref.shm_name] = shared_memory.SharedMemory(name=ref.shm_name)
+    arr = np.ndarray(ref.shape, dtype=ref.dtype, buffer=shm.buf)
+    arr.flags.writeable = False
+    return arr
+
+
+def _attach_arrays(dataset):
+    """ Replaces all shared arrays references in `dataset` (or `CVFolds`) with the arrays """
+    return dataset._replace(**{field: _attach(value) for field, value in dataset._asdict().items()
+                               if isinstance(value, SharedArray)})
+
+
+def _evaluate_in_worker(challenger, dataset, timer, profiler, folds=None, repeats=None, metrics=DEFAULT_METRICS,
+                        model_cache=None):
+    """ Runs the evaluation protocol in a worker process and returns a list containing its results """
+    start = perf_counter()
+    if folds is not None:
+        folds = _attach_arrays(folds)
+    results = evaluate(challenger, _attach_arrays(dataset), timer=timer, profiler=profiler, folds=folds,
+                       repeats=repeats, metrics=metrics, model_cache=model_cache)
+    # the duration of the test node is meaningless when evaluation is deferred: replace it with the evaluation's
+    results['duration_ms'] = (perf_counter() - start) * 1000
+    return [results]
+
+
+def _evaluate_batch_in_worker(challenger, datasets, timer, metrics=DEFAULT_METRICS):
+    """ Runs the batch evaluation protocol in a worker process and returns the list of results """
+    return _evaluate_batch(challenger, [_attach_arrays(d) for d in datasets], timer, metrics)
+
+
+def _evaluate_batch(challenger, datasets, timer, metrics=DEFAULT_METRICS):
+    """ Runs the batch evaluation protocol. The duration of the batch is evenly split between its datasets """
+    start = perf_counter()
+    all_results = evaluate_batch(challenger, datasets, timer=timer, metrics=metrics)
+    duration_ms = (perf_counter() - start) * 1000 / len(datasets)
+    for results in all_results:
+        results['duration_ms'] = duration_ms
+    return all_results
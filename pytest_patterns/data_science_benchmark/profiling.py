@@ -0,0 +1,82 @@
+import cProfile
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # windows
+    resource = None
+
+
+class PhaseProfiler(object):
+    """
+    Instruments the phases of the evaluation protocol (fit, predict, evaluate). For each phase it measures:
+
+     - the peak memory allocated by python and numpy during the phase (`<phase>_peak_mem_kb`), with `tracemalloc`,
+     - the peak resident set size of the process (`<phase>_peak_rss_kb`). On linux the peak is reset before each phase
+       so this is the peak during the phase, elsewhere it is the peak since the process started.
+
+    If `cprofile_prefix` is provided, a cProfile of each phase is also dumped in `<cprofile_prefix>.<phase>.prof`.
+    The profiler only holds its configuration so it can be sent to a worker process.
+    """
+    def __init__(self, cprofile_prefix=None):
+        self.cprofile_prefix = cprofile_prefix
+
+    @contextmanager
+    def phase(self, name, results):
+        """ A context manager instrumenting the phase `name`, and storing the measures in the `results` dict """
+        reset_peak_rss()
+        was_tracing = tracemalloc.is_tracing()
+        if not was_tracing:
+            tracemalloc.start()
+        elif hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        else:  # python < 3.9: restarting is the only way to reset the peak (the current traces are lost)
+            tracemalloc.stop()
+            tracemalloc.start()
+        profile = cProfile.Profile() if self.cprofile_prefix is not None else None
+        if profile is not None:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+                profile_file = Path("%s.%s.prof" % (self.cprofile_prefix, name))
+                profile_file.parent.mkdir(parents=True, exist_ok=True)
+                profile.dump_stats(str(profile_file))
+            results["%s_peak_mem_kb" % name] = tracemalloc.get_traced_memory()[1] / 1024
+            if not was_tracing:
+                tracemalloc.stop()
+            results["%s_peak_rss_kb" % name] = peak_rss_kb()
+
+
+@contextmanager
+def no_phase(name, results):
+    """ The context manager used for the phases when there is no profiler """
+    yield
+
+
+def reset_peak_rss():
+    """ Resets the peak resident set size of the process, when the OS supports it (linux) """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except (IOError, OSError):
+        pass
+
+
+def peak_rss_kb():
+    """ Returns the peak resident set size of the process in kB, or None if not available """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return float(line.split()[1])
+    except (IOError, OSError):
+        pass
+    if resource is not None:
+        # note: this is in bytes on macOS
+        return float(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+    return None
@@ -0,0 +1,115 @@
+from copy import copy
+
+import numpy as np
+
+try:
+    from math import comb
+except ImportError:  # python < 3.8
+    from math import factorial
+
+    def comb(n, k):
+        return factorial(n) // (factorial(k) * factorial(n - k))
+
+from .baseline import average_ranks
+
+
+class ChallengerRace(object):
+    """
+    Racing of the challengers over the datasets (F-race style): datasets are processed in rounds, and the challengers
+    that are significantly worse than the leader are dropped, so that the rest of the budget goes to the survivors.
+
+    The cv-rmse of each (challenger, dataset) pair is recorded with `record` as soon as it is known. A round is
+    complete when all the challengers still in the race have a result on its dataset. Each time a round completes,
+    once there are at least `min_rounds` of them:
+
+     - the leader is the challenger with the best (lowest) mean rank of absolute cv-rmse over the complete rounds (the
+       cv-rmse is negative when the mean of the target is),
+     - each other challenger is compared to the leader with a one-sided paired sign test on these rounds, and the
+       challengers that are worse are pruned with the Holm correction: the p-values are sorted, and the k-th smallest
+       one (from 0) must be lower than `alpha / (m - k)`, m being the number of comparisons.
+
+    The tests of the successive rounds are not corrected: `alpha` bounds the risk of wrongly pruning a challenger at
+    each round, not over the whole race. Pairs that failed or exceeded their budget count as the worst cv-rmse (`inf`).
+    Challengers are identified by their string representation.
+    """
+    def __init__(self, alpha=0.05, min_rounds=5):
+        self.alpha = alpha
+        self.min_rounds = min_rounds
+        self.scores = dict()
+        self.pruned = dict()
+        self._challengers = []
+        self._n_tested_rounds = 0
+
+    def add(self, challenger_key):
+        """ Registers a challenger entering the race (done by `record` otherwise) """
+        if challenger_key not in self.scores:
+            self.scores[challenger_key] = dict()
+            self._challengers.append(challenger_key)
+
+    @property
+    def alive(self):
+        """ The challengers that are still in the race, in order of arrival """
+        return [c for c in self._challengers if c not in self.pruned]
+
+    def is_pruned(self, challenger_key):
+        """ Returns the reason why the challenger was pruned, or None if it is still in the race """
+        return self.pruned.get(challenger_key)
+
+    def budget_factor(self):
+        """ The ratio between the number of challengers and the number of survivors: the budget of the pruned
+        challengers can be given to the survivors by multiplying theirs by this factor """
+        return float(len(self._challengers)) / max(len(self.alive), 1)
+
+    def scaled_timer(self, timer):
+        """ Returns a copy of the `timing.TimingHarness` `timer` with a time budget multiplied by `budget_factor` """
+        if timer is None or self.budget_factor() == 1.:
+            return timer
+        scaled = copy(timer)
+        scaled.max_time_s = timer.max_time_s * self.budget_factor()
+        return scaled
+
+    def record(self, challenger_key, dataset_key, cvrmse):
+        """ Records the cv-rmse of a pair (None or NaN if it failed), and prunes challengers if a round is complete """
+        self.add(challenger_key)
+        if cvrmse is None or np.isnan(cvrmse):
+            cvrmse = np.inf
+        self.scores[challenger_key][dataset_key] = abs(cvrmse)
+        if challenger_key not in self.pruned:
+            self._prune()
+
+    def _prune(self):
+        alive = self.alive
+        rounds = [d for d in self.scores[alive[0]] if all(d in self.scores[c] for c in alive[1:])]
+        if len(alive) < 2 or len(rounds) < self.min_rounds or len(rounds) == self._n_tested_rounds:
+            return
+        # only test once per completed round
+        self._n_tested_rounds = len(rounds)
+
+        # (challengers, rounds) absolute cv-rmse, and their mean ranks within each round (ties get the average rank)
+        values = np.array([[self.scores[c][d] for d in rounds] for c in alive])
+        ranks = np.array([average_ranks(column) for column in values.T]).T
+        leader = int(np.argmin(ranks.mean(axis=1)))
+        tests = []
+        for i, challenger_key in enumerate(alive):
+            if i != leader:
+                worse = int((values[i] > values[leader]).sum())
+                better = int((values[i] < values[leader]).sum())
+                tests.append((sign_test_greater_p(worse, better), worse, challenger_key))
+
+        # Holm step-down correction for the comparisons to the leader
+        tests.sort(key=lambda test: test[0])
+        for k, (p_value, worse, challenger_key) in enumerate(tests):
+            if p_value >= self.alpha / (len(tests) - k):
+                break
+            self.pruned[challenger_key] = "Pruned after %i rounds: worse than %s on %i of them (sign test p=%.3g, " \
+                                          "Holm-corrected level %.3g)" \
+                                          % (len(rounds), alive[leader], worse, p_value, self.alpha / (len(tests) - k))
+
+
+def sign_test_greater_p(n_greater, n_smaller):
+    """ One-sided p-value of the sign test, for the alternative "the first value of the pairs tends to be greater":
+    probability of at least `n_greater` successes out of `n_greater + n_smaller` fair coin flips (ties are excluded) """
+    n = n_greater + n_smaller
+    if n == 0:
+        return 1.
+    return sum(comb(n, k) for k in range(n_greater, n + 1)) / 2. ** n
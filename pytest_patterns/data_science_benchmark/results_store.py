@@ -0,0 +1,114 @@
+import hashlib
+import inspect
+import json
+import os
+import pickle
+from pathlib import Path
+from uuid import uuid4
+
+import numpy as np
+
+
+class ResultsStore(object):
+    """
+    A persistent store of the results of the (challenger, dataset) pairs, so that a new run only evaluates the pairs
+    for which something changed since the previous run.
+
+    Results are keyed by:
+     - the challenger identity: its class and the scalar attributes set in its constructor (e.g. `degree`),
+     - the source code of the module defining the challenger class, and of the modules of the evaluation protocol
+   (`protocol_modules`: evaluation, metrics, timing, cross-validation and profiling),
+     - the contents of the dataset (its arrays),
+     - an optional `salt` describing the options that change the results (e.g. whether timing is enabled).
+
+    Each entry is a pickle file in `store_dir`.
+    """
+    def __init__(self, store_dir, salt=""):
+        self.store_dir = Path(store_dir)
+        self.salt = salt
+        self._hasher = ContentHasher()
+
+    def key(self, challenger, dataset):
+        """ Returns the key of the results of `challenger` on `dataset`. Must be called before fitting """
+        h = hashlib.sha1()
+        for part in ([self.salt, challenger_identity(challenger), self._hasher.source_hash(type(challenger))]
+                     + [self._hasher.source_hash(module) for module in protocol_modules()]
+                     + [self._hasher.dataset_hash(dataset)]):
+            h.update(part.encode('utf-8'))
+            h.update(b'\0')
+        return h.hexdigest()
+
+    def get(self, key):
+        """ Returns the stored results for `key`, or None """
+        try:
+            with (self.store_dir / ('%s.pkl' % key)).open('rb') as f:
+                return pickle.load(f)
+        except (IOError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def put(self, key, results):
+        """ Stores `results` for `key`. The file is written then renamed, so that readers never see a partial file """
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.store_dir / ('.%s.%s' % (key, uuid4().hex))
+        with tmp_path.open('wb') as f:
+            pickle.dump(results, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(str(tmp_path), str(self.store_dir / ('%s.pkl' % key)))
+
+    def put_environment(self, env_id, fingerprint):
+        """ Saves the environment `fingerprint` of the results with `env_id`, in `environments/<env_id>.json` """
+        env_dir = self.store_dir / 'environments'
+        env_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = env_dir / ('.%s.%s' % (env_id, uuid4().hex))
+        with tmp_path.open('w') as f:
+            json.dump(fingerprint, f, indent=2)
+        os.replace(str(tmp_path), str(env_dir / ('%s.json' % env_id)))
+
+
+def protocol_modules():
+    """ The modules of the evaluation protocol: the results of all pairs change when their source code changes """
+    from . import cross_validation, evaluation, metrics, profiling, timing
+    return evaluation, metrics, timing, cross_validation, profiling
+
+
+class ContentHasher(object):
+    """ Computes the hashes of the source code of modules and of the contents of datasets, once per session """
+    def __init__(self):
+        self._source_hashes = dict()
+        self._dataset_hashes = dict()
+
+    def source_hash(self, obj):
+        """ Hash of the source file of the module defining `obj` (a class or a module), computed once per session """
+        source_file = inspect.getsourcefile(obj)
+        try:
+            return self._source_hashes[source_file]
+        except KeyError:
+            with open(source_file, 'rb') as f:
+                h = self._source_hashes[source_file] = hashlib.sha1(f.read()).hexdigest()
+            return h
+
+    def dataset_hash(self, dataset):
+        """ Hash of the contents of `dataset`, computed once per dataset and session """
+        cache_key = (dataset.name, id(dataset))
+        try:
+            return self._dataset_hashes[cache_key][1]
+        except KeyError:
+            pass
+        h = hashlib.sha1(dataset.name.encode('utf-8'))
+        for value in dataset[1:]:
+            if isinstance(value, np.ndarray):
+                h.update(value.dtype.str.encode('utf-8'))
+                h.update(np.ascontiguousarray(value).data)
+            else:
+                # e.g. the size and the source of the chunks of a streaming dataset
+                h.update(repr(value).encode('utf-8'))
+        # keep a reference to the dataset so that its id is not reused in this session
+        self._dataset_hashes[cache_key] = (dataset, h.hexdigest())
+        return self._dataset_hashes[cache_key][1]
+
+
+def challenger_identity(challenger):
+    """ A string identifying a challenger: its class and the scalar attributes set in its constructor """
+    cls = type(challenger)
+    params = sorted((k, v) for k, v in vars(challenger).items()
+                    if v is None or isinstance(v, (bool, int, float, str)))
+    return "%s.%s(%s)" % (cls.__module__, cls.__qualname__, ", ".join("%s=%r" % p for p in params))
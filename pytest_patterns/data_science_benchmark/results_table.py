@@ -0,0 +1,296 @@
+import pickle
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+class ResultsTable(object):
+    """
+    An append-only columnar table of results, with one row per test node.
+
+    Each column is a preallocated typed numpy array, grown by doubling its capacity, so that appending a row or setting
+    a value is O(1) and holds no python object per value:
+
+     - floats, integers and booleans are stored in a float64, int64 or bool array, with a validity mask (so that a
+       measured NaN is not a missing value),
+     - strings are dictionary-encoded: an int32 array of codes, and the list of distinct strings,
+     - other values (e.g. the lists of timing samples) are stored in an object array.
+
+    A column is created when a value is first set, and its type is the one of this value. An integer column receiving
+    a float is converted to float, a string column receiving a non-string is converted to object.
+
+    Fitted models are not kept in the table: a 'model' value is stored as its string representation in the 'challenger'
+    column. If `models_dir` is provided, the model is also pickled in `<models_dir>/<row>.pkl` (column 'model_file').
+
+    `to_pandas` returns a DataFrame whose columns are views on the arrays whenever possible. Its rows are in the order
+    of `append`, except that the rows added with `append_sibling` follow the row they were added for, so that the
+    order does not depend on when the siblings were added (e.g. by a worker pool). Columns with missing values
+    use the pandas nullable dtypes (Float64, Int64, boolean), where missing values are `pd.NA`.
+    """
+    def __init__(self, models_dir=None, capacity=1024):
+        self.models_dir = Path(models_dir) if models_dir is not None else None
+        self._capacity = capacity
+        self._n_rows = 0
+        self._columns = dict()
+        self._parents = dict()
+
+    def __len__(self):
+        return self._n_rows
+
+    def append(self, **values):
+        """ Appends a new row with the given values, and returns it as a `ResultsRow` """
+        if self._n_rows == self._capacity:
+            self._capacity *= 2
+            for column in self._columns.values():
+                column.grow(self._capacity)
+        row = ResultsRow(self, self._n_rows)
+        self._n_rows += 1
+        self.update(row.index, values)
+        return row
+
+    def append_sibling(self, index, **values):
+        """ Same as `append`, for a new row that follows row `index` (and its previous siblings) in `to_pandas` """
+        row = self.append(**values)
+        self._parents[row.index] = index
+        return row
+
+    def row_order(self):
+        """ Returns the order of the rows in `to_pandas` (an array of row indices), or None if it is the order of
+        `append` """
+        if not self._parents:
+            return None
+        siblings = dict()
+        for index, parent in sorted(self._parents.items()):
+            siblings.setdefault(parent, []).append(index)
+        order = []
+        for index in range(self._n_rows):
+            if index not in self._parents:
+                order.append(index)
+                order.extend(siblings.get(index, ()))
+        return np.array(order)
+
+    def update(self, index, values, overwrite=True):
+        """ Sets the `values` (a dict) of row `index`. With `overwrite=False`, values already set are not modified """
+        values = dict(values)
+        model = values.pop('model', None)
+        if model is not None:
+            values['challenger'] = str(model)
+            if self.models_dir is not None:
+                values['model_file'] = self._save_model(index, model)
+
+        for name, value in values.items():
+            column = self._columns.get(name)
+            if column is None:
+                if value is None:
+                    continue
+                column = self._columns[name] = new_column(value, self._capacity)
+            elif not overwrite and column.is_set(index):
+                continue
+            self._columns[name] = column = column.accepting(value)
+            column.set(index, value)
+
+    def get(self, index, name):
+        """ Returns the value of column `name` in row `index`, or None if it is not set """
+        column = self._columns.get(name)
+        return column.get(index) if column is not None and column.is_set(index) else None
+
+    def row_values(self, index):
+        """ Returns the values set in row `index`, as a dict """
+        return {name: column.get(index) for name, column in self._columns.items() if column.is_set(index)}
+
+    def to_pandas(self, index='test_id'):
+        """ Returns the table as a DataFrame indexed by column `index` """
+        df = pd.DataFrame({name: column.to_pandas(self._n_rows) for name, column in self._columns.items()},
+                          copy=False)
+        order = self.row_order()
+        if order is not None:
+            df = df.iloc[order].reset_index(drop=True)
+        if index in df.columns:
+            df = df.set_index(index)
+            df.index = df.index.astype(str)
+        return df
+
+    def _save_model(self, index, model):
+        self.models_dir.mkdir(parents=True, exist_ok=True)
+        model_file = self.models_dir / ('%i.pkl' % index)
+        with model_file.open('wb') as f:
+            pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL)
+        return str(model_file)
+
+
+class ResultsRow(object):
+    """ A row of a `ResultsTable`, where the results of a test node are stored.
+    The results of the other targets of a multi-output dataset are stored in the `siblings` rows, see `split` """
+    __slots__ = ('table', 'index', 'siblings')
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+        self.siblings = []
+
+    def split(self, n_rows):
+        """ Returns `n_rows` rows for the same test node: this row, and new `siblings` rows initialized with a copy of
+        its values (only the first time) """
+        if not self.siblings and n_rows > 1:
+            values = self.table.row_values(self.index)
+            self.siblings = [self.table.append_sibling(self.index, **values) for _ in range(n_rows - 1)]
+        return [self] + self.siblings
+
+    def update(self, *args, **kwargs):
+        """ Sets values in this row, with the same signature as `dict.update` """
+        self.table.update(self.index, dict(*args, **kwargs))
+
+    def update_missing(self, *args, **kwargs):
+        """ Same as `update` but only sets the values that are not set yet """
+        self.table.update(self.index, dict(*args, **kwargs), overwrite=False)
+
+    def get(self, name):
+        return self.table.get(self.index, name)
+
+
+def new_column(value, capacity):
+    """ Returns a new empty column suitable for `value` """
+    if isinstance(value, (bool, np.bool_)):
+        return MaskedColumn(np.bool_, capacity)
+    elif isinstance(value, (int, np.integer)):
+        return MaskedColumn(np.int64, capacity)
+    elif isinstance(value, (float, np.floating)):
+        return MaskedColumn(np.float64, capacity)
+    elif isinstance(value, str):
+        return StringColumn(capacity)
+    else:
+        return ObjectColumn(capacity)
+
+
+class MaskedColumn(object):
+    """ A float64, int64 or bool column, with a validity mask """
+    def __init__(self, dtype, capacity):
+        self.values = np.zeros(capacity, dtype=dtype)
+        self.mask = np.zeros(capacity, dtype=bool)
+
+    def grow(self, capacity):
+        values, mask = np.zeros(capacity, dtype=self.values.dtype), np.zeros(capacity, dtype=bool)
+        values[:len(self.values)] = self.values
+        mask[:len(self.mask)] = self.mask
+        self.values, self.mask = values, mask
+
+    def __len__(self):
+        return len(self.values)
+
+    def accepting(self, value):
+        if value is None:
+            return self
+        elif isinstance(value, (bool, np.bool_)) or self.values.dtype == np.bool_:
+            # booleans are not mixed with numbers
+            if isinstance(value, (bool, np.bool_)) and self.values.dtype == np.bool_:
+                return self
+        elif isinstance(value, (int, np.integer)):
+            return self
+        elif isinstance(value, (float, np.floating)):
+            # an int64 column receiving a float is converted to float64
+            if self.values.dtype == np.int64:
+                self.values = self.values.astype(np.float64)
+            return self
+        return ObjectColumn.from_column(self)
+
+    def is_set(self, index):
+        return self.mask[index]
+
+    def set(self, index, value):
+        self.mask[index] = value is not None
+        if value is not None:
+            self.values[index] = value
+
+    def get(self, index):
+        return self.values[index].item()
+
+    def to_pandas(self, n_rows):
+        values, mask = self.values[:n_rows], self.mask[:n_rows]
+        if mask.all():
+            return pd.Series(values, copy=False)
+        elif self.values.dtype == np.bool_:
+            return pd.Series(pd.arrays.BooleanArray(values, ~mask))
+        elif self.values.dtype == np.float64:
+            return pd.Series(pd.arrays.FloatingArray(values, ~mask))
+        return pd.Series(pd.arrays.IntegerArray(values, ~mask))
+
+
+class StringColumn(object):
+    """ A dictionary-encoded string column: int32 codes (-1 for missing values), and the list of distinct strings """
+    def __init__(self, capacity):
+        self.codes = np.full(capacity, -1, dtype=np.int32)
+        self.categories = []
+        self._category_codes = dict()
+
+    def grow(self, capacity):
+        codes = np.full(capacity, -1, dtype=np.int32)
+        codes[:len(self.codes)] = self.codes
+        self.codes = codes
+
+    def __len__(self):
+        return len(self.codes)
+
+    def accepting(self, value):
+        return self if value is None or isinstance(value, str) else ObjectColumn.from_column(self)
+
+    def is_set(self, index):
+        return self.codes[index] >= 0
+
+    def set(self, index, value):
+        if value is None:
+            self.codes[index] = -1
+            return
+        try:
+            code = self._category_codes[value]
+        except KeyError:
+            code = self._category_codes[value] = len(self.categories)
+            self.categories.append(value)
+        self.codes[index] = code
+
+    def get(self, index):
+        return self.categories[self.codes[index]]
+
+    def to_pandas(self, n_rows):
+        return pd.Series(pd.Categorical.from_codes(self.codes[:n_rows], categories=self.categories))
+
+
+class ObjectColumn(object):
+    """ A column of arbitrary python objects. Missing values are None """
+    def __init__(self, capacity):
+        self.values = np.full(capacity, None, dtype=object)
+        self.mask = np.zeros(capacity, dtype=bool)
+
+    @classmethod
+    def from_column(cls, column):
+        """ Converts a typed column into an object column """
+        converted = cls(len(column))
+        for index in range(len(converted.values)):
+            if column.is_set(index):
+                converted.set(index, column.get(index))
+        return converted
+
+    def grow(self, capacity):
+        values, mask = np.full(capacity, None, dtype=object), np.zeros(capacity, dtype=bool)
+        values[:len(self.values)] = self.values
+        mask[:len(self.mask)] = self.mask
+        self.values, self.mask = values, mask
+
+    def __len__(self):
+        return len(self.values)
+
+    def accepting(self, value):
+        return self
+
+    def is_set(self, index):
+        return self.mask[index]
+
+    def set(self, index, value):
+        self.mask[index] = value is not None
+        self.values[index] = value
+
+    def get(self, index):
+        return self.values[index]
+
+    def to_pandas(self, n_rows):
+        return pd.Series(self.values[:n_rows], copy=False)
@@ -0,0 +1,129 @@
+import json
+import os
+import pickle
+from pathlib import Path
+from uuid import uuid4
+from warnings import warn
+
+import numpy as np
+import pandas as pd
+
+
+# the default estimated duration (ms) of a test node that was never run, when no other node was run either
+DEFAULT_DURATION_MS = 1000.
+
+
+def parse_shard(shard):
+    """ Parses a shard specification 'K/N' (1 <= K <= N) into the 0-based shard index and the number of shards """
+    try:
+        k, n = (int(part) for part in shard.split('/'))
+    except ValueError:
+        raise ValueError("Invalid shard %r, it should be 'K/N' with 1 <= K <= N" % shard)
+    if not 1 <= k <= n:
+        raise ValueError("Invalid shard %r, it should be 'K/N' with 1 <= K <= N" % shard)
+    return k - 1, n
+
+
+def partition(test_ids, durations, n_shards):
+    """
+    Partitions the `test_ids` into `n_shards` lists with balanced total estimated durations. The duration of each test
+    id is read from the `durations` dict (ms, e.g. the ones of the previous run). Unknown durations are estimated with
+    the median of the known ones.
+
+    Tests are assigned from the longest to the shortest, each one to the shard with the smallest total so far. The
+    result only depends on the arguments, so all the machines running the shards compute the same partition as long as
+    they collect the same test ids and use the same `durations`.
+    """
+    known = [durations[t] for t in test_ids if t in durations]
+    default = float(np.median(known)) if known else DEFAULT_DURATION_MS
+    costs = sorted(((durations.get(t, default), t) for t in test_ids), key=lambda c: (-c[0], c[1]))
+
+    shards = [[] for _ in range(n_shards)]
+    totals = np.zeros(n_shards)
+    for cost, test_id in costs:
+        i = int(np.argmin(totals))
+        shards[i].append(test_id)
+        totals[i] += cost
+    return shards
+
+
+def load_durations(durations_file):
+    """ Loads the {test id: duration (ms)} dict saved by `save_durations`, or an empty dict """
+    try:
+        with open(str(durations_file)) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return dict()
+
+
+def save_durations(durations_file, results_df):
+    """ Updates the durations file with the `duration_ms` of the rows of `results_df` (indexed by test id). The rows of
+    the targets of a multi-output dataset (`<test id>::<target>`) are summed into the duration of their test node """
+    durations = load_durations(durations_file)
+    node_durations = results_df['duration_ms'].dropna().groupby(lambda t: t.split('::')[0]).sum()
+    durations.update({t: float(d) for t, d in node_durations.items()})
+    _atomic_write(durations_file, json.dumps(durations).encode('utf-8'))
+
+
+def save_shard(shard_file, shard, n_shards, test_ids, environment, results_df, collected_ids=None):
+    """ Saves the partial results `results_df` of shard `shard` (0-based) out of `n_shards`, with the list of the
+    `test_ids` that were assigned to it, the `environment` fingerprint of the machine, and the `collected_ids` of all
+    the shards in collection order """
+    contents = dict(shard=shard, n_shards=n_shards, test_ids=list(test_ids), environment=environment,
+                    results=results_df, collected_ids=list(collected_ids) if collected_ids is not None else None)
+    _atomic_write(shard_file, pickle.dumps(contents, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def merge_shards(shard_files):
+    """
+    Merges the partial results of the `shard_files` into a single results table, as the one of a run without sharding:
+    the rows are in the order of collection of their test ids (the rows of the other targets of a multi-output dataset,
+    `<test id>::<target>`, follow the one of their test id). Raises a ValueError if the files do not belong to the
+    same partition, or if a shard is present twice. Warns if shards or test ids are missing.
+    """
+    shards = dict()
+    for shard_file in shard_files:
+        with open(str(shard_file), 'rb') as f:
+            contents = pickle.load(f)
+        n_shards = contents['n_shards']
+        if shards and n_shards != next(iter(shards.values()))['n_shards']:
+            raise ValueError("%s is a shard of a partition in %i shards, other files have %i shards"
+                             % (shard_file, n_shards, next(iter(shards.values()))['n_shards']))
+        if contents['shard'] in shards:
+            raise ValueError("Shard %i/%i is present twice" % (contents['shard'] + 1, n_shards))
+        shards[contents['shard']] = contents
+    if not shards:
+        raise ValueError("No shard files to merge")
+
+    n_shards = next(iter(shards.values()))['n_shards']
+    missing_shards = sorted(set(range(n_shards)) - set(shards))
+    if missing_shards:
+        warn("Missing shard(s) %s out of %i" % (", ".join("%i" % (s + 1) for s in missing_shards), n_shards))
+
+    merged = pd.concat([shards[s]['results'] for s in sorted(shards)], sort=False)
+    missing = [t for s in sorted(shards) for t in shards[s]['test_ids'] if t not in merged.index]
+    if missing:
+        warn("No results for %i test(s) assigned to the shards, e.g. %s" % (len(missing), missing[0]))
+    if merged.index.has_duplicates:
+        raise ValueError("Some tests were run in several shards, e.g. %s" % merged.index[merged.index.duplicated()][0])
+
+    collected_ids = next(iter(shards.values())).get('collected_ids')
+    if collected_ids is not None:
+        positions = dict((t, i) for i, t in enumerate(collected_ids))
+        order = [positions.get(t.split('::')[0], len(positions)) for t in merged.index]
+        merged = merged.iloc[np.argsort(order, kind='mergesort')]
+    return merged
+
+
+def shard_file_name(shard, n_shards):
+    """ The name of the partial results file of shard `shard` (0-based) out of `n_shards` """
+    return "polyfit_bench_shard-%iof%i.pkl" % (shard + 1, n_shards)
+
+
+def _atomic_write(path, data):
+    """ Writes to a temporary file then renames it, so that readers never see a partial file """
+    path = Path(path)
+    tmp_path = path.with_name('.%s.%s' % (path.name, uuid4().hex))
+    with tmp_path.open('wb') as f:
+        f.write(data)
+    os.replace(str(tmp_path), str(path))
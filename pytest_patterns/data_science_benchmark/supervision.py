@@ -0,0 +1,210 @@
+import multiprocessing
+import os
+import sys
+import threading
+from time import sleep
+
+try:
+    import resource
+except ImportError:  # windows
+    resource = None
+
+
+class ResourceLimits(object):
+    """
+    The budgets of the evaluation of a (challenger, dataset) pair: a wall-clock `timeout_s` and a `max_memory_mb`
+    (growth of the memory of the process during the evaluation, see `run_supervised`). `None` means no limit.
+
+    With `early_abort=True`, once a challenger exceeded a budget on a dataset, it is not evaluated on the datasets that
+    are at least as large: see `should_abort` and `record_exceeded`. This only saves time if the smaller datasets are
+    evaluated first: pairs are submitted in the collection order of pytest, which is by increasing size for the
+    synthetic datasets, but not for the csv files (by path) nor across the kinds of datasets. In parallel, a pair is
+    only aborted if the smaller dataset had exceeded its budget when the pair started. Larger datasets evaluated before
+    are not aborted: they are evaluated with their own budget.
+    """
+    def __init__(self, timeout_s=None, max_memory_mb=None, early_abort=True):
+        self.timeout_s = timeout_s
+        self.max_memory_mb = max_memory_mb
+        self.early_abort = early_abort
+        self._exceeded = dict()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        return dict(timeout_s=self.timeout_s, max_memory_mb=self.max_memory_mb, early_abort=self.early_abort)
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def should_abort(self, challenger_key, size):
+        """ Returns the (status, size) that the challenger exceeded on a dataset not larger than `size`, or None """
+        with self._lock:
+            exceeded = self._exceeded.get(challenger_key)
+        if self.early_abort and exceeded is not None and exceeded[1] <= size:
+            return exceeded
+        return None
+
+    def record_exceeded(self, challenger_key, size, status):
+        """ Records that the challenger exceeded its budget (`status`) on a dataset of `size` points """
+        with self._lock:
+            exceeded = self._exceeded.get(challenger_key)
+            if exceeded is None or size < exceeded[1]:
+                self._exceeded[challenger_key] = (status, size)
+
+
+class BudgetExceeded(Exception):
+    """ Raised when an evaluation is not completed because of its budget. `status` is 'timeout', 'oom' or 'aborted' """
+    def __init__(self, status, message):
+        super(BudgetExceeded, self).__init__(message)
+        self.status = status
+
+
+def run_supervised(func, args, limits):
+    """
+    Runs `func(*args)` in a child process with the `limits` of a `ResourceLimits`, and returns its result. The child
+    process is killed if it is still running after `limits.timeout_s`.
+
+    The memory budget is the growth of the resident set size (RSS) of the child during `func`, polled every
+    `RSS_POLL_INTERVAL_S` by a thread of the child (linux): a shorter peak may be missed. Elsewhere on unix it falls
+    back to limiting the growth of the address space (`RLIMIT_AS`), which also counts the memory that is only reserved
+    (e.g. by the thread stacks and arenas of BLAS and OpenMP), so that small budgets may fail healthy evaluations.
+
+    The child is not forked from the current process, whose other threads (logging, background writers, BLAS pools)
+    may hold locks that would never be released in the child: it is started with the 'forkserver' method (or 'spawn'
+    where not available), so `func` and `args` must be picklable. See `supervision_context`.
+
+    Raises a `BudgetExceeded` with status 'timeout' or 'oom' if a budget is exceeded. Other exceptions raised by `func`
+    are raised again.
+    """
+    ctx = supervision_context(func.__module__)
+    parent_conn, child_conn = ctx.Pipe(duplex=False)
+    process = ctx.Process(target=_supervised_child, args=(child_conn, func, args, limits.max_memory_mb))
+    process.start()
+    child_conn.close()
+    try:
+        if not parent_conn.poll(limits.timeout_s):
+            raise BudgetExceeded('timeout', "Evaluation did not complete in %ss" % limits.timeout_s)
+        try:
+            outcome, payload = parent_conn.recv()
+        except EOFError:
+            # the child died without sending anything, e.g. killed by the OS out-of-memory killer
+            process.join()
+            if limits.max_memory_mb is not None:
+                raise BudgetExceeded('oom', "Evaluation process died (exit code %s), probably out of memory"
+                                     % process.exitcode)
+            raise RuntimeError("Evaluation process died (exit code %s)" % process.exitcode)
+    finally:
+        if process.is_alive():
+            process.kill()
+        process.join()
+        parent_conn.close()
+
+    if outcome == 'oom':
+        raise BudgetExceeded('oom', "Evaluation exceeded the memory budget of %s MB: %s"
+                             % (limits.max_memory_mb, payload))
+    elif outcome == 'error':
+        raise payload
+    return payload
+
+
+# the start method of the supervised child processes, once initialized by `supervision_context`
+_supervision_ctx = None
+_supervision_ctx_lock = threading.Lock()
+
+
+def supervision_context(preload_module):
+    """
+    Returns the multiprocessing context of the supervised child processes (and of the worker processes of the
+    `parallel.BenchmarkEngine`). With 'forkserver', the server is started
+    the first time, from a single-threaded process that imports `preload_module` (e.g. numpy and the evaluation
+    protocol) once, so that the children forked from it do not import them again. The server gets the current
+    `sys.path` (e.g. the rootdir inserted by pytest) with the `PYTHONPATH` environment variable.
+    """
+    global _supervision_ctx
+    with _supervision_ctx_lock:
+        if _supervision_ctx is None:
+            if 'forkserver' in multiprocessing.get_all_start_methods():
+                from multiprocessing import forkserver
+                ctx = multiprocessing.get_context('forkserver')
+                ctx.set_forkserver_preload([preload_module])
+                previous_path = os.environ.get('PYTHONPATH')
+                os.environ['PYTHONPATH'] = os.pathsep.join(p for p in sys.path if p)
+                try:
+                    forkserver.ensure_running()
+                finally:
+                    if previous_path is None:
+                        del os.environ['PYTHONPATH']
+                    else:
+                        os.environ['PYTHONPATH'] = previous_path
+            else:
+                ctx = multiprocessing.get_context('spawn')
+            _supervision_ctx = ctx
+        return _supervision_ctx
+
+
+# the interval between two measures of the RSS of a supervised child process with a memory budget
+RSS_POLL_INTERVAL_S = 0.01
+
+
+def _supervised_child(conn, func, args, max_memory_mb):
+    """ The target of the child process of `run_supervised` """
+    send_lock = threading.Lock()
+    if max_memory_mb is not None and rss_bytes() is not None:
+        watchdog = threading.Thread(target=_rss_watchdog, args=(conn, send_lock, max_memory_mb), daemon=True)
+        watchdog.start()
+    elif max_memory_mb is not None and resource is not None:
+        limit = vm_size_bytes() + int(max_memory_mb * 1024 ** 2)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    try:
+        message = ('ok', func(*args))
+    except MemoryError as e:
+        message = ('oom', ("%s: %s" % (type(e).__name__, e)) if str(e) else type(e).__name__)
+    except Exception as e:
+        message = ('error', e)
+    with send_lock:
+        try:
+            conn.send(message)
+        except Exception as e:
+            # e.g. the result or the exception can not be pickled
+            conn.send(('error', RuntimeError("Could not send the evaluation outcome: %s: %s"
+                                             % (type(e).__name__, e))))
+        conn.close()
+
+
+def _rss_watchdog(conn, send_lock, max_memory_mb):
+    """ Polls the RSS of the current process, and ends it with an 'oom' outcome when it grew by more than
+    `max_memory_mb` """
+    start_rss = rss_bytes()
+    limit = start_rss + int(max_memory_mb * 1024 ** 2)
+    while True:
+        rss = rss_bytes()
+        if rss > limit:
+            with send_lock:
+                if conn.closed:
+                    # the outcome was already sent
+                    return
+                conn.send(('oom', "RSS grew from %.0f to %.0f MB" % (start_rss / 1024 ** 2, rss / 1024 ** 2)))
+                conn.close()
+                os._exit(1)
+        sleep(RSS_POLL_INTERVAL_S)
+
+
+def rss_bytes():
+    """ The current resident set size of the process (linux), or None if not available """
+    return _proc_status_bytes('VmRSS:')
+
+
+def vm_size_bytes():
+    """ The current size of the address space of the process (linux), or 0 if not available """
+    return _proc_status_bytes('VmSize:') or 0
+
+
+def _proc_status_bytes(field):
+    """ The value of `field` (in kB) in /proc/self/status, in bytes, or None """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError):
+        pass
+    return None
@@ -0,0 +1,111 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401 (required by pandas for parquet and feather)
+except ImportError:
+    pyarrow = None
+
+
+class BackgroundWriter(object):
+    """
+    Writes the synthesis outputs (result tables and figures) in background threads, so that `test_synthesis` does not
+    wait for them. `close` waits for all writes to complete and raises the first error, if any.
+
+    Tables and figures are never displayed: figures are rendered to files with the non-interactive Agg backend. The
+    dataframes given to this writer should not be modified afterwards.
+    """
+    def __init__(self, max_workers=4):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._futures = []
+
+    def write_table(self, df, path_stem):
+        """ Writes `df` to `<path_stem>.csv`, and to `<path_stem>.parquet` and `.feather` if pyarrow is installed """
+        path_stem = Path(path_stem)
+        self._submit(df.to_csv, str(path_stem.with_suffix('.csv')), sep=';', decimal=',')
+        if pyarrow is not None:
+            # columnar formats are much more compact and faster to read. They do not support all object columns
+            df = df.astype({c: str for c in df.columns if df[c].dtype == object})
+            self._submit(df.to_parquet, str(path_stem.with_suffix('.parquet')))
+            self._submit(df.reset_index().to_feather, str(path_stem.with_suffix('.feather')))
+
+    def write_json(self, obj, path):
+        """ Writes the json-serializable `obj` to `path` """
+        self._submit(_write_json, obj, str(path))
+
+    def save_bar_plot(self, df, path, ylabel):
+        """ Renders a bar plot of `df` (one group of bars per row) to the image file `path` """
+        self._submit(_save_bar_plot, df, str(path), ylabel)
+
+    def save_loglog_plot(self, df, path, xlabel, ylabel):
+        """ Renders a line plot of `df` (one line per column, the index is the x axis) in log-log scale to `path` """
+        self._submit(_save_loglog_plot, df, str(path), xlabel, ylabel)
+
+    def close(self):
+        """ Waits for all writes to complete, and raises the first error if any """
+        try:
+            for future in self._futures:
+                future.result()
+        finally:
+            self._futures = []
+            self._executor.shutdown()
+
+    def _submit(self, func, *args, **kwargs):
+        self._futures.append(self._executor.submit(func, *args, **kwargs))
+
+
+def scaling_exponents(results_df, value_columns, size_column='n_points', group_columns=('challenger',)):
+    """
+    Fits `value = a * size ** b` for each group of `group_columns` (e.g. each challenger) and each of the
+    `value_columns` (e.g. a duration or a memory peak), with a least squares fit in log-log scale. Returns a table with
+    the empirical scaling exponents `b`, one row per group, with the range and number of the sizes of the group.
+    Exponents are not computed when there are less than two distinct sizes.
+    """
+    exponents = dict()
+    for group, df in results_df.groupby(list(group_columns), observed=True):
+        exponents[group] = row = dict(min_size=df[size_column].min(), max_size=df[size_column].max(),
+                                      n_sizes=df[size_column].nunique())
+        for col in value_columns:
+            valid = df[(df[col] > 0) & (df[size_column] > 0)]
+            if valid[size_column].nunique() >= 2:
+                row['%s_exponent' % col] = np.polyfit(np.log(valid[size_column].astype(float)),
+                                                      np.log(valid[col].astype(float)), deg=1)[0]
+    return pd.DataFrame.from_dict(exponents, orient='index')
+
+
+def _write_json(obj, path):
+    with open(path, 'w') as f:
+        json.dump(obj, f, indent=2)
+
+
+def _new_figure():
+    # the object-oriented API with an Agg canvas does not rely on pyplot's global state, so it can run in a thread
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(10, 6))
+    FigureCanvasAgg(fig)
+    return fig, fig.add_subplot(1, 1, 1)
+
+
+def _save_loglog_plot(df, path, xlabel, ylabel):
+    fig, ax = _new_figure()
+    df.plot(ax=ax, loglog=True, marker='o')
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    fig.savefig(path)
+
+
+def _save_bar_plot(df, path, ylabel):
+    fig, ax = _new_figure()
+    df.plot.bar(ax=ax)
+    ax.set_ylabel(ylabel)
+    for label in ax.get_xticklabels():
+        label.set_rotation(30)
+        label.set_horizontalalignment('right')
+    fig.subplots_adjust(left=0.20, bottom=0.25)
+    fig.savefig(path)
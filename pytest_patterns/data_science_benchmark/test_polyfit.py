@@ -1,27 +1,98 @@
 import logging
+from glob import glob
 from pathlib import Path
 from warnings import warn
 
 import numpy as np
-
+import pytest
 from pytest_cases import fixture, parametrize_with_cases
 
+from .baseline import compare_to_baseline, load_baseline, save_baseline
+from .cross_validation import CrossValidation
+from .datasets_polyfit import synthetic_chunk_size
+from .environment import environment_fingerprint, fingerprint_id, pinned_blas_threads
+from .evaluation import exec_log
+from .log_buffer import JsonLinesLogWriter, RingBufferHandler
+from .metrics import METRICS, check_metrics
+from .model_cache import FittedModelCache
+from .overhead import overhead_cases
+from .parallel import SKIPPED_STATUSES, BenchmarkEngine
+from .profiling import PhaseProfiler
+from .racing import ChallengerRace
+from .synthesis import BackgroundWriter, scaling_exponents
+from .results_store import ResultsStore
+from .results_table import ResultsTable
+from .sharding import merge_shards, parse_shard, save_durations, save_shard, shard_file_name
+from .supervision import ResourceLimits
+from .timing import TimingHarness
+
 
-# logging configuration
-exec_log = logging.getLogger('algo')
+# logging configuration (the evaluation protocol logs to the 'algo' logger)
 logs_dir = Path(__file__).parent / "logs"
 
+# persistent results of the previous runs (--bench-incremental)
+results_store_dir = Path(__file__).parent / ".bench_results"
+
+# saved baselines (--bench-save-baseline, --bench-compare-baseline)
+baselines_dir = Path(__file__).parent / ".bench_baselines"
+
+# fitted models (--bench-save-models)
+models_dir = Path(__file__).parent / ".bench_models"
+
+# the compact states of the fitted models (--bench-model-cache)
+model_cache_dir = Path(__file__).parent / ".bench_model_cache"
+
+# the cv-rmse bar chart is only drawn up to this number of datasets
+max_plotted_datasets = 200
+
+
+@fixture(scope="session")
+def log_writer(request):
+    """ With `--bench-buffered-logs`, the writer of the single JSON lines log file of the session. None otherwise """
+    if not request.config.getoption("bench_buffered_logs"):
+        yield None
+        return
+    writer = JsonLinesLogWriter(logs_dir / "bench.jsonl")
+    # records only go to the buffers of the nodes, they are not captured by pytest
+    level, propagate = exec_log.level, exec_log.propagate
+    exec_log.setLevel(logging.INFO)
+    exec_log.propagate = False
+    yield writer
+    exec_log.setLevel(level)
+    exec_log.propagate = propagate
+    writer.close()
+
 
 @fixture(autouse=True)
-def configure_logging(request, caplog):
-    """ Set log file name same as test name, and set log level. You could change the format here too """
-    log_file = logs_dir / ("%s.log" % request.node.name)
-    request.config.pluginmanager.get_plugin("logging-plugin").set_log_path(log_file)
-    caplog.set_level(logging.INFO)
+def configure_logging(request, log_writer):
+    """ Set log file name same as test name, and set log level. You could change the format here too.
+    With `--bench-buffered-logs`, the records of the node are buffered in memory instead, then handed to `log_writer`.
+    Only failed nodes get their own log file """
+    if log_writer is None:
+        log_file = logs_dir / ("%s.log" % request.node.name)
+        request.config.pluginmanager.get_plugin("logging-plugin").set_log_path(log_file)
+        request.getfixturevalue("caplog").set_level(logging.INFO)
+        yield
+        return
+
+    handler = RingBufferHandler()
+    exec_log.addHandler(handler)
+    yield
+    exec_log.removeHandler(handler)
+    # the reports of the setup and call phases are stored on the node by the `pytest_runtest_makereport` hook
+    failed = any(getattr(request.node, "rep_%s" % when, None) is not None
+                 and getattr(request.node, "rep_%s" % when).failed for when in ("setup", "call"))
+    log_writer.write(request.node.nodeid, handler.records,
+                     readable_file=(logs_dir / ("%s.log" % request.node.name)) if failed else None)
+
+
+# the no-op cases of the harness overhead suite replace the real ones with BENCH_OVERHEAD_CASES (see overhead.py)
+challengers_cases = '.overhead' if overhead_cases else '.challengers_polyfit'
+datasets_cases = '.overhead' if overhead_cases else '.datasets_polyfit'
 
 
 @fixture
-@parametrize_with_cases("algo", cases='.challengers_polyfit', prefix='algo_')
+@parametrize_with_cases("algo", cases=challengers_cases, prefix='algo_')
 def challenger(algo):
     """ A fixture collecting all challengers from `challengers_polyfit.py` """
     # (optional setup code here)
@@ -30,7 +101,7 @@ def challenger(algo):
 
 
 @fixture
-@parametrize_with_cases("data", cases='.datasets_polyfit', prefix='data_', scope="session")
+@parametrize_with_cases("data", cases=datasets_cases, prefix='data_', scope="session")
 def dataset(data):
     """ A fixture collecting all datasets from `datasets_polyfit.py`.
     Note: we use "scope=session" so that this method is called only once per case.
@@ -41,45 +112,188 @@ def dataset(data):
     # (optional teardown code here)
 
 
-def test_poly_fit(challenger, dataset, results_bag):
+@fixture(scope="session")
+def bench_environment(request):
+    """ The fingerprint of the environment of this run (dict), with its 'id'.
+    BLAS threads are pinned first during the whole session if `--bench-blas-threads` is set """
+    with pinned_blas_threads(request.config.getoption("bench_blas_threads")):
+        fingerprint = environment_fingerprint()
+        fingerprint['id'] = fingerprint_id(fingerprint)
+        yield fingerprint
+
+
+@fixture(scope="session")
+def bench_engine(request, bench_environment):
+    """ The engine evaluating the pairs, either in the test nodes or on a pool of processes (`--bench-workers`) """
+    timer = None
+    if request.config.getoption("bench_timing"):
+        # the latency gate of the baselines needs at least `bench_baseline_min_rounds` samples per phase
+        min_rounds = 5
+        if request.config.getoption("bench_save_baseline") or request.config.getoption("bench_compare_baseline"):
+            min_rounds = max(min_rounds, request.config.getoption("bench_baseline_min_rounds"))
+        timer = TimingHarness(min_rounds=min_rounds, max_time_s=request.config.getoption("bench_timing_max_time"))
+    # the cv-rmse is always computed: the synthesis and the baselines rely on it
+    names = request.config.getoption("bench_metrics")
+    names = list(METRICS) if names == 'all' else names.split(',')
+    metrics = ['cvrmse'] + [m for m in names if m not in ('', 'cvrmse')]
+    check_metrics(metrics)
+    cv = None
+    if request.config.getoption("bench_cv"):
+        cv = CrossValidation(n_splits=request.config.getoption("bench_cv"),
+                             n_repeats=request.config.getoption("bench_cv_repeats"))
+    store = None
+    if request.config.getoption("bench_incremental"):
+        # results with and without timing or cross-validation are different, they should not be reused for each other.
+        # Timings are only reused in the same environment
+        salt = "timing=%s, cv=%r" % (timer is not None, cv)
+        if metrics != ['cvrmse']:
+            salt += ", metrics=%s" % ",".join(metrics)
+        if timer is not None:
+            salt += ", env=%s" % bench_environment['id']
+        store = ResultsStore(results_store_dir, salt=salt)
+        store.put_environment(bench_environment['id'], bench_environment)
+    model_cache = None
+    if request.config.getoption("bench_model_cache"):
+        model_cache = FittedModelCache(model_cache_dir)
+    limits = None
+    timeout_s, max_memory_mb = request.config.getoption("bench_timeout"), request.config.getoption("bench_max_memory")
+    if timeout_s is not None or max_memory_mb is not None:
+        # each pair is evaluated in a supervised child process
+        limits = ResourceLimits(timeout_s=timeout_s, max_memory_mb=max_memory_mb,
+                                early_abort=not request.config.getoption("bench_no_early_abort"))
+    race = None
+    if request.config.getoption("bench_race"):
+        race = ChallengerRace(alpha=request.config.getoption("bench_race_alpha"),
+                              min_rounds=request.config.getoption("bench_race_min_rounds"))
+    engine = BenchmarkEngine(workers=request.config.getoption("bench_workers"),
+                             batch=request.config.getoption("bench_batch"), timer=timer, store=store, cv=cv,
+                             run_info=dict(env_id=bench_environment['id']), limits=limits, metrics=metrics,
+                             model_cache=model_cache, race=race)
+    yield engine
+    engine.close()
+
+
+def get_profiler(request):
+    """ Returns the profiler for the current test node according to the `--bench-profile` option and to the
+    `bench_profile` marker, or None """
+    mode = request.config.getoption("bench_profile")
+    marker = request.node.get_closest_marker("bench_profile")
+    if mode is None and marker is not None:
+        mode = marker.args[0] if marker.args else "memory"
+    if mode is None:
+        return None
+    # cProfile files are dumped next to the log file
+    return PhaseProfiler(cprofile_prefix=(logs_dir / request.node.name) if mode == "cprofile" else None)
+
+
+@fixture(scope="session")
+def bench_results(request):
+    """ The columnar table where the results of all test nodes are stored """
+    save_models = request.config.getoption("bench_save_models")
+    return ResultsTable(models_dir=models_dir if save_models else None)
+
+
+@fixture
+def results_row(bench_results, request):
+    """ A new row of the results table, for the current test node.
+    Its status and duration are recorded by the `pytest_runtest_makereport` hook in conftest.py """
+    row = bench_results.append(test_id=request.node.name)
+    request.node.bench_results_row = row
+    return row
+
+
+def test_poly_fit(challenger, dataset, results_row, bench_engine, request):
     """ Evaluation protocol.
-    Applies the `challenger` on the provided `dataset`, and stores the model accuracy (cv-rmse) in the results_bag
+    Applies the `challenger` on the provided `dataset`, and stores the model accuracy (cv-rmse) in the results_row.
+    See `evaluation.evaluate` for details.
     """
-    # log the dataset name
-    results_bag.dataset_id = dataset.name
+    # log the dataset name and the challenger degree
+    results_row.update(dataset=dataset.name, degree=getattr(challenger, 'degree', None))
 
-    # Fit the model
-    exec_log.info("fitting model")
-    challenger.fit(dataset.x, dataset.y)
-    results_bag.model = challenger
+    # evaluate (in parallel or batch mode the results row is filled later, in `bench_results_df`)
+    bench_engine.submit(challenger, dataset, results_row, profiler=get_profiler(request))
 
-    # Use the model to perform predictions
-    exec_log.info("predicting")
-    predictions = challenger.predict(dataset.x)
 
-    # Evaluate the prediction error
-    exec_log.info("evaluating error")
-    cvrmse = np.sqrt(np.mean((predictions-dataset.y)**2)) / np.mean(dataset.y)
-    print("Relative error (cv-rmse) is: %.2f%%" % (cvrmse * 100))
-    results_bag.cvrmse = cvrmse
+# ------------- To create the final benchmark table ------------
+@fixture
+def bench_results_df(bench_results, bench_engine, request):
+    """ Waits for all pairs to be evaluated, then returns the results table as a DataFrame indexed by test id.
+    With `--bench-merge-shards`, returns the merged partial results of the shards instead """
+    merge = request.config.getoption("bench_merge_shards")
+    if merge is not None:
+        return merge_shards(sorted(glob(merge)))
+    bench_engine.join()
+    return bench_results.to_pandas()
 
 
-# ------------- To create the final benchmark table ------------
-def test_synthesis(module_results_df):
+@fixture(scope="session")
+def synthesis_writer():
+    """ Writes the synthesis tables and figures in the background. The session waits for them at teardown """
+    writer = BackgroundWriter()
+    yield writer
+    writer.close()
+
+
+def test_synthesis(bench_results_df, bench_engine, bench_environment, synthesis_writer, request):
     """
     Creates the benchmark synthesis table
     Note: we could do this at many other places (hook, teardown of a session-scope fixture...)
-    as explained in `pytest-harvest` plugin
     """
-    # ----------- (1) `module_results_df` contains the raw (12 rows) table -----------
-    # rename columns and only keep useful information
-    module_results_df = rename_with_checks(module_results_df, columns={'challenger_algo_param': 'degree',
-                                                                       'dataset_id': 'dataset'})
-    module_results_df['challenger'] = module_results_df['model'].map(str)  # only keep the string representation
-    module_results_df = module_results_df[['dataset', 'challenger', 'degree', 'status', 'duration_ms', 'cvrmse']]
+    # ----------- (0) with --bench-shard, only save the partial results of this shard -----------
+    shard = request.config.getoption("bench_shard")
+    if shard is not None:
+        shard, n_shards = parse_shard(shard)
+        test_ids = [item.name for item in request.session.items if 'results_row' in item.fixturenames]
+        save_shard(shard_file_name(shard, n_shards), shard, n_shards, test_ids, bench_environment, bench_results_df,
+                   collected_ids=request.config.bench_collected_ids)
+        pytest.skip("Partial results of shard %i/%i saved in %s. Merge them with --bench-merge-shards"
+                    % (shard + 1, n_shards, shard_file_name(shard, n_shards)))
+
+    # the durations of this run are used to balance the shards of the next runs
+    save_durations(request.config.getoption("bench_durations"), bench_results_df)
+
+    # ----------- (1) `bench_results_df` contains the raw table: one row per pair (and per target) -----------
+    # only keep useful information
+    module_results_df = bench_results_df
+    columns = ['dataset', 'n_points', 'challenger', 'degree', 'status', 'duration_ms', 'cvrmse']
+    if 'target' in module_results_df.columns:
+        # one row per target of the multi-output datasets
+        columns.insert(1, 'target')
+    # the other metrics (--bench-metrics)
+    columns += [m for m in bench_engine.metrics if m != 'cvrmse' and m in module_results_df.columns]
+    if 'cvrmse_repeats' in module_results_df.columns:
+        # the cv-rmse is computed on held-out folds (--bench-cv): report its spread across repeats
+        module_results_df['cvrmse_std'] = module_results_df['cvrmse_repeats'].map(np.std, na_action='ignore')
+        columns += ['n_folds', 'cvrmse_std']
+    if 'fit_median_ms' in module_results_df.columns:
+        # fit and predict were timed separately (--bench-timing): report their duration and throughput
+        for phase in ('fit', 'predict'):
+            module_results_df['%s_points_per_s' % phase] = (module_results_df['n_points'] * 1000
+                                                             / module_results_df['%s_median_ms' % phase])
+            columns += ['%s_median_ms' % phase, '%s_iqr_ms' % phase, '%s_points_per_s' % phase]
+    memory_columns = [c for c in module_results_df.columns if c.endswith(('_peak_mem_kb', '_peak_rss_kb'))]
+    columns += memory_columns  # --bench-profile
+    if 'cached' in module_results_df.columns:
+        # results reloaded from a previous run (--bench-incremental)
+        columns.append('cached')
+    if 'fit_cached' in module_results_df.columns:
+        # fitted models reloaded from the cache (--bench-model-cache)
+        columns.append('fit_cached')
+    # the id of the environment where each pair was evaluated (see polyfit_bench_environment.json)
+    columns.append('env_id')
+    skipped = module_results_df['status'].isin(SKIPPED_STATUSES)
+    if skipped.any():
+        # pairs stopped or skipped because of their budget (--bench-timeout, --bench-max-memory), or pruned from the
+        # race (--bench-race)
+        columns.append('error')
+        warn("%i pair(s) exceeded their budget, were aborted or were pruned, see the 'status' and 'error' columns"
+             % skipped.sum())
+    baseline_report = compare_and_save_baseline(request.config, module_results_df)
+    module_results_df = module_results_df[columns]
 
-    # write to csv
-    module_results_df.to_csv("polyfit_bench_results.csv", sep=';', decimal=',')
+    # write to csv (and parquet/feather if pyarrow is installed), in the background
+    synthesis_writer.write_table(module_results_df, "polyfit_bench_results")
+    synthesis_writer.write_json(bench_environment, "polyfit_bench_environment.json")
 
     # pretty-print (requires tabulate)
     try:
@@ -90,42 +304,128 @@ def test_synthesis(module_results_df):
 
     # ----------- (2) graphical synthesis: bar chart (requires matplotlib)------------
     try:
-        import matplotlib.pyplot as plt
+        import matplotlib  # noqa: F401
 
         # convert all to categorical so that we can pivot
         module_results_df = module_results_df.apply(lambda s: s.astype("category") if s.dtype == 'object' else s)
 
-        cvrmse_df = module_results_df[['dataset', 'challenger', 'cvrmse']].pivot(index='dataset',
-                                                                                 columns='challenger',
-                                                                                 values='cvrmse')
+        plot_df = module_results_df
+        if 'target' in plot_df.columns:
+            # one group of bars per target of the multi-output datasets
+            plot_df = plot_df.assign(dataset=["%s::%s" % (d, t) if isinstance(t, str) else d
+                                              for d, t in zip(plot_df['dataset'], plot_df['target'])])
+        cvrmse_df = plot_df[['dataset', 'challenger', 'cvrmse']].pivot(index='dataset', columns='challenger',
+                                                                       values='cvrmse')
 
-        ax = cvrmse_df.plot.bar()
-        ax.set_ylabel("cvrmse")
-        plt.xticks(plt.xticks()[0], plt.xticks()[1], rotation=30, ha='right')
-        plt.subplots_adjust(left=0.20, bottom=0.25)
-        print("Close the plots to continue...")
-        plt.show()
+        if len(cvrmse_df) > max_plotted_datasets:
+            # unreadable, and rendering it would take most of the synthesis time
+            warn("The cv-rmse bar chart is not drawn for more than %i datasets" % max_plotted_datasets)
+        elif request.config.getoption("bench_show_plots"):
+            import matplotlib.pyplot as plt
+            ax = cvrmse_df.plot.bar()
+            ax.set_ylabel("cvrmse")
+            plt.xticks(plt.xticks()[0], plt.xticks()[1], rotation=30, ha='right')
+            plt.subplots_adjust(left=0.20, bottom=0.25)
+            print("Close the plots to continue...")
+            plt.show()
+        else:
+            # render to a file in the background, with a non-interactive backend
+            synthesis_writer.save_bar_plot(cvrmse_df, "polyfit_bench_cvrmse.png", ylabel="cvrmse")
     except ImportError:
         pass
 
     # ----------- (3) summarizing the results further - by challenger --------------
-    summary_df = module_results_df[['degree', 'duration_ms', 'cvrmse']].groupby('degree', axis=0).agg({
-        'duration_ms': ['mean', 'std'],
-        'cvrmse': ['mean', 'std']
-    })
+    summary_columns = {'duration_ms': ['mean', 'std'], 'cvrmse': ['mean', 'std']}
+    if 'fit_median_ms' in module_results_df.columns:
+        summary_columns.update({'fit_median_ms': ['mean', 'std'], 'predict_median_ms': ['mean', 'std']})
+    group_columns = ['degree']
+    if module_results_df['env_id'].nunique() > 1:
+        # results evaluated in several environments (e.g. reloaded from the store): group them by environment, and
+        # normalize the durations by the median duration of their environment so that they can be compared
+        group_columns = ['env_id', 'degree']
+        module_results_df['duration_rel'] = module_results_df['duration_ms'] / module_results_df.groupby(
+            'env_id', observed=True)['duration_ms'].transform('median')
+        summary_columns['duration_rel'] = ['mean', 'std']
+    summary_df = module_results_df[group_columns + list(summary_columns)].groupby(group_columns, axis=0,
+                                                                                   observed=True).agg(summary_columns)
     # pretty-print (requires tabulate)
     try:
         print("\n" + tabulate(summary_df, headers='keys'))
     except NameError:
         pass
 
+    # ----------- (4) ranking the challengers by memory footprint (--bench-profile) --------------
+    if memory_columns:
+        memory_df = module_results_df[['challenger'] + memory_columns].groupby('challenger').max()
+        memory_df['peak_mem_kb'] = memory_df[[c for c in memory_columns if c.endswith('_peak_mem_kb')]].max(axis=1)
+        memory_df = memory_df.sort_values('peak_mem_kb')
+        try:
+            print("\n" + tabulate(memory_df, headers='keys'))
+        except NameError:
+            print(memory_df)
 
-def rename_with_checks(df, columns, **kwargs):
+    # ----------- (5) scaling curves on the synthetic datasets (BENCH_SYNTHETIC_MAX_SIZE) --------------
+    # (the durations of the pairs stopped because of their budget, or pruned, are not representative)
+    synthetic_df = module_results_df[module_results_df['dataset'].astype(str).str.startswith('Synthetic-')
+                                     & ~module_results_df['status'].isin(SKIPPED_STATUSES)]
+    if synthetic_df['n_points'].nunique() >= 2:
+        # the datasets larger than `synthetic_chunk_size` are evaluated with the streaming protocol, whose fit is not
+        # timed with --bench-timing: each protocol gets its own exponents, fitted on its own sizes
+        streaming = synthetic_df['n_points'] > synthetic_chunk_size
+        synthetic_df = synthetic_df.assign(protocol=np.where(streaming, 'streaming', 'in-memory'),
+                                           time_ms=synthetic_df['duration_ms'])
+        if 'fit_median_ms' in synthetic_df.columns:
+            synthetic_df['time_ms'] = synthetic_df['time_ms'].where(streaming, synthetic_df['fit_median_ms'])
+            print("\ntime_ms: median fit duration (in-memory), test node duration (streaming)")
+        else:
+            print("\ntime_ms: test node duration")
+        scaling_columns = ['time_ms'] + [c for c in ('fit_peak_mem_kb',) if c in synthetic_df.columns]
+        scaling_df = scaling_exponents(synthetic_df, scaling_columns, group_columns=('protocol', 'challenger'))
+        try:
+            print(tabulate(scaling_df, headers='keys'))
+        except NameError:
+            print(scaling_df)
+        try:
+            import matplotlib  # noqa: F401
+            time_vs_n = synthetic_df.pivot_table(index='n_points', columns=['protocol', 'challenger'],
+                                                 values='time_ms', aggfunc='median', observed=True)
+            synthesis_writer.save_loglog_plot(time_vs_n, "polyfit_bench_scaling.png", xlabel="n_points",
+                                              ylabel='time_ms')
+        except ImportError:
+            pass
+
+    # ----------- (6) regression report with respect to the baseline (--bench-compare-baseline) --------------
+    if baseline_report is not None:
+        regressions = baseline_report[baseline_report['regression']]
+        try:
+            print("\n" + tabulate(baseline_report, headers='keys', showindex=False))
+        except NameError:
+            print(baseline_report)
+        assert len(regressions) == 0, "%i regression(s) with respect to the baseline:\n%s" \
+                                      % (len(regressions), regressions.to_string(index=False))
+
+
+def compare_and_save_baseline(config, results_df):
     """
-    Same than df.rename(columns=<columns>, **kwargs) but checks that columns exist before executing.
+    Compares `results_df` to the baseline if `--bench-compare-baseline` is set, and saves it as a baseline if
+    `--bench-save-baseline` is set. Returns the comparison report, or None.
     """
-    missing = set(columns.keys()).difference(set(df.columns))
-    if len(missing) > 0:
-        raise ValueError("Missing columns: %s" % missing)
+    report = None
+    compare_name = config.getoption("bench_compare_baseline")
+    if compare_name is not None:
+        baseline_df = load_baseline(compare_name, baselines_dir)
+        if 'env_id' in baseline_df.columns \
+                and set(baseline_df['env_id'].dropna()) != set(results_df['env_id'].dropna()):
+            warn("Baseline '%s' was run in environment(s) %s, this run in %s: durations may not be comparable"
+                 % (compare_name, sorted(set(baseline_df['env_id'].dropna())),
+                    sorted(set(results_df['env_id'].dropna()))))
+        report = compare_to_baseline(results_df, baseline_df,
+                                     max_slowdown=config.getoption("bench_max_slowdown"),
+                                     max_cvrmse_increase=config.getoption("bench_max_cvrmse_increase"),
+                                     min_rounds=config.getoption("bench_baseline_min_rounds"))
+
+    save_name = config.getoption("bench_save_baseline")
+    if save_name is not None:
+        save_baseline(results_df, save_name, baselines_dir)
 
-    return df.rename(columns=columns, **kwargs)
+    return report
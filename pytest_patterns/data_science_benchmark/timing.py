@@ -0,0 +1,82 @@
+import gc
+from collections import namedtuple
+from time import perf_counter_ns
+
+import numpy as np
+
+
+TimingStats = namedtuple("TimingStats", ('min_ms', 'median_ms', 'iqr_ms', 'rounds', 'samples_ms'))
+"""The statistics of the duration of one call, measured over several rounds"""
+
+
+class TimingHarness(object):
+    """
+    Measures the duration of a function call with a statistically meaningful number of rounds.
+
+     - `warmup_rounds` rounds are executed first and discarded (caches, lazy imports, memory allocation...)
+     - each round calls the function `number` times, where `number` is calibrated so that a round lasts at least
+       `min_round_ms`. This makes sub-microsecond functions measurable despite the timer resolution.
+     - rounds are repeated (at least `min_rounds`, at most `max_rounds`) until the 95% confidence interval of the
+       median is narrower than `target_rel_ci` times the median, or until `max_time_s` is elapsed.
+     - the garbage collector is disabled while measuring, so that collections triggered by other code do not add
+       noise to the measure.
+    """
+    def __init__(self, warmup_rounds=2, min_rounds=5, max_rounds=1000, target_rel_ci=0.05, max_time_s=1.,
+                 min_round_ms=0.1):
+        self.warmup_rounds = warmup_rounds
+        self.min_rounds = min_rounds
+        self.max_rounds = max_rounds
+        self.target_rel_ci = target_rel_ci
+        self.max_time_s = max_time_s
+        self.min_round_ms = min_round_ms
+
+    def measure(self, func):
+        """ Returns the `TimingStats` of a single call to `func` (in ms), and the result of the last call """
+        gc.collect()
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for _ in range(self.warmup_rounds):
+                res = func()
+            number = self._calibrate(func)
+
+            samples = []
+            deadline = perf_counter_ns() + int(self.max_time_s * 1e9)
+            while len(samples) < self.max_rounds:
+                start = perf_counter_ns()
+                for _ in range(number):
+                    res = func()
+                samples.append((perf_counter_ns() - start) / number / 1e6)
+                if len(samples) >= self.min_rounds and (perf_counter_ns() > deadline
+                                                        or self._median_rel_ci(samples) <= self.target_rel_ci):
+                    break
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+        samples = np.array(samples)
+        q1, median, q3 = np.percentile(samples, [25, 50, 75])
+        return TimingStats(min_ms=samples.min(), median_ms=median, iqr_ms=q3 - q1, rounds=len(samples),
+                           samples_ms=samples), res
+
+    def _calibrate(self, func):
+        """ Returns the number of calls to perform in each round so that it lasts at least `min_round_ms` """
+        number = 1
+        while True:
+            start = perf_counter_ns()
+            for _ in range(number):
+                func()
+            if (perf_counter_ns() - start) / 1e6 >= self.min_round_ms:
+                return number
+            number *= 10
+
+    @staticmethod
+    def _median_rel_ci(samples):
+        """ Relative width of the distribution-free 95% confidence interval of the median (order statistics) """
+        n = len(samples)
+        s = sorted(samples)
+        half_width = 1.96 * np.sqrt(n) / 2
+        lo = max(int(np.floor(n / 2 - half_width)), 0)
+        hi = min(int(np.ceil(n / 2 + half_width)), n - 1)
+        median = s[n // 2]
+        return (s[hi] - s[lo]) / median if median > 0 else 0.
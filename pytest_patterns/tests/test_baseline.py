@@ -0,0 +1,75 @@
+from math import erfc, sqrt
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pytest_patterns.data_science_benchmark.baseline import average_ranks, compare_to_baseline, mann_whitney_greater_p
+
+
+def test_average_ranks():
+    np.testing.assert_array_equal(average_ranks([3., 1., 2.]), [3., 1., 2.])
+    np.testing.assert_array_equal(average_ranks([2., 1., 2., 2., 0.]), [4., 2., 4., 4., 1.])
+
+
+def test_mann_whitney_normal_approximation():
+    """ Without ties, the p-value is the normal approximation of the distribution of U """
+    a, b = [5., 6., 7., 9.], [1., 2., 3., 4., 8.]
+    # U counts the pairs where a > b: 4 + 4 + 4 + 5
+    z = (17 - 4 * 5 / 2.) / sqrt(4 * 5 * 10 / 12.)
+    assert mann_whitney_greater_p(a, b) == pytest.approx(0.5 * erfc(z / sqrt(2)))
+    assert mann_whitney_greater_p(b, a) == pytest.approx(1 - mann_whitney_greater_p(a, b))
+    assert mann_whitney_greater_p([1., 1.], [1., 1.]) == 0.5
+
+
+def test_mann_whitney_scipy():
+    stats = pytest.importorskip("scipy.stats")
+    rng = np.random.default_rng(0)
+    a, b = np.round(rng.normal(1.2, 1, 30), 1), np.round(rng.normal(1, 1, 40), 1)
+    expected = stats.mannwhitneyu(a, b, alternative='greater', use_continuity=False, method='asymptotic').pvalue
+    assert mann_whitney_greater_p(a, b) == pytest.approx(expected, rel=1e-2)
+
+
+def results(cvrmse, fit_samples_ms=None):
+    df = pd.DataFrame(dict(dataset=['d%i' % i for i in range(len(cvrmse))], challenger='c', cvrmse=cvrmse),
+                      index=['t%i' % i for i in range(len(cvrmse))])
+    if fit_samples_ms is not None:
+        df['fit_samples_ms'] = [fit_samples_ms] * len(df)
+        df['fit_median_ms'] = np.median(fit_samples_ms)
+    return df
+
+
+def test_cvrmse_regressions():
+    """ An increased cv-rmse, a pair without cv-rmse anymore and a missing pair are regressions """
+    baseline_df = results([0.1, 0.2, 0.3, 0.4])
+    results_df = results([0.1, 0.25, np.nan])
+    report = compare_to_baseline(results_df, baseline_df).set_index('test_id')
+
+    assert report.loc['t3', 'metric'] == 'missing'
+    assert report['regression'].to_dict() == dict(t0=False, t1=True, t2=True, t3=True)
+
+
+def test_negative_cvrmse():
+    """ The cv-rmse is negative when the mean of the target is: absolute values are compared """
+    report = compare_to_baseline(results([-0.3, -0.1]), results([-0.2, -0.2]))
+    assert list(report['regression']) == [True, False]
+
+
+def test_latency_regressions():
+    """ The fit latency regresses if its median is slower and its samples are significantly slower. Without enough
+    rounds for the test, a slower median is enough """
+    rng = np.random.default_rng(0)
+    baseline_samples = list(rng.normal(10, 0.1, 20))
+    report = compare_to_baseline(results([0.1], [x * 1.5 for x in baseline_samples]),
+                                 results([0.1], baseline_samples))
+    fit = report[report['metric'] == 'fit_ms'].iloc[0]
+    assert fit['ratio'] == pytest.approx(1.5) and fit['p_value'] < 0.01 and fit['regression']
+
+    report = compare_to_baseline(results([0.1], [x * 1.5 for x in baseline_samples]),
+                                 results([0.1], baseline_samples), min_rounds=21)
+    fit = report[report['metric'] == 'fit_ms'].iloc[0]
+    assert np.isnan(fit['p_value']) and fit['regression'] and fit['note'].startswith("insufficient samples")
+
+    report = compare_to_baseline(results([0.1], [x * 1.1 for x in baseline_samples]),
+                                 results([0.1], baseline_samples))
+    assert not report['regression'].any()
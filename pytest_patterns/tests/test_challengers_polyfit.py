@@ -0,0 +1,171 @@
+import warnings
+
+import numpy as np
+import pytest
+
+from pytest_patterns.data_science_benchmark.challengers_polyfit import SOLVERS, PolyFitChallenger, PowerBasisCache, \
+    polyval_horner
+from pytest_patterns.data_science_benchmark.datasets_polyfit import Dataset
+from pytest_patterns.data_science_benchmark.evaluation import evaluate
+from pytest_patterns.data_science_benchmark.timing import TimingHarness
+
+
+def noisy_polynomial(n_points, degree, seed=0, shift=0.):
+    """ Returns x, y = a random polynomial of `degree` evaluated on x in [shift, shift + 10], with a little noise """
+    rng = np.random.default_rng(seed)
+    x = shift + np.sort(rng.uniform(0, 10, n_points))
+    y = np.polyval(rng.uniform(-1, 1, degree + 1), x - shift) + rng.normal(scale=0.1, size=n_points)
+    return x, y
+
+
+@pytest.mark.parametrize("solver", list(SOLVERS))
+@pytest.mark.parametrize("degree", [1, 2, 3])
+def test_solvers_match_polyfit(solver, degree):
+    """ All solvers find the same least-squares solution as np.polyfit on a well-conditioned problem """
+    x, y = noisy_polynomial(200, degree)
+    challenger = PolyFitChallenger(degree=degree, solver=solver)
+    challenger.fit(x, y)
+
+    assert challenger.solver_used == solver
+    np.testing.assert_allclose(challenger.predict(x), np.polyval(np.polyfit(x, y, deg=degree), x), rtol=1e-9)
+
+
+@pytest.mark.parametrize("solver", [s for s in SOLVERS if s != 'polyfit'])
+def test_solvers_large_magnitude_x(solver):
+    """ x is standardized, so timestamp-like x remain accurate (the residuals are the ones of the noise) """
+    x, y = noisy_polynomial(500, 2, shift=1.6e9)
+    challenger = PolyFitChallenger(degree=2, solver=solver)
+    challenger.fit(x, y)
+
+    assert np.sqrt(np.mean((challenger.predict(x) - y) ** 2)) < 0.2
+
+
+def test_rank_deficient_fallback():
+    """ With less distinct x than coefficients the problem is rank deficient: cholesky falls back to qr, that falls
+    back to svd, which still finds a least-squares solution """
+    x = np.repeat(np.arange(5.), 20)
+    y = 2 * x + 1
+    challenger = PolyFitChallenger(degree=6, solver='cholesky')
+    challenger.fit(x, y)
+
+    assert challenger.solver_used == 'svd'
+    np.testing.assert_allclose(challenger.predict(x), y, atol=1e-9)
+
+
+def test_polyfit_rank_warning_fallback():
+    """ When np.polyfit warns that the problem is poorly conditioned (Anscombe's 4th dataset has only 2 distinct x),
+    the default solver falls back to qr (then svd) instead of emitting the warning """
+    x = np.array([8.0, 8.0, 8.0, 8.0, 8.0, 8.0, 8.0, 19.0, 8.0, 8.0, 8.0])
+    y = np.array([6.58, 5.76, 7.71, 8.84, 8.47, 7.04, 5.25, 12.50, 5.56, 7.91, 6.89])
+    challenger = PolyFitChallenger(degree=2)
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        challenger.fit(x, y)
+
+    assert challenger.solver_used == 'svd'
+    predictions = challenger.predict(x)
+    np.testing.assert_allclose(predictions[x == 19.], 12.5, rtol=1e-9)
+    np.testing.assert_allclose(predictions[x == 8.], y[x == 8.].mean(), rtol=1e-9)
+
+
+def test_solvers_multi_output():
+    """ A 2-D y is solved at once, as one independent fit per column """
+    x, y1 = noisy_polynomial(100, 2, seed=1)
+    _, y2 = noisy_polynomial(100, 2, seed=2)
+    challenger = PolyFitChallenger(degree=2, solver='qr')
+    challenger.fit(x, np.column_stack([y1, y2]))
+
+    predictions = challenger.predict(x)
+    assert predictions.shape == (100, 2)
+    for i, y in enumerate((y1, y2)):
+        np.testing.assert_allclose(predictions[:, i], np.polyval(np.polyfit(x, y, deg=2), x), rtol=1e-9)
+
+
+@pytest.mark.parametrize("degree", [0, 1, 3])
+def test_horner_matches_polyval(degree):
+    """ The chunked Horner scheme matches np.polyval, including across chunks and on the standardized x """
+    rng = np.random.default_rng(degree)
+    coefs, x = rng.uniform(-1, 1, degree + 1), rng.uniform(-5, 5, 1000)
+    out = polyval_horner(coefs, x, out=np.empty(len(x)), chunk_size=64)
+    np.testing.assert_allclose(out, np.polyval(coefs, x), rtol=1e-12, atol=1e-12)
+
+    out = polyval_horner(coefs, x, out=np.empty(len(x)), shift=2., scale=3., chunk_size=64)
+    np.testing.assert_allclose(out, np.polyval(coefs, (x - 2.) / 3.), rtol=1e-12, atol=1e-12)
+
+
+def test_cached_powers_match_polyval():
+    """ Predictions with a shared power cache match np.polyval, before and after the eviction of their entry """
+    x1, y1 = noisy_polynomial(100, 2, seed=1)
+    x2, _ = noisy_polynomial(100, 2, seed=2)
+    # room for the 3 powers of one array only
+    cache = PowerBasisCache(max_bytes=3 * 100 * 8)
+    models = [PolyFitChallenger(degree=degree, power_cache=cache) for degree in (1, 2)]
+    for model in models:
+        model.fit(x1, y1)
+
+    def check(x):
+        for model in models:
+            np.testing.assert_allclose(model.predict(x), np.polyval(model.coefs, x), rtol=1e-12)
+
+    check(x1)
+    assert len(cache._entries) == 1 and cache.nbytes == 3 * 100 * 8
+    # x2 evicts x1, which is computed again
+    check(x2)
+    assert list(cache._entries.values())[0][0] is x2
+    check(x1)
+    assert cache.nbytes == sum(p.nbytes for _, p in cache._entries.values()) == 3 * 100 * 8
+
+    # too large for the cache: Horner scheme
+    x_large = np.linspace(0, 1, 1000)
+    check(x_large)
+    assert cache.powers(x_large, 2) is None
+
+    cache.clear()
+    assert cache.nbytes == 0 and not cache._entries
+
+
+def test_timed_predictions_bypass_the_power_cache():
+    """ The timing harness measures complete predictions: it does not fill nor use the power cache """
+    x, y = noisy_polynomial(100, 2)
+    cache = PowerBasisCache()
+    challenger = PolyFitChallenger(degree=2, power_cache=cache)
+    results = evaluate(challenger, Dataset(name="poly", x=x, y=y), timer=TimingHarness(max_time_s=0.01))
+
+    assert 'predict_median_ms' in results
+    assert cache.nbytes == 0
+    assert results['model'].power_cache is cache
+
+
+def test_unknown_solver():
+    with pytest.raises(ValueError):
+        PolyFitChallenger(degree=1, solver='lu')
+
+
+def test_fit_batch_matches_loop():
+    """ The batched QR fit of datasets with different lengths (padded with zero rows) matches one fit per dataset """
+    datasets = [noisy_polynomial(n, 2, seed=n) for n in (7, 50, 200)]
+    xs, ys = [x for x, _ in datasets], [y for _, y in datasets]
+    challenger = PolyFitChallenger(degree=2)
+    challenger.fit_batch(xs, ys)
+
+    predictions = challenger.predict_batch(xs)
+    for x, y, p, model in zip(xs, ys, predictions, challenger.batch_models()):
+        expected = np.polyval(np.polyfit(x, y, deg=2), x)
+        assert len(p) == len(x)
+        np.testing.assert_allclose(p, expected, rtol=1e-8)
+        np.testing.assert_allclose(model.predict(x), expected, rtol=1e-8)
+
+
+def test_fit_batch_rank_deficient():
+    """ A dataset with less distinct x than coefficients is solved again with an SVD, without warnings nor affecting
+    the others """
+    x_ok, y_ok = noisy_polynomial(30, 2)
+    x_deficient, y_deficient = np.array([1., 1., 2., 2.]), np.array([1., 1., 3., 3.])
+    challenger = PolyFitChallenger(degree=2)
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        challenger.fit_batch([x_ok, x_deficient], [y_ok, y_deficient])
+
+    predictions = challenger.predict_batch([x_ok, x_deficient])
+    np.testing.assert_allclose(predictions[0], np.polyval(np.polyfit(x_ok, y_ok, deg=2), x_ok), rtol=1e-8)
+    np.testing.assert_allclose(predictions[1], y_deficient, atol=1e-8)
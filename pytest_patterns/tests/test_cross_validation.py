@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from pytest_patterns.data_science_benchmark.challengers_polyfit import PolyFitChallenger
+from pytest_patterns.data_science_benchmark.cross_validation import CrossValidation, fold_ids
+
+
+def test_folds_partition_the_points():
+    """ The test sets of each repeat are sorted and partition the points, and the repeats are shuffled differently """
+    folds = CrossValidation(n_splits=4, n_repeats=2, seed=3).folds(103)
+
+    assert folds.n_repeats == 2
+    for repeat in range(2):
+        splits = folds.splits(repeat)
+        assert len(splits) == 4
+        assert all(np.all(np.diff(test) > 0) for test in splits)
+        np.testing.assert_array_equal(np.sort(np.concatenate(splits)), np.arange(103))
+    assert not np.array_equal(folds.test_indices[0], folds.test_indices[1])
+
+
+def test_folds_are_deterministic_and_shared():
+    cv = CrossValidation(n_splits=5, seed=1)
+    assert cv.folds(50) is cv.folds(50)
+    np.testing.assert_array_equal(cv.folds(50).test_indices, CrossValidation(n_splits=5, seed=1).folds(50).test_indices)
+
+
+def test_at_least_two_folds():
+    with pytest.raises(ValueError):
+        CrossValidation(n_splits=1)
+
+
+def test_fold_ids():
+    np.testing.assert_array_equal(fold_ids([np.array([1, 3]), np.array([0, 2, 4])], 5), [1, 0, 1, 0, 1])
+
+
+@pytest.mark.parametrize("degree", [1, 2, 3])
+def test_fit_folds_downdating_matches_polyfit(degree):
+    """ The models obtained by downdating the power sums are the ones fitted on each training set by np.polyfit (up to
+    the accuracy of the normal equations) """
+    rng = np.random.default_rng(0)
+    x = rng.uniform(100, 110, 200)
+    y = np.polyval(rng.uniform(-1, 1, degree + 1), x - 105) + rng.normal(scale=0.1, size=200)
+    test_indices = CrossValidation(n_splits=5).folds(200).splits(0)
+
+    models = PolyFitChallenger(degree=degree).fit_folds(x, y, test_indices)
+    assert len(models) == 5
+    for model, test in zip(models, test_indices):
+        train = np.setdiff1d(np.arange(200), test)
+        expected = np.polyval(np.polyfit(x[train], y[train], deg=degree), x[test])
+        np.testing.assert_allclose(model.predict(x[test]), expected, rtol=1e-6, atol=1e-8 * np.abs(y).max())
+
+
+def test_fit_folds_multi_output():
+    """ Multi-output datasets fall back to one fit per fold """
+    rng = np.random.default_rng(0)
+    x = rng.uniform(0, 10, 60)
+    y = np.column_stack([2 * x + 1, x ** 2]) + rng.normal(scale=0.1, size=(60, 2))
+    test_indices = CrossValidation(n_splits=3).folds(60).splits(0)
+
+    for model, test in zip(PolyFitChallenger(degree=2).fit_folds(x, y, test_indices), test_indices):
+        train = np.setdiff1d(np.arange(60), test)
+        expected = np.polyval(np.polyfit(x[train], y[train], deg=2), x[test][:, np.newaxis])
+        np.testing.assert_allclose(model.predict(x[test]), expected, rtol=1e-8)
@@ -0,0 +1,133 @@
+import json
+import os
+import shutil
+
+import numpy as np
+
+from pytest_patterns.data_science_benchmark.dataset_cache import ColumnarCache, MemmapChunks
+
+
+def write_csv(path, n_rows, seed=0, header="x,y"):
+    data = np.random.default_rng(seed).uniform(size=(n_rows, len(header.split(','))))
+    np.savetxt(str(path), data, delimiter=',', header=header, comments='')
+    return data
+
+
+def entry_size(entry_dir):
+    return sum(f.stat().st_size for f in entry_dir.iterdir())
+
+
+def test_conversion_by_chunks(tmp_path):
+    """ The columns converted chunk by chunk are the ones of the csv file, with sanitized names """
+    data = write_csv(tmp_path / "data.csv", 10, header="x,temp-1,temp 2")
+    with (tmp_path / "data.csv").open('a') as f:
+        # an empty line at the end is skipped
+        f.write("\n")
+
+    columns = ColumnarCache(tmp_path / "cache", chunk_rows=3).load(tmp_path / "data.csv")
+    assert list(columns) == ['x', 'temp1', 'temp_2']
+    for i, column in enumerate(columns.values()):
+        assert isinstance(column, np.memmap) and not column.flags.writeable
+        np.testing.assert_allclose(column, data[:, i])
+
+
+def test_entries_are_shared_by_content(tmp_path):
+    """ A copy of a csv file uses the entry of the original, and a modified file gets a new entry """
+    cache = ColumnarCache(tmp_path / "cache")
+    write_csv(tmp_path / "a.csv", 5)
+    shutil.copy(str(tmp_path / "a.csv"), str(tmp_path / "b.csv"))
+
+    assert cache.column_files(tmp_path / "a.csv") == cache.column_files(tmp_path / "b.csv")
+    write_csv(tmp_path / "b.csv", 6)
+    assert cache.column_files(tmp_path / "a.csv") != cache.column_files(tmp_path / "b.csv")
+    assert len(cache.load(tmp_path / "b.csv")['y']) == 6
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    cache_dir = tmp_path / "cache"
+    for name in "abc":
+        write_csv(tmp_path / ("%s.csv" % name), 100, seed=ord(name))
+
+    cache = ColumnarCache(cache_dir)
+    entries = dict((name, cache_dir / cache.content_hash(tmp_path / ("%s.csv" % name))) for name in "abc")
+    cache.load(tmp_path / "a.csv")
+    cache.load(tmp_path / "b.csv")
+    # b was used after a, then a is used again
+    os.utime(str(entries['a'] / cache.META_FILE), (1000, 1000))
+    os.utime(str(entries['b'] / cache.META_FILE), (2000, 2000))
+    cache.load(tmp_path / "a.csv")
+
+    # there is room for two entries: converting c evicts b, the least recently used one
+    cache.max_bytes = int(2.5 * entry_size(entries['a']))
+    cache.load(tmp_path / "c.csv")
+    assert entries['a'].exists() and entries['c'].exists()
+    assert not entries['b'].exists()
+
+
+def test_entry_larger_than_the_cache_is_kept(tmp_path):
+    """ The entry that was just converted is never evicted, even if it does not fit """
+    write_csv(tmp_path / "a.csv", 100)
+    cache = ColumnarCache(tmp_path / "cache", max_bytes=1)
+    np.testing.assert_allclose(cache.load(tmp_path / "a.csv")['x'], np.loadtxt(str(tmp_path / "a.csv"), delimiter=',',
+                                                                                skiprows=1)[:, 0])
+
+
+def test_memmap_chunks(tmp_path):
+    data = write_csv(tmp_path / "data.csv", 10)
+    files = ColumnarCache(tmp_path / "cache").column_files(tmp_path / "data.csv")
+    chunks = MemmapChunks(files['x'], files['y'], chunk_size=4)
+
+    assert len(chunks) == 10
+    for _ in range(2):
+        # chunks can be iterated several times
+        assert [len(x) for x, _ in chunks] == [4, 4, 2]
+        np.testing.assert_allclose(np.concatenate([y for _, y in chunks]), data[:, 1])
+
+
+def read_index(cache_dir):
+    with (cache_dir / ColumnarCache.INDEX_FILE).open() as f:
+        return json.load(f)
+
+
+def test_index_is_saved_by_batches(tmp_path, monkeypatch):
+    """ The index is read once, saved every `index_batch` new hashes and by `flush_index` """
+    for i in range(5):
+        write_csv(tmp_path / ("%i.csv" % i), 3, seed=i)
+    cache = ColumnarCache(tmp_path / "cache", index_batch=2)
+    writes = []
+    original_write_json = cache._write_json
+
+    def write_json(path, contents):
+        writes.append(path.name)
+        original_write_json(path, contents)
+    monkeypatch.setattr(cache, '_write_json', write_json)
+
+    hashes = [cache.content_hash(tmp_path / ("%i.csv" % i)) for i in range(5)]
+    assert writes == [ColumnarCache.INDEX_FILE] * 2
+    assert len(read_index(tmp_path / "cache")) == 4
+    cache.flush_index()
+    cache.flush_index()
+    assert writes == [ColumnarCache.INDEX_FILE] * 3
+    assert sorted(v['sha1'] for v in read_index(tmp_path / "cache").values()) == sorted(hashes)
+
+    # a new session does not hash the files again, and hashes the modified ones
+    write_csv(tmp_path / "0.csv", 4, seed=10)
+    cache = ColumnarCache(tmp_path / "cache")
+    assert [cache.content_hash(tmp_path / ("%i.csv" % i)) for i in range(1, 5)] == hashes[1:]
+    assert cache.content_hash(tmp_path / "0.csv") != hashes[0]
+    assert not cache._index_updates.keys() - {str((tmp_path / "0.csv").resolve())}
+
+
+def test_index_drops_the_deleted_files(tmp_path):
+    for name in "ab":
+        write_csv(tmp_path / ("%s.csv" % name), 3, seed=ord(name))
+    cache = ColumnarCache(tmp_path / "cache")
+    for name in "ab":
+        cache.content_hash(tmp_path / ("%s.csv" % name))
+    cache.flush_index()
+
+    (tmp_path / "b.csv").unlink()
+    cache = ColumnarCache(tmp_path / "cache")
+    cache.content_hash(tmp_path / "a.csv")
+    cache.flush_index()
+    assert list(read_index(tmp_path / "cache")) == [str((tmp_path / "a.csv").resolve())]
@@ -0,0 +1,57 @@
+import os
+
+from pytest_patterns.data_science_benchmark import dataset_manifest
+from pytest_patterns.data_science_benchmark.dataset_manifest import DatasetManifest
+
+
+def write_csv(path, n_rows, header="x,y"):
+    path.write_text(header + "\n" + "".join("%i,%i\n" % (i, 2 * i) for i in range(n_rows)))
+
+
+def test_entries_and_selection(tmp_path):
+    datasets_dir = tmp_path / "datasets"
+    datasets_dir.mkdir()
+    write_csv(datasets_dir / "small.csv", 3)
+    write_csv(datasets_dir / "large.csv", 30, header="x,temp 1,temp-2")
+    (datasets_dir / "notes.txt").write_text("not a dataset")
+
+    manifest = DatasetManifest(datasets_dir, tmp_path / "cache" / "manifest.json")
+    entries = manifest.entries()
+    assert [os.path.basename(e.path) for e in entries] == ["large.csv", "small.csv"]
+    assert [e.n_rows for e in entries] == [30, 3]
+    assert entries[0].columns == ["x", "temp_1", "temp2"]
+    assert (tmp_path / "cache" / "manifest.json").exists()
+
+    assert [e.n_rows for e in manifest.select(min_rows=10)] == [30]
+    assert [e.n_rows for e in manifest.select(max_rows=10)] == [3]
+    assert [e.n_rows for e in manifest.select(name_pattern="sm*")] == [3]
+
+
+def test_refresh_only_reads_the_changed_files(tmp_path, monkeypatch):
+    datasets_dir = tmp_path / "datasets"
+    datasets_dir.mkdir()
+    for name in ("a", "b", "c"):
+        write_csv(datasets_dir / ("%s.csv" % name), 5)
+    manifest_file = tmp_path / "manifest.json"
+    DatasetManifest(datasets_dir, manifest_file).entries()
+
+    read_files = []
+
+    def read_entry(file_path, st):
+        read_files.append(os.path.basename(file_path))
+        return original_read_entry(file_path, st)
+    original_read_entry = dataset_manifest.read_entry
+    monkeypatch.setattr(dataset_manifest, 'read_entry', read_entry)
+
+    # a new session with nothing changed does not read nor write anything
+    mtime_ns = manifest_file.stat().st_mtime_ns
+    assert len(DatasetManifest(datasets_dir, manifest_file).entries()) == 3
+    assert read_files == [] and manifest_file.stat().st_mtime_ns == mtime_ns
+
+    # a modified file is read again, a deleted one is removed from the manifest
+    write_csv(datasets_dir / "b.csv", 8)
+    (datasets_dir / "c.csv").unlink()
+    entries = DatasetManifest(datasets_dir, manifest_file).entries()
+    assert read_files == ["b.csv"]
+    assert [(os.path.basename(e.path), e.n_rows) for e in entries] == [("a.csv", 5), ("b.csv", 8)]
+    assert len(DatasetManifest(datasets_dir, manifest_file)._read()) == 2
@@ -0,0 +1,81 @@
+import warnings
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from pytest_patterns.data_science_benchmark import datasets_polyfit
+from pytest_patterns.data_science_benchmark.challengers_polyfit import PolyFitChallenger
+from pytest_patterns.data_science_benchmark.datasets_polyfit import ChunkedDataset, Dataset, SyntheticChunks, \
+    synthetic_chunks
+from pytest_patterns.data_science_benchmark.evaluation import evaluate
+
+
+def test_synthetic_sizes_share_the_true_polynomial():
+    """ All the sizes of a (noise, degree) pair share the same true polynomial, and the smaller datasets are the first
+    points of the larger ones """
+    small, large = synthetic_chunks(100, 0.1, 2), synthetic_chunks(1000, 0.1, 2)
+    np.testing.assert_array_equal(small.coefs, large.coefs)
+    (x_small, _), (x_large, _) = next(iter(small)), next(iter(large))
+    np.testing.assert_array_equal(x_small, x_large[:100])
+
+    assert not np.array_equal(synthetic_chunks(100, 0.1, 3).coefs[1:], large.coefs)
+    assert not np.array_equal(synthetic_chunks(100, 1., 2).coefs, large.coefs)
+
+
+def chunked_dataset(n_points, chunk_size):
+    """ A synthetic `ChunkedDataset` of `n_points` points, and the same points as an in-memory `Dataset` """
+    chunks = SyntheticChunks(seed=0, n_points=n_points, true_degree=2, noise=0.1, chunk_size=chunk_size)
+    x, y = (np.concatenate(arrays) for arrays in zip(*chunks))
+    return ChunkedDataset(name="Chunked", n_points=n_points, chunks=chunks), Dataset(name="Chunked", x=x, y=y)
+
+
+def test_synthetic_chunks_are_reiterable():
+    chunks = SyntheticChunks(seed=0, n_points=1050, true_degree=1, noise=0.1, chunk_size=100)
+    first, second = list(chunks), list(chunks)
+    assert [len(x) for x, _ in first] == [100] * 10 + [50]
+    for (x1, y1), (x2, y2) in zip(first, second):
+        np.testing.assert_array_equal(x1, x2)
+        np.testing.assert_array_equal(y1, y2)
+
+
+@pytest.mark.parametrize("solver", ['polyfit', 'qr'])
+def test_partial_fit_matches_fit(solver):
+    """ Training by chunks with `partial_fit` gives the same model as `fit` on all the points """
+    chunked, in_memory = chunked_dataset(1000, chunk_size=128)
+    streamed = PolyFitChallenger(degree=2, solver=solver)
+    for x, y in chunked.chunks:
+        streamed.partial_fit(x, y)
+    fitted = PolyFitChallenger(degree=2, solver=solver)
+    fitted.fit(in_memory.x, in_memory.y)
+
+    np.testing.assert_allclose(streamed.predict(in_memory.x), fitted.predict(in_memory.x), rtol=1e-9)
+
+
+def test_evaluate_streaming_matches_evaluate():
+    """ The metrics accumulated chunk by chunk are the ones of the in-memory evaluation """
+    chunked, in_memory = chunked_dataset(1000, chunk_size=128)
+    metrics = ('cvrmse', 'mae')
+    streamed = evaluate(PolyFitChallenger(degree=2), chunked, metrics=metrics)
+    expected = evaluate(PolyFitChallenger(degree=2), in_memory, metrics=metrics)
+
+    assert streamed['n_points'] == 1000
+    for name in metrics:
+        assert streamed[name] == pytest.approx(expected[name], rel=1e-9)
+
+
+def test_large_multi_output_file_is_streamed_on_its_first_target(monkeypatch):
+    """ Files larger than `large_file_bytes` are streamed on their first target, with a warning if there are others """
+    monkeypatch.setattr(datasets_polyfit, 'large_file_bytes', 0)
+    entries = {Path(entry.path).stem: entry for entry in datasets_polyfit.selected_csv_files}
+
+    with pytest.warns(UserWarning, match="only its column 'temp1' is evaluated"):
+        dataset = datasets_polyfit.data_csvfile(entries['sensors-temperatures'])
+    assert isinstance(dataset, ChunkedDataset)
+    x, y = next(iter(dataset.chunks))
+    columns = datasets_polyfit.datasets_cache.load(entries['sensors-temperatures'].path)
+    np.testing.assert_array_equal(y, columns['temp1'])
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        assert isinstance(datasets_polyfit.data_csvfile(entries['v-shape']), ChunkedDataset)
@@ -0,0 +1,36 @@
+import json
+import os
+
+import numpy as np
+
+from pytest_patterns.data_science_benchmark.environment import THREAD_ENV_VARS, environment_fingerprint, \
+    fingerprint_id, pinned_blas_threads
+
+
+def test_fingerprint_is_json():
+    fingerprint = environment_fingerprint()
+    assert fingerprint['numpy_version'] == np.__version__
+    assert fingerprint['n_cores'] == os.cpu_count()
+    assert json.loads(json.dumps(fingerprint)) == fingerprint
+
+
+def test_id_ignores_the_volatile_entries():
+    """ The hostname and the load average do not change the id, the hardware and software do """
+    fingerprint = environment_fingerprint()
+    env_id = fingerprint_id(fingerprint)
+    assert fingerprint_id(dict(fingerprint)) == env_id
+    assert fingerprint_id(dict(fingerprint, hostname="other", load_average=[9., 9., 9.])) == env_id
+    assert fingerprint_id(dict(fingerprint, numpy_version="0.0")) != env_id
+    assert len(env_id) == 10
+
+
+def test_pinned_blas_threads_restores_the_environment(monkeypatch):
+    monkeypatch.setenv('OMP_NUM_THREADS', '3')
+    monkeypatch.delenv('MKL_NUM_THREADS', raising=False)
+    with pinned_blas_threads(1):
+        assert all(os.environ[var] == '1' for var in THREAD_ENV_VARS)
+    assert os.environ['OMP_NUM_THREADS'] == '3'
+    assert 'MKL_NUM_THREADS' not in os.environ
+
+    with pinned_blas_threads(None):
+        assert os.environ['OMP_NUM_THREADS'] == '3'
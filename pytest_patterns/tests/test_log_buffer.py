@@ -0,0 +1,39 @@
+import logging
+
+from pytest_patterns.data_science_benchmark.log_buffer import JsonLinesLogWriter, RingBufferHandler, \
+    read_node_records
+
+
+def capture(messages, capacity=1000):
+    """ Logs `messages` in a `RingBufferHandler`, and returns its records """
+    logger = logging.getLogger("test_log_buffer")
+    handler = RingBufferHandler(capacity=capacity)
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    try:
+        for message in messages:
+            logger.info(message)
+    finally:
+        logger.removeHandler(handler)
+    return list(handler.records)
+
+
+def test_ring_buffer_keeps_the_last_records():
+    assert [r.getMessage() for r in capture(["a", "b", "c"], capacity=2)] == ["b", "c"]
+
+
+def test_records_are_written_on_close(tmp_path):
+    """ All the records are flushed to the JSON lines file by `close`, and each node reads its own ones """
+    log_file = tmp_path / "logs" / "bench.jsonl"
+    writer = JsonLinesLogWriter(log_file)
+    writer.write("test[a]", capture(["fitting", "predicting"]))
+    writer.write("test[b]", capture(["fitting b"]), readable_file=tmp_path / "failed" / "b.log")
+    writer.write("test[a]", capture(["teardown"]))
+    writer.close()
+
+    assert len(log_file.read_text().splitlines()) == 4
+    assert [r['message'] for r in read_node_records(log_file, "test[a]")] == ["fitting", "predicting", "teardown"]
+    records_b = read_node_records(log_file, "test[b]")
+    assert [(r['node'], r['level'], r['message']) for r in records_b] == [("test[b]", "INFO", "fitting b")]
+    assert "INFO" in (tmp_path / "failed" / "b.log").read_text()
+    assert read_node_records(log_file, "test[c]") == []
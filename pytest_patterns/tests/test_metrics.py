@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from pytest_patterns.data_science_benchmark.metrics import METRICS, ErrorStats, check_metrics, compute_metrics
+
+
+def numpy_metrics(predictions, y):
+    """ The reference value of each metric, computed with numpy """
+    errors = predictions - y
+    rmse = np.sqrt(np.mean(errors ** 2))
+    return dict(rmse=rmse, cvrmse=rmse / np.mean(y), mae=np.mean(np.abs(errors)),
+                r2=1 - np.sum(errors ** 2) / np.sum((y - np.mean(y)) ** 2), max_error=np.max(np.abs(errors)),
+                q50_abs_error=np.quantile(np.abs(errors), 0.5), q90_abs_error=np.quantile(np.abs(errors), 0.9),
+                q99_abs_error=np.quantile(np.abs(errors), 0.99))
+
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(0)
+    # a large offset checks that the variance of y is computed accurately
+    y = 1e6 + rng.normal(size=1000)
+    return y + rng.normal(scale=0.5, size=1000), y
+
+
+@pytest.mark.parametrize("chunk_size", [7, 1000, 2 ** 14])
+def test_single_pass_matches_numpy(data, chunk_size):
+    predictions, y = data
+    metrics = compute_metrics(predictions, y, names=list(METRICS), chunk_size=chunk_size)
+    expected = numpy_metrics(predictions, y)
+
+    assert set(metrics) == set(METRICS)
+    for name, value in metrics.items():
+        assert isinstance(value, float)
+        np.testing.assert_allclose(value, expected[name], rtol=1e-9, err_msg=name)
+
+
+def test_stacked_rows(data):
+    """ Stacked predictions are scored against the same y, or against one row of y each """
+    predictions, y = data
+    stacked = np.stack([predictions, 2 * predictions - y])
+    for ys in (y, np.stack([y, y])):
+        metrics = compute_metrics(stacked, ys, names=list(METRICS))
+        for i, row in enumerate(stacked):
+            for name, value in numpy_metrics(row, y).items():
+                np.testing.assert_allclose(metrics[name][i], value, rtol=1e-9, err_msg=name)
+
+
+def test_update_by_parts(data):
+    """ Accumulating the statistics in several updates (as the streaming protocol does) gives the same metrics """
+    predictions, y = data
+    stats = ErrorStats(keep_abs_errors=True, n_points=len(y), chunk_size=64)
+    for start in range(0, len(y), 300):
+        stats.update(predictions[start:start + 300], y[start:start + 300])
+    for name, value in numpy_metrics(predictions, y).items():
+        np.testing.assert_allclose(stats.metrics([name])[name][0], value, rtol=1e-9, err_msg=name)
+
+
+def test_quantiles_need_the_absolute_errors(data):
+    predictions, y = data
+    stats = ErrorStats()
+    stats.update(predictions, y)
+    with pytest.raises(ValueError):
+        stats.metrics(['q90_abs_error'])
+    with pytest.raises(ValueError):
+        ErrorStats(keep_abs_errors=True)
+
+
+def test_unknown_metric():
+    with pytest.raises(ValueError):
+        check_metrics(['cvrmse', 'mape'])
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from pytest_patterns.data_science_benchmark.challengers_polyfit import BenchmarkChallenger, PolyFitChallenger
+from pytest_patterns.data_science_benchmark.datasets_polyfit import Dataset
+from pytest_patterns.data_science_benchmark.model_cache import FittedModelCache
+
+
+def quadratic_dataset():
+    x = np.linspace(-1, 1, 50)
+    return Dataset(name="Quadratic", x=x, y=x ** 2 - x + 3)
+
+
+class MeanChallenger(BenchmarkChallenger):
+    """ A challenger predicting the mean of y, whose fitted models are not cached """
+    def fit(self, x, y):
+        self.mean = y.mean()
+
+    def predict(self, x):
+        return np.full(len(x), self.mean)
+
+
+@pytest.mark.parametrize("solver", ['polyfit', 'qr'])
+def test_fitted_state_round_trip(solver):
+    """ A model restored from the state of a fitted one makes the same predictions """
+    dataset = quadratic_dataset()
+    fitted = PolyFitChallenger(degree=2, solver=solver)
+    fitted.fit(dataset.x, dataset.y)
+    restored = PolyFitChallenger(degree=2, solver=solver)
+    restored.set_fitted_state(fitted.get_fitted_state())
+
+    assert restored.solver_used == fitted.solver_used
+    np.testing.assert_array_equal(restored.predict(dataset.x), fitted.predict(dataset.x))
+
+
+def test_models_are_restored_from_memory_and_disk(tmp_path):
+    cache = FittedModelCache(tmp_path)
+    dataset = quadratic_dataset()
+    model, cached = cache.fitted(PolyFitChallenger(degree=2, solver='qr'), dataset)
+    assert not cached and (cache.hits, cache.misses) == (0, 1)
+
+    again, cached = cache.fitted(PolyFitChallenger(degree=2, solver='qr'), dataset)
+    assert cached and cache.hits == 1
+    np.testing.assert_array_equal(again.predict(dataset.x), model.predict(dataset.x))
+
+    # a new cache (e.g. of the next run, or of a worker process) only has the disk tier
+    from_disk, cached = FittedModelCache(tmp_path).fitted(PolyFitChallenger(degree=2, solver='qr'), dataset)
+    assert cached
+    assert (from_disk.shift, from_disk.scale, from_disk.solver_used) == (model.shift, model.scale, 'qr')
+    np.testing.assert_array_equal(from_disk.predict(dataset.x), model.predict(dataset.x))
+
+    # other parameters or other data are other models
+    assert not cache.fitted(PolyFitChallenger(degree=1, solver='qr'), dataset)[1]
+    assert not cache.fitted(PolyFitChallenger(degree=2, solver='qr'), Dataset("Other", dataset.x, dataset.y + 1))[1]
+
+
+def test_memory_tier_capacity():
+    cache = FittedModelCache(capacity=2)
+    for key in ("a", "b", "c"):
+        cache.put(key, dict(coefs=np.ones(2)))
+    assert cache.get("a") is None
+    assert cache.get("c") is not None
+
+
+def test_challengers_without_state_are_not_cached(tmp_path):
+    cache = FittedModelCache(tmp_path)
+    for _ in range(2):
+        model, cached = cache.fitted(MeanChallenger(), quadratic_dataset())
+        assert not cached
+    assert model.mean == pytest.approx(quadratic_dataset().y.mean())
+    assert not list(tmp_path.iterdir())
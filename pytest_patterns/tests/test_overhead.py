@@ -0,0 +1,50 @@
+import pandas as pd
+
+from pytest_patterns.data_science_benchmark.overhead import PHASES, OverheadRecorder, append_history, \
+    compare_to_history, load_history, run_overhead_suite
+
+
+def overhead_df(overheads_ms):
+    """ A table as the one of `run_overhead_suite`, with the `overhead_ms` of each number of cases """
+    return pd.DataFrame(dict(n_cases=list(overheads_ms), overhead_ms=list(overheads_ms.values()))).set_index('n_cases')
+
+
+def test_recorder_report():
+    recorder = OverheadRecorder()
+    recorder.add('setup', 0.5, node_id="a")
+    recorder.add('call', 0.25, node_id="a")
+    recorder.add('call', 0.25, node_id="b")
+    recorder.add('collection', 1.)
+
+    report = recorder.report()
+    assert report['n_nodes'] == 2
+    assert (report['setup_s'], report['call_s'], report['collection_s'], report['synthesis_s']) == (0.5, 0.5, 1., 0.)
+    assert report['session_s'] > 0
+
+
+def test_compare_to_the_last_run_of_the_environment(tmp_path):
+    history_file = tmp_path / "history.jsonl"
+    assert load_history(history_file) == []
+    append_history(overhead_df({10: 2., 100: 1.}), "env1", history_file)
+    append_history(overhead_df({10: 1.}), "env1", history_file)
+    append_history(overhead_df({10: 0.1, 100: 0.1}), "env2", history_file)
+    history = load_history(history_file)
+    assert [entry['env_id'] for entry in history] == ["env1", "env1", "env2"]
+
+    report = compare_to_history(overhead_df({10: 1.1, 100: 1.5, 1000: 1.}), history, "env1", max_slowdown=1.2)
+    assert list(report.index) == [10, 100]
+    assert list(report['old_overhead_ms']) == [1., 1.]
+    assert list(report['regression']) == [False, True]
+
+    assert len(compare_to_history(overhead_df({10: 1.}), history, "env3")) == 0
+
+
+def test_run_overhead_suite():
+    """ The suite runs the benchmark with no-op cases in a new pytest process """
+    results_df = run_overhead_suite([3])
+    assert list(results_df.index) == [3]
+    row = results_df.loc[3]
+    # one benchmark node per case
+    assert row['n_nodes'] == 3
+    assert row['overhead_ms'] > 0
+    assert abs(sum(row['%s_ms' % phase] for phase in PHASES) + row['other_ms'] - row['overhead_ms']) < 1e-6
@@ -0,0 +1,60 @@
+import pandas as pd
+import pytest
+
+from pytest_patterns.data_science_benchmark.challengers_polyfit import PolyFitChallenger
+from pytest_patterns.data_science_benchmark.cross_validation import CrossValidation
+from pytest_patterns.data_science_benchmark.datasets_polyfit import data_anscombes_quartet, data_csvfile, \
+    selected_csv_files
+from pytest_patterns.data_science_benchmark.parallel import BenchmarkEngine, shared_memory
+from pytest_patterns.data_science_benchmark.results_table import ResultsTable
+
+
+def bundled_datasets():
+    """ The Anscombe's quartet and the csv files of the datasets/ folder (including a multi-output one) """
+    return [data_anscombes_quartet(id) for id in range(1, 5)] + [data_csvfile(entry) for entry in selected_csv_files]
+
+
+def run_benchmark(engine, datasets):
+    """ Evaluates the polyfit challengers on `datasets` with `engine`, and returns the results table without the
+    durations (that depend on the run) """
+    table = ResultsTable()
+    try:
+        for dataset in datasets:
+            for degree in (1, 2):
+                row = table.append(test_id="%s-%i" % (dataset.name, degree), dataset=dataset.name)
+                engine.submit(PolyFitChallenger(degree=degree), dataset, row)
+    finally:
+        engine.close()
+    return table.to_pandas().drop(columns=['duration_ms'], errors='ignore')
+
+
+@pytest.mark.parametrize("options", [dict(), dict(batch=True), dict(cv=CrossValidation(n_splits=3, n_repeats=2))],
+                         ids=["default", "batch", "cv"])
+def test_parallel_results_match_serial(options):
+    """ A run on 2 worker processes gives the same results table as a serial run, in the same order """
+    datasets = bundled_datasets()
+    assert any(hasattr(dataset, 'targets') for dataset in datasets)
+
+    serial_df = run_benchmark(BenchmarkEngine(workers=1, **options), datasets)
+    parallel_df = run_benchmark(BenchmarkEngine(workers=2, **options), datasets)
+    assert list(serial_df.index) == list(parallel_df.index)
+    assert any('::' in test_id for test_id in serial_df.index)
+    pd.testing.assert_frame_equal(serial_df, parallel_df, check_like=True)
+
+
+@pytest.mark.skipif(shared_memory is None, reason="shared memory requires python 3.8")
+def test_shared_memory_is_released():
+    """ Datasets are copied once in shared memory, and the blocks are released by `close` """
+    engine = BenchmarkEngine(workers=2)
+    dataset = data_anscombes_quartet(1)
+    table = ResultsTable()
+    for degree in (1, 2):
+        engine.submit(PolyFitChallenger(degree=degree), dataset, table.append(test_id=str(degree)))
+    block_names = [shm.name for shm in engine._shared_blocks]
+    assert len(block_names) == 2
+
+    engine.close()
+    assert table.to_pandas()['cvrmse'].notna().all()
+    for name in block_names:
+        with pytest.raises(FileNotFoundError):
+            shared_memory.SharedMemory(name=name)
@@ -0,0 +1,37 @@
+import tracemalloc
+
+import numpy as np
+
+from pytest_patterns.data_science_benchmark.profiling import PhaseProfiler
+
+
+def test_phase_measures_the_peak_memory(tmp_path):
+    """ Each phase measures its own peak of python/numpy allocations and dumps its cProfile """
+    profiler = PhaseProfiler(cprofile_prefix=str(tmp_path / "pair"))
+    results = dict()
+    with profiler.phase('fit', results):
+        block = np.ones(10 * 1024 ** 2 // 8)
+        del block
+    with profiler.phase('predict', results):
+        np.ones(10)
+
+    assert results['fit_peak_mem_kb'] >= 10 * 1024
+    assert results['predict_peak_mem_kb'] < 1024
+    assert set(results) >= {'fit_peak_rss_kb', 'predict_peak_rss_kb'}
+    assert (tmp_path / "pair.fit.prof").exists() and (tmp_path / "pair.predict.prof").exists()
+    assert not tracemalloc.is_tracing()
+
+
+def test_phase_keeps_an_existing_trace():
+    """ When tracemalloc was already tracing, its peak is reset before the phase and it keeps tracing after it """
+    tracemalloc.start()
+    try:
+        big = np.ones(10 * 1024 ** 2 // 8)
+        del big
+        results = dict()
+        with PhaseProfiler().phase('fit', results):
+            np.ones(10)
+        assert results['fit_peak_mem_kb'] < 10 * 1024
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from pytest_patterns.data_science_benchmark.racing import ChallengerRace, sign_test_greater_p
+from pytest_patterns.data_science_benchmark.timing import TimingHarness
+
+
+def test_sign_test():
+    assert sign_test_greater_p(5, 0) == 1 / 32.
+    assert sign_test_greater_p(4, 1) == 6 / 32.
+    assert sign_test_greater_p(0, 0) == 1.
+
+
+def test_sign_test_scipy():
+    stats = pytest.importorskip("scipy.stats")
+    for n_greater, n_smaller in [(7, 3), (12, 1), (2, 9)]:
+        expected = stats.binomtest(n_greater, n_greater + n_smaller, alternative='greater').pvalue
+        assert sign_test_greater_p(n_greater, n_smaller) == pytest.approx(expected)
+
+
+def run_race(race, cvrmse_by_challenger, n_rounds):
+    for d in range(n_rounds):
+        for challenger, cvrmse in cvrmse_by_challenger.items():
+            if not race.is_pruned(challenger):
+                race.record(challenger, 'd%i' % d, cvrmse(d))
+
+
+def test_worse_challenger_is_pruned():
+    """ The challenger worse on every round is pruned once the sign test is significant (6 rounds at 5% with the Holm
+    correction of 2 comparisons), the one that is sometimes better is not """
+    race = ChallengerRace(alpha=0.05, min_rounds=3)
+    run_race(race, dict(good=lambda d: 0.1, bad=lambda d: 0.5, mixed=lambda d: 0.05 if d % 2 else 0.3), 10)
+
+    assert race.alive == ['good', 'mixed']
+    assert "after 6 rounds" in race.is_pruned('bad') and "worse than good" in race.is_pruned('bad')
+
+
+def test_absolute_cvrmse_is_ranked():
+    """ The cv-rmse is negative when the mean of the target is: the largest absolute value is the worst """
+    race = ChallengerRace(min_rounds=3)
+    run_race(race, dict(good=lambda d: -0.1, bad=lambda d: -0.5), 10)
+    assert race.alive == ['good']
+
+
+def test_failures_are_the_worst():
+    race = ChallengerRace(min_rounds=3)
+    run_race(race, dict(good=lambda d: 0.5, failing=lambda d: np.nan), 10)
+    assert race.alive == ['good']
+
+
+def test_no_pruning_before_min_rounds():
+    race = ChallengerRace(min_rounds=20)
+    run_race(race, dict(good=lambda d: 0.1, bad=lambda d: 0.5), 10)
+    assert race.alive == ['good', 'bad'] and race.budget_factor() == 1.
+
+
+def test_budget_of_the_pruned_challengers():
+    race = ChallengerRace(min_rounds=3)
+    run_race(race, dict(a=lambda d: 0.1, b=lambda d: 0.5, c=lambda d: 0.5, d=lambda d: 0.11 if d % 2 else 0.09), 10)
+
+    assert race.alive == ['a', 'd'] and race.budget_factor() == 2.
+    timer = TimingHarness(max_time_s=0.5)
+    assert race.scaled_timer(timer).max_time_s == 1. and timer.max_time_s == 0.5
+    assert race.scaled_timer(None) is None
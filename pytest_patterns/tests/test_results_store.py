@@ -0,0 +1,52 @@
+import numpy as np
+
+from pytest_patterns.data_science_benchmark.challengers_polyfit import PolyFitChallenger
+from pytest_patterns.data_science_benchmark.datasets_polyfit import Dataset
+from pytest_patterns.data_science_benchmark.parallel import BenchmarkEngine
+from pytest_patterns.data_science_benchmark.results_store import ResultsStore
+from pytest_patterns.data_science_benchmark.results_table import ResultsTable
+
+
+def line_dataset(slope=2.):
+    x = np.linspace(0, 1, 20)
+    return Dataset(name="Line", x=x, y=slope * x + 1)
+
+
+def test_key_depends_on_the_content(tmp_path):
+    """ The key only changes when the challenger, the dataset content or the salt change """
+    store = ResultsStore(tmp_path)
+    key = store.key(PolyFitChallenger(degree=1), line_dataset())
+
+    # a new store and new objects with the same content share the key
+    assert ResultsStore(tmp_path).key(PolyFitChallenger(degree=1), line_dataset()) == key
+    assert store.key(PolyFitChallenger(degree=2), line_dataset()) != key
+    assert store.key(PolyFitChallenger(degree=1), line_dataset(slope=3.)) != key
+    assert ResultsStore(tmp_path, salt="timing=True").key(PolyFitChallenger(degree=1), line_dataset()) != key
+
+
+def test_put_get(tmp_path):
+    store = ResultsStore(tmp_path / "store")
+    assert store.get("missing") is None
+    store.put("abc", dict(cvrmse=0.5))
+    assert store.get("abc") == dict(cvrmse=0.5)
+    assert [p.name for p in (tmp_path / "store").iterdir()] == ["abc.pkl"]
+
+
+def run(store, dataset):
+    """ Evaluates a degree 1 polyfit on `dataset`, and returns its results row """
+    table = ResultsTable()
+    BenchmarkEngine(store=store).submit(PolyFitChallenger(degree=1), dataset, table.append(test_id="pair"))
+    return table.to_pandas().loc['pair']
+
+
+def test_engine_reloads_the_unchanged_pairs(tmp_path):
+    """ A second run reloads the results of an unchanged pair, and evaluates it again when the dataset changes """
+    first = run(ResultsStore(tmp_path), line_dataset())
+    assert not first['cached']
+
+    second = run(ResultsStore(tmp_path), line_dataset())
+    assert second['cached']
+    assert second['cvrmse'] == first['cvrmse']
+
+    changed = run(ResultsStore(tmp_path), line_dataset(slope=3.))
+    assert not changed['cached']
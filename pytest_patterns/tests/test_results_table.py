@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+
+from pytest_patterns.data_science_benchmark.results_table import ResultsTable
+
+
+def test_columns_are_typed_and_grown():
+    table = ResultsTable(capacity=2)
+    for i in range(5):
+        table.append(test_id='t%i' % i, n_points=10 * i, cvrmse=0.1 * i, passed=i % 2 == 0, status='passed')
+
+    df = table.to_pandas()
+    assert len(table) == 5 and list(df.index) == ['t%i' % i for i in range(5)]
+    assert df['n_points'].dtype == np.int64 and df['cvrmse'].dtype == np.float64 and df['passed'].dtype == bool
+    assert df['status'].dtype == 'category'
+    np.testing.assert_allclose(df['cvrmse'], [0., 0.1, 0.2, 0.3, 0.4])
+
+
+def test_missing_values_and_measured_nan():
+    """ A measured NaN is a value: `update_missing` keeps it, and it is not <NA> in the DataFrame """
+    table = ResultsTable()
+    measured = table.append(test_id='measured', cvrmse=float('nan'))
+    missing = table.append(test_id='missing', n_points=3)
+    measured.update_missing(cvrmse=1., n_points=5)
+    missing.update_missing(cvrmse=2.)
+    missing.update_missing(cvrmse=3.)
+
+    assert np.isnan(measured.get('cvrmse')) and measured.get('n_points') == 5
+    assert missing.get('cvrmse') == 2.
+    df = table.to_pandas()
+    assert np.isnan(df.loc['measured', 'cvrmse']) and df.loc['missing', 'cvrmse'] == 2.
+
+    table.append(test_id='not measured', status='failed')
+    df = table.to_pandas()
+    assert str(df['cvrmse'].dtype) == 'Float64' and df.loc['not measured', 'cvrmse'] is pd.NA
+    assert np.isnan(df.loc['measured', 'cvrmse'])
+    assert df.loc['not measured', 'n_points'] is pd.NA and str(df['n_points'].dtype) == 'Int64'
+    assert table.get(2, 'cvrmse') is None
+
+
+def test_column_promotion():
+    """ An integer column receiving a float becomes a float column, a typed column receiving another type becomes an
+    object column, and the values already set are kept """
+    table = ResultsTable()
+    table.append(test_id='a', n=1, flag=True, name='x')
+    table.append(test_id='b', n=2.5, flag=1, name=3)
+    table.append(test_id='c')
+
+    df = table.to_pandas()
+    assert str(df['n'].dtype) == 'Float64' and list(df['n'][:2]) == [1., 2.5]
+    assert df['flag'].dtype == object and list(df['flag']) == [True, 1, None]
+    assert df['name'].dtype == object and list(df['name']) == ['x', 3, None]
+
+
+def test_split_rows():
+    """ The rows of the other targets of a multi-output dataset start with a copy of the values of the first one """
+    table = ResultsTable()
+    row = table.append(test_id='t', dataset='d', n_points=10)
+    rows = row.split(3)
+
+    assert rows[0] is row and len(table) == 3
+    assert row.split(3) == rows
+    for i, r in enumerate(rows):
+        r.update(test_id='t::y%i' % i, cvrmse=0.1 * i)
+    df = table.to_pandas()
+    assert list(df.index) == ['t::y0', 't::y1', 't::y2']
+    assert list(df['dataset']) == ['d'] * 3 and list(df['n_points']) == [10] * 3
+
+
+def test_models_are_not_kept(tmp_path):
+    """ A fitted model is stored as its string representation, and pickled if `models_dir` is provided """
+    table = ResultsTable(models_dir=tmp_path)
+    row = table.append(test_id='t', model=np.poly1d([1., 2.]))
+
+    assert row.get('challenger') == str(np.poly1d([1., 2.]))
+    assert (tmp_path / '0.pkl').exists() and row.get('model_file') == str(tmp_path / '0.pkl')
+    assert 'model' not in table.to_pandas().columns
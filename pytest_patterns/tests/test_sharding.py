@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pytest_patterns.data_science_benchmark.sharding import merge_shards, parse_shard, partition, save_shard
+
+
+def test_partition_is_deterministic_and_complete():
+    """ The partition does not depend on the order of the test ids, and each test id is in exactly one shard """
+    rng = np.random.default_rng(0)
+    test_ids = ['test_%i' % i for i in range(100)]
+    durations = {t: float(d) for t, d in zip(test_ids[:80], rng.exponential(100, 80))}
+
+    shards = partition(test_ids, durations, 4)
+    assert shards == partition(list(reversed(test_ids)), dict(durations), 4)
+    assert sorted(sum(shards, [])) == sorted(test_ids)
+
+
+def test_partition_is_balanced():
+    """ Shards are balanced by duration, not by number of tests: the greedy assignment is within the longest test of
+    the ideal balance """
+    rng = np.random.default_rng(1)
+    test_ids = ['test_%i' % i for i in range(200)]
+    durations = dict(zip(test_ids, rng.lognormal(3, 1.5, 200)))
+
+    totals = [sum(durations[t] for t in shard) for shard in partition(test_ids, durations, 5)]
+    assert max(totals) - min(totals) <= max(durations.values())
+    assert max(totals) <= sum(durations.values()) / 5 + max(durations.values())
+
+
+def test_partition_unknown_durations():
+    """ Unknown durations are estimated with the median of the known ones, or all equal if none is known """
+    shards = partition(['a', 'b', 'c', 'd'], dict(a=10., b=1., c=1.), 2)
+    assert sorted(map(sorted, shards)) == [['a'], ['b', 'c', 'd']]
+
+    shards = partition(['test_%i' % i for i in range(10)], dict(), 3)
+    assert sorted(len(shard) for shard in shards) == [3, 3, 4]
+
+
+def test_merge_follows_the_collection_order(tmp_path):
+    """ The merged table has the rows of a run without sharding, in the same order """
+    collected_ids = ['a', 'b', 'c', 'd', 'e']
+    durations = dict(a=5., b=1., c=1., d=4., e=2.)
+    full_df = pd.DataFrame(dict(cvrmse=np.arange(6.)), index=['a', 'b', 'b::y2', 'c', 'd', 'e'])
+
+    shard_files = []
+    for shard, test_ids in enumerate(partition(collected_ids, durations, 2)):
+        shard_df = full_df[[t.split('::')[0] in test_ids for t in full_df.index]]
+        shard_files.append(tmp_path / ("shard-%i.pkl" % shard))
+        save_shard(shard_files[-1], shard, 2, test_ids, dict(), shard_df, collected_ids=collected_ids)
+
+    pd.testing.assert_frame_equal(merge_shards(reversed(shard_files)), full_df)
+
+
+def test_merge_checks_the_shards(tmp_path):
+    save_shard(tmp_path / "shard-0.pkl", 0, 2, ['a'], dict(), pd.DataFrame(index=['a']))
+    with pytest.raises(ValueError):
+        merge_shards([tmp_path / "shard-0.pkl", tmp_path / "shard-0.pkl"])
+    with pytest.warns(UserWarning, match="Missing shard"):
+        merge_shards([tmp_path / "shard-0.pkl"])
+
+
+@pytest.mark.parametrize("shard, expected", [("1/1", (0, 1)), ("3/4", (2, 4))])
+def test_parse_shard(shard, expected):
+    assert parse_shard(shard) == expected
+
+
+@pytest.mark.parametrize("shard", ["0/2", "3/2", "1", "a/b"])
+def test_parse_invalid_shard(shard):
+    with pytest.raises(ValueError):
+        parse_shard(shard)
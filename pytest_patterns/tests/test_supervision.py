@@ -0,0 +1,88 @@
+from time import sleep
+
+import numpy as np
+import pytest
+
+from pytest_patterns.data_science_benchmark.challengers_polyfit import PolyFitChallenger
+from pytest_patterns.data_science_benchmark.datasets_polyfit import Dataset
+from pytest_patterns.data_science_benchmark.parallel import BenchmarkEngine
+from pytest_patterns.data_science_benchmark.results_table import ResultsTable
+from pytest_patterns.data_science_benchmark.supervision import BudgetExceeded, ResourceLimits, rss_bytes, \
+    run_supervised
+
+
+def add(a, b):
+    return a + b
+
+
+def sleep_then_add(a, b):
+    sleep(30)
+    return a + b
+
+
+def allocate_mb(size_mb):
+    """ Allocates and touches `size_mb` MB, then holds them for a while (so that the RSS watchdog can see them) """
+    block = np.ones(size_mb * 1024 ** 2 // 8)
+    sleep(1)
+    return block.sum()
+
+
+def fail(message):
+    raise ValueError(message)
+
+
+class SlowPolyFitChallenger(PolyFitChallenger):
+    """ A challenger that does not complete its `fit` in a reasonable time """
+    def fit(self, x, y):
+        sleep(30)
+        super(SlowPolyFitChallenger, self).fit(x, y)
+
+    def __str__(self):
+        return "SlowPolyFit(degree=%i)" % self.degree
+
+
+def test_run_supervised_returns_the_result():
+    assert run_supervised(add, (1, 2), ResourceLimits(timeout_s=60, max_memory_mb=500)) == 3
+
+
+def test_run_supervised_raises_the_errors_again():
+    with pytest.raises(ValueError, match="boom"):
+        run_supervised(fail, ("boom",), ResourceLimits(timeout_s=60))
+
+
+def test_run_supervised_timeout():
+    with pytest.raises(BudgetExceeded) as exc_info:
+        run_supervised(sleep_then_add, (1, 2), ResourceLimits(timeout_s=0.5))
+    assert exc_info.value.status == 'timeout'
+
+
+@pytest.mark.skipif(rss_bytes() is None, reason="the memory budget is only precise on linux")
+def test_run_supervised_oom():
+    with pytest.raises(BudgetExceeded) as exc_info:
+        run_supervised(allocate_mb, (200,), ResourceLimits(timeout_s=60, max_memory_mb=50))
+    assert exc_info.value.status == 'oom'
+
+    # a larger budget is not exceeded
+    assert run_supervised(allocate_mb, (20,), ResourceLimits(timeout_s=60, max_memory_mb=200)) > 0
+
+
+@pytest.mark.parametrize("early_abort", [True, False], ids=["early_abort", "no_early_abort"])
+def test_engine_aborts_the_larger_datasets(early_abort):
+    """ Once a challenger timed out on a dataset, its pairs on the datasets at least as large are 'aborted' """
+    engine = BenchmarkEngine(limits=ResourceLimits(timeout_s=0.5, early_abort=early_abort))
+    table = ResultsTable()
+    for n in (20, 50, 10):
+        x = np.linspace(0, 1, n)
+        engine.submit(SlowPolyFitChallenger(degree=1), Dataset(name="Line-%i" % n, x=x, y=2 * x),
+                      table.append(test_id="slow-%i" % n))
+        engine.submit(PolyFitChallenger(degree=1), Dataset(name="Line-%i" % n, x=x, y=2 * x),
+                      table.append(test_id="fast-%i" % n))
+    engine.close()
+
+    df = table.to_pandas()
+    expected = ['timeout', 'aborted' if early_abort else 'timeout', 'timeout']
+    assert list(df.loc[['slow-20', 'slow-50', 'slow-10'], 'status']) == expected
+    assert df.loc[['fast-20', 'fast-50', 'fast-10'], 'cvrmse'].notna().all()
+    if early_abort:
+        assert df.loc['slow-50', 'duration_ms'] == 0
+        assert "20 points" in df.loc['slow-50', 'error']
@@ -0,0 +1,52 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pytest_patterns.data_science_benchmark.synthesis import BackgroundWriter, pyarrow, scaling_exponents
+
+
+def test_writes_are_complete_on_close(tmp_path):
+    df = pd.DataFrame(dict(challenger=["a", "b"], cvrmse=[0.5, 0.25]), index=pd.Index(["t1", "t2"], name="test_id"))
+    writer = BackgroundWriter()
+    writer.write_table(df, tmp_path / "results")
+    writer.write_json(dict(env_id="abc"), tmp_path / "env.json")
+    writer.close()
+
+    written = pd.read_csv(str(tmp_path / "results.csv"), sep=';', decimal=',', index_col=0)
+    pd.testing.assert_frame_equal(written, df)
+    with (tmp_path / "env.json").open() as f:
+        assert json.load(f) == dict(env_id="abc")
+    if pyarrow is not None:
+        pd.testing.assert_frame_equal(pd.read_parquet(str(tmp_path / "results.parquet")), df)
+
+
+def test_plots(tmp_path):
+    pytest.importorskip("matplotlib")
+    df = pd.DataFrame(dict(a=[1., 10.], b=[2., 40.]), index=[100, 1000])
+    writer = BackgroundWriter()
+    writer.save_bar_plot(df, tmp_path / "bars.png", ylabel="cv-rmse")
+    writer.save_loglog_plot(df, tmp_path / "scaling.png", xlabel="n_points", ylabel="ms")
+    writer.close()
+    assert (tmp_path / "bars.png").stat().st_size > 0 and (tmp_path / "scaling.png").stat().st_size > 0
+
+
+def test_close_raises_the_first_error(tmp_path):
+    writer = BackgroundWriter()
+    writer.write_json(dict(a=1), tmp_path / "missing_dir" / "a.json")
+    writer.write_json(dict(b=1), tmp_path / "b.json")
+    with pytest.raises(IOError):
+        writer.close()
+    # the other writes are complete
+    assert (tmp_path / "b.json").exists()
+
+
+def test_scaling_exponents():
+    sizes = np.array([100, 1000, 10000] * 2)
+    df = pd.DataFrame(dict(challenger=["linear"] * 3 + ["quadratic"] * 3, n_points=sizes,
+                           time_ms=np.r_[sizes[:3] * 1e-3, sizes[3:] ** 2 * 1e-6]))
+    exponents = scaling_exponents(df, ['time_ms'])
+    # one row per challenger, in order
+    assert list(exponents['time_ms_exponent']) == pytest.approx([1., 2.])
+    assert list(exponents['n_sizes']) == [3, 3]
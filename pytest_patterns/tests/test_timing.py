@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from pytest_patterns.data_science_benchmark.timing import TimingHarness
+
+
+class CountingFunc(object):
+    """ A function counting its calls, and returning their number """
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.calls
+
+
+def test_median_ci_of_constant_samples():
+    assert TimingHarness._median_rel_ci([2.] * 20) == 0.
+
+
+def test_median_ci_narrows_with_more_samples():
+    """ The distribution-free confidence interval of the median uses order statistics: with the same spread, more
+    samples give a narrower interval """
+    rng = np.random.default_rng(0)
+    few = rng.uniform(1, 2, size=10)
+    many = rng.uniform(1, 2, size=1000)
+    # with 10 samples, the interval goes from the 2nd to the 10th one
+    s = np.sort(few)
+    assert TimingHarness._median_rel_ci(few) == pytest.approx((s[9] - s[1]) / s[5])
+    assert TimingHarness._median_rel_ci(many) < 0.1 * TimingHarness._median_rel_ci(few)
+
+
+def test_stops_at_min_rounds_when_the_ci_is_reached():
+    func = CountingFunc()
+    stats, res = TimingHarness(warmup_rounds=2, min_rounds=7, target_rel_ci=np.inf, min_round_ms=0).measure(func)
+    assert stats.rounds == 7 == len(stats.samples_ms)
+    # 2 warmup calls, 1 calibration call, then 1 call per round
+    assert res == func.calls == 2 + 1 + 7
+
+
+def test_stops_at_max_rounds_or_max_time():
+    timer = TimingHarness(warmup_rounds=0, min_rounds=3, max_rounds=50, target_rel_ci=0., max_time_s=60,
+                          min_round_ms=0)
+    assert timer.measure(CountingFunc())[0].rounds == 50
+
+    timer = TimingHarness(warmup_rounds=0, min_rounds=3, max_rounds=10 ** 9, target_rel_ci=0., max_time_s=0.,
+                          min_round_ms=0)
+    assert timer.measure(CountingFunc())[0].rounds == 3
+
+
+def test_calibration_and_stats():
+    """ Rounds of fast functions call them several times, and the durations are the ones of a single call """
+    func = CountingFunc()
+    timer = TimingHarness(warmup_rounds=0, min_rounds=5, max_rounds=5, min_round_ms=1.)
+    number = timer._calibrate(func)
+    assert number > 1 and number % 10 == 0
+
+    stats, _ = timer.measure(func)
+    assert stats.rounds == 5
+    assert stats.min_ms <= stats.median_ms <= stats.samples_ms.max()
+    assert stats.median_ms < 1.
+    assert stats.iqr_ms >= 0